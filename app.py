@@ -1,9 +1,15 @@
 from flask import Flask
+import atexit
 import logging
 from config import Config
 from routes.token_routes import token_bp
 from routes.location_routes import location_bp
+from routes.metrics_routes import metrics_bp
 from database import db
+from services.ingest_queue import ingest_queue
+from services.token_pruner import token_compactor
+from utils.metrics import install_request_metrics
+from utils.logging_config import setup_logging
 
 def create_app():
     app = Flask(__name__)
@@ -11,23 +17,27 @@ def create_app():
     
     app.config['DEBUG'] = config.FLASK_DEBUG
     
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s [%(levelname)s] %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler('app.log', encoding='utf-8')
-        ]
-    )
+    setup_logging(config)
     
     app.register_blueprint(token_bp)
     app.register_blueprint(location_bp)
     
+    if config.METRICS_ENABLED:
+        install_request_metrics(app, config.SLOW_REQUEST_THRESHOLD_MS)
+        app.register_blueprint(metrics_bp)
+    
     @app.teardown_appcontext
     def close_db(error):
         if error:
             db.rollback()
-        db.disconnect()
+        db.release()
+    
+    atexit.register(db.close_all)
+    # atexitは登録の逆順に実行されるため、キューのドレインが接続プールの終了より先に行われる
+    atexit.register(ingest_queue.stop)
+    
+    token_compactor.start()
+    atexit.register(token_compactor.stop)
     
     @app.route('/', methods=['GET'])
     def root():
@@ -36,9 +46,16 @@ def create_app():
             "status": "running",
             "endpoints": {
                 "register_token": "POST /api/register-token",
+                "register_tokens": "POST /api/register-tokens",
                 "health_check": "GET /api/health",
                 "upload_points": "POST /points",
-                "get_points": "GET /points"
+                "get_points": "GET /points",
+                "ingest_status": "GET /points/ingest/<ingest_id>",
+                "export_points": "GET /points/export",
+                "search_points": "GET /points/search",
+                "latest_points": "GET /points/latest",
+                "points_summary": "GET /points/summary",
+                "metrics": "GET /metrics"
             }
         }
     
@@ -49,7 +66,7 @@ if __name__ == '__main__':
     config = Config()
     
     logging.info("Push Notification Token Registration API を起動しています...")
-    logging.info(f"デバッグモード: {config.FLASK_DEBUG}")
+    logging.info("デバッグモード: %s", config.FLASK_DEBUG)
     
     app.run(
         host='0.0.0.0',
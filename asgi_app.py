@@ -0,0 +1,23 @@
+import contextlib
+import logging
+from starlette.applications import Starlette
+from config import Config
+from async_database import async_db
+from routes.asgi_routes import routes
+from utils.logging_config import setup_logging
+
+def create_asgi_app():
+    """ASGIモードのアプリケーションを作成する（asyncpgのコネクションプールを使用）"""
+    config = Config()
+    setup_logging(config)
+    
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        await async_db.connect()
+        logging.info("ASGIモードで起動しました")
+        try:
+            yield
+        finally:
+            await async_db.close()
+    
+    return Starlette(debug=config.FLASK_DEBUG, routes=routes, lifespan=lifespan)
@@ -0,0 +1,72 @@
+import asyncio
+import itertools
+import logging
+import re
+from config import Config
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+def asyncpg_query(query):
+    """psycopg2形式（%s）のクエリをasyncpg形式（$1, $2, ...）に変換する
+
+    クエリはモデルごとに1か所で定義し、ASGIモードではこの関数で変換して使う。
+    """
+    numbers = itertools.count(1)
+    return _PLACEHOLDER.sub(lambda match: "%" if match.group() == "%%" else f"${next(numbers)}", query)
+
+class AsyncDatabase:
+    """ASGIモード用のasyncpgコネクションプール"""
+
+    def __init__(self):
+        self.config = Config()
+        self.pool = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        import asyncpg
+
+        async with self._lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    host=self.config.DATABASE_HOST,
+                    port=self.config.DATABASE_PORT,
+                    database=self.config.DATABASE_NAME,
+                    user=self.config.DATABASE_USER,
+                    password=self.config.DATABASE_PASSWORD,
+                    min_size=self.config.DB_POOL_MIN_SIZE,
+                    max_size=self.config.DB_POOL_MAX_SIZE,
+                    command_timeout=self.config.ASYNC_DB_COMMAND_TIMEOUT
+                )
+                logging.info(
+                    "asyncpgコネクションプールを作成しました: min=%s, max=%s",
+                    self.config.DB_POOL_MIN_SIZE, self.config.DB_POOL_MAX_SIZE
+                )
+        return self.pool
+
+    def acquire(self):
+        """プールから接続を取得する（async withで使用し、タイムアウトはDB_POOL_CHECKOUT_TIMEOUT）"""
+        if self.pool is None:
+            raise Exception("データベース接続に失敗しました")
+        return self.pool.acquire(timeout=self.config.DB_POOL_CHECKOUT_TIMEOUT)
+
+    async def close(self):
+        async with self._lock:
+            if self.pool is not None:
+                await self.pool.close()
+                self.pool = None
+                logging.info("asyncpgコネクションプールを閉じました")
+
+    def get_pool_stats(self):
+        if self.pool is None:
+            return {"min_size": self.config.DB_POOL_MIN_SIZE, "max_size": self.config.DB_POOL_MAX_SIZE, "size": 0}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "available": self.pool.get_max_size() - (size - idle)
+        }
+
+async_db = AsyncDatabase()
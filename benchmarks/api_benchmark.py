@@ -0,0 +1,387 @@
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# 計測の基準となる時刻（シードデータはこの時刻までの30日間、追加アップロードはこの時刻以降）
+BASE_TIME = datetime(2025, 1, 31, tzinfo=timezone.utc)
+SEED_DAYS = 30
+SEED_BATCH_SIZE = 1000
+
+RANGE_WINDOWS = {
+    "range_1h": timedelta(hours=1),
+    "range_1d": timedelta(days=1),
+    "range_30d": timedelta(days=30)
+}
+INGEST_SIZES = {"ingest_1": 1, "ingest_100": 100, "ingest_1000": 1000}
+
+# BASE_TIMEは過去の時刻のため、範囲取得の期間はすべて終了済みとしてレスポンスキャッシュの対象になる
+# range_*はリクエストごとに異なるパラメータを付けてキャッシュを使わずにクエリの処理時間を測り、
+# range_*_cachedは同じURLを繰り返してキャッシュから返す場合の処理時間を測る
+CACHED_RANGE_WINDOWS = {f"{name}_cached": window for name, window in RANGE_WINDOWS.items()}
+
+SCENARIOS = (
+    list(INGEST_SIZES) + list(RANGE_WINDOWS) + list(CACHED_RANGE_WINDOWS)
+    + ["register_token", "jwt_verify", "jwt_verify_cached"]
+)
+
+# HTTPを経由しない（アプリ内で直接測定する）シナリオ
+IN_PROCESS_ONLY = {"jwt_verify", "jwt_verify_cached"}
+
+def _isoformat(value):
+    return value.isoformat().replace("+00:00", "Z")
+
+def _make_points(start, count, step_seconds, rng):
+    latitudes = 35.6 + np.cumsum(rng.normal(0, 0.0001, count))
+    longitudes = 139.7 + np.cumsum(rng.normal(0, 0.0001, count))
+    return [
+        {
+            "latitude": round(float(latitude), 7),
+            "longitude": round(float(longitude), 7),
+            "timestamp": _isoformat(start + timedelta(seconds=i * step_seconds))
+        }
+        for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes))
+    ]
+
+class InProcessClient:
+    """Flaskのテストクライアントでアプリを直接呼び出す"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers, json_body=None):
+        response = self.client.open(path, method=method, headers=headers, json=json_body)
+        return response.status_code
+
+    def close(self):
+        pass
+
+class HttpClient:
+    """起動中のサーバーにHTTPでリクエストする"""
+
+    def __init__(self, base_url, timeout):
+        import httpx
+
+        self.client = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def request(self, method, path, headers, json_body=None):
+        response = self.client.request(method, path, headers=headers, json=json_body)
+        return response.status_code
+
+    def close(self):
+        self.client.close()
+
+class BenchmarkRunner:
+    def __init__(self, client_factory, user_id, token, iterations, warmup, concurrency, seed_interval):
+        self.client_factory = client_factory
+        self.user_id = user_id
+        self.token = token
+        self.iterations = iterations
+        self.warmup = warmup
+        self.concurrency = concurrency
+        self.seed_interval = seed_interval
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self._ingest_offset = itertools.count()
+        self._ingest_lock = threading.Lock()
+        self._rng = np.random.default_rng(42)
+
+    def seed(self):
+        """範囲取得用に、BASE_TIMEまでの30日分の位置情報をseed_interval秒間隔で登録する"""
+        client = self.client_factory()
+        total = int(SEED_DAYS * 86400 / self.seed_interval)
+        start = BASE_TIME - timedelta(days=SEED_DAYS)
+        try:
+            for offset in range(0, total, SEED_BATCH_SIZE):
+                count = min(SEED_BATCH_SIZE, total - offset)
+                points = _make_points(
+                    start + timedelta(seconds=offset * self.seed_interval), count, self.seed_interval, self._rng
+                )
+                status = client.request("POST", "/points", self.headers, {"points": points})
+                if status not in (201, 202):
+                    raise RuntimeError(f"シードデータの登録に失敗しました: status={status}")
+        finally:
+            client.close()
+        return total
+
+    def _next_ingest_start(self):
+        # アップロードごとに重複しない時刻のポイントを作る
+        with self._ingest_lock:
+            offset = next(self._ingest_offset)
+            rng = np.random.default_rng(offset)
+        return BASE_TIME + timedelta(seconds=offset * 1000), rng
+
+    def _scenario(self, name):
+        """シナリオ名から (準備関数, 実行関数, 成功とみなすステータス) を返す
+
+        準備関数の処理時間は計測に含めない。
+        """
+        if name in INGEST_SIZES:
+            count = INGEST_SIZES[name]
+
+            def prepare(i):
+                start, rng = self._next_ingest_start()
+                return {"points": _make_points(start, count, 1, rng)}
+
+            return prepare, lambda client, body: client.request("POST", "/points", self.headers, body), (201, 202)
+
+        if name in RANGE_WINDOWS or name in CACHED_RANGE_WINDOWS:
+            window = RANGE_WINDOWS.get(name) or CACHED_RANGE_WINDOWS[name]
+            path = (
+                f"/points?start_time={_isoformat(BASE_TIME - window)}&end_time={_isoformat(BASE_TIME)}"
+            )
+            if name in CACHED_RANGE_WINDOWS:
+                prepare = lambda i: path
+            else:
+                # パラメータはレスポンスキャッシュのキーに含まれるため、毎回キャッシュに当たらない
+                run_id = uuid.uuid4().hex[:8]
+                prepare = lambda i: f"{path}&bench={run_id}-{i}"
+            return prepare, lambda client, query: client.request("GET", query, self.headers), (200,)
+
+        if name == "register_token":
+            def prepare(i):
+                return {
+                    "user_id": self.user_id,
+                    "device_token": f"bench-token-{uuid.uuid4().hex}",
+                    "platform": "android" if i % 2 else "ios"
+                }
+
+            return prepare, lambda client, body: client.request("POST", "/api/register-token", {}, body), (200,)
+
+        from utils.auth import token_cache, verify_token, create_access_token
+
+        if name == "jwt_verify":
+            def prepare(i):
+                return create_access_token({"sub": f"bench-{uuid.uuid4().hex}"})
+
+            return prepare, lambda client, token: 200 if verify_token(token) else 401, (200,)
+
+        token_cache.clear()
+        return (lambda i: self.token), lambda client, token: 200 if verify_token(token) else 401, (200,)
+
+    def run(self, name):
+        prepare, execute, ok_statuses = self._scenario(name)
+
+        # ウォームアップ（計測しない）
+        client = self.client_factory()
+        try:
+            for i in range(self.warmup):
+                execute(client, prepare(i))
+        finally:
+            client.close()
+
+        inputs = [prepare(self.warmup + i) for i in range(self.iterations)]
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def worker(worker_index):
+            nonlocal errors
+            client = self.client_factory()
+            local_latencies = []
+            local_errors = 0
+            try:
+                for i in range(worker_index, self.iterations, self.concurrency):
+                    started = time.perf_counter()
+                    status = execute(client, inputs[i])
+                    local_latencies.append(time.perf_counter() - started)
+                    if status not in ok_statuses:
+                        local_errors += 1
+            finally:
+                client.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors += local_errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(worker, range(self.concurrency)))
+        wall_time = time.perf_counter() - started
+
+        measured = np.array(latencies) * 1000
+        return {
+            "requests": len(measured),
+            "errors": errors,
+            "p50_ms": round(float(np.percentile(measured, 50)), 3),
+            "p99_ms": round(float(np.percentile(measured, 99)), 3),
+            "mean_ms": round(float(measured.mean()), 3),
+            "max_ms": round(float(measured.max()), 3),
+            "rps": round(len(measured) / wall_time, 1)
+        }
+
+def compare(results, baseline, threshold):
+    """ベースラインと比較し、閾値を超えて悪化したシナリオの一覧を返す"""
+    regressions = []
+    lines = [f"{'scenario':<20}{'p50':>12}{'p99':>12}{'rps':>12}"]
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+
+        changes = {}
+        for key in ("p50_ms", "p99_ms", "rps"):
+            if previous.get(key) and current.get(key) is not None:
+                changes[key] = current[key] / previous[key] - 1
+        lines.append(
+            f"{name:<20}" + "".join(
+                f"{changes[key] * 100:>+11.1f}%" if key in changes else f"{'-':>12}"
+                for key in ("p50_ms", "p99_ms", "rps")
+            )
+        )
+        if changes.get("p50_ms", 0) > threshold or changes.get("p99_ms", 0) > threshold \
+                or changes.get("rps", 0) < -threshold:
+            regressions.append(name)
+    return regressions, "\n".join(lines)
+
+def _cleanup_postgres(user_id):
+    """計測で登録した位置情報とトークンを削除する"""
+    from database import db
+
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+    try:
+        cursor.execute("DELETE FROM app_locations WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM user_latest_location WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM user_ingest_watermark WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM user_daily_rollup WHERE user_id = %s", (user_id,))
+        cursor.execute("DELETE FROM device_tokens WHERE user_id = %s", (user_id,))
+        db.commit()
+    finally:
+        cursor.close()
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="APIのレイテンシとスループットを計測します")
+    parser.add_argument("--backend", choices=["fake", "postgres"], default="fake",
+                        help="fake: メモリ上のフェイクDB / postgres: 設定済みのPostgreSQL")
+    parser.add_argument("--base-url", help="起動中のサーバーに対して計測する（指定時は--backendを無視）")
+    parser.add_argument("--token", help="--base-url使用時のJWT（省略時はSECRET_KEYで生成）")
+    parser.add_argument("--fake-latency-ms", type=float, default=0.0,
+                        help="フェイクDBでDBアクセス1回ごとに待機する時間（ミリ秒）")
+    parser.add_argument("--scenario", action="append", dest="scenarios", choices=SCENARIOS,
+                        help="実行するシナリオ（複数指定可、省略時はすべて）")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed-interval", type=float, default=30,
+                        help="範囲取得用シードデータの間隔（秒）")
+    parser.add_argument("--keep-data", action="store_true",
+                        help="postgres使用時に計測で登録したデータを削除しない")
+    parser.add_argument("--output", help="結果のJSONファイル（省略時はbenchmarks/results/に作成）")
+    parser.add_argument("--baseline", help="比較対象の結果JSONファイル")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="ベースラインからの悪化の許容割合（p50/p99の増加、rpsの減少）")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="許容割合を超えて悪化したシナリオがあれば終了コード1で終了する")
+    args = parser.parse_args()
+
+    # アプリのINFOログは計測に影響するため警告以上のみ出力する
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    from utils.auth import create_access_token
+
+    user_id = str(uuid.uuid4())
+    token = args.token or create_access_token({"sub": user_id})
+    scenarios = args.scenarios or SCENARIOS
+
+    fake = None
+    if args.base_url:
+        backend = "http"
+        client_factory = lambda: HttpClient(args.base_url, timeout=60)
+        skipped = [name for name in scenarios if name in IN_PROCESS_ONLY]
+        scenarios = [name for name in scenarios if name not in IN_PROCESS_ONLY]
+        if skipped:
+            print(f"--base-url指定時は実行しません: {', '.join(skipped)}", file=sys.stderr)
+    else:
+        backend = args.backend
+        if backend == "fake":
+            from benchmarks.fake_backend import FakeBackend
+
+            fake = FakeBackend(args.fake_latency_ms)
+            fake.install()
+
+        from app import create_app
+
+        app = create_app()
+        logging.getLogger().setLevel(logging.WARNING)
+        client_factory = lambda: InProcessClient(app)
+
+    runner = BenchmarkRunner(
+        client_factory, user_id, token, args.iterations, args.warmup, args.concurrency, args.seed_interval
+    )
+
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "backend": backend,
+            "fake_latency_ms": args.fake_latency_ms if fake else None,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "seed_interval": args.seed_interval,
+            "user_id": user_id
+        },
+        "scenarios": {}
+    }
+
+    try:
+        if any(name in RANGE_WINDOWS for name in scenarios):
+            seeded = runner.seed()
+            print(f"シードデータを登録しました: {seeded}件", file=sys.stderr)
+
+        for name in scenarios:
+            result = runner.run(name)
+            results["scenarios"][name] = result
+            print(
+                f"{name:<20} p50={result['p50_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+                f"rps={result['rps']} errors={result['errors']}",
+                file=sys.stderr
+            )
+    finally:
+        if fake:
+            fake.uninstall()
+        if backend == "postgres":
+            from database import db
+            if not args.keep_data:
+                _cleanup_postgres(user_id)
+            db.close_all()
+
+    output = args.output
+    if not output:
+        os.makedirs(os.path.join("benchmarks", "results"), exist_ok=True)
+        output = os.path.join("benchmarks", "results", f"{datetime.now():%Y%m%d_%H%M%S}_{backend}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"結果を保存しました: {output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions, table = compare(results, baseline, args.max_regression)
+        print(table)
+        if regressions:
+            print(f"悪化したシナリオ: {', '.join(regressions)}", file=sys.stderr)
+            if args.fail_on_regression:
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
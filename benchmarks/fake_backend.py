@@ -0,0 +1,136 @@
+import threading
+import time
+from datetime import datetime, timezone
+from bisect import bisect_left, insort
+import numpy as np
+from models.location_point import LocationPoint
+from models.device_token import DeviceToken
+from models.ingest_watermark import IngestWatermark
+
+class FakeBackend:
+    """PostgreSQLの代わりにメモリ上で位置情報・トークンを保持するベンチマーク用のバックエンド
+
+    LocationPoint・IngestWatermark・DeviceTokenのDBアクセスを差し替えて、アプリケーション層
+    （ルーティング・認証・バリデーション・シリアライズ）の処理時間だけを測定する。
+    query_latency_msを指定すると、DBアクセス1回ごとにその時間だけ待機して
+    実環境で記録したクエリ時間を再現する。
+    """
+
+    def __init__(self, query_latency_ms=0.0):
+        self.query_latency = query_latency_ms / 1000
+        self._lock = threading.Lock()
+        self._locations = {}
+        self._tokens = {}
+        self._watermarks = {}
+        self._next_id = 1
+        self._originals = {}
+
+    def _wait(self):
+        if self.query_latency > 0:
+            time.sleep(self.query_latency)
+
+    def _user_track(self, user_id):
+        # (タイムスタンプの昇順リスト, タイムスタンプ→行)
+        return self._locations.setdefault(user_id, ([], {}))
+
+    def save_batches(self, batches):
+        self._wait()
+        results = []
+        with self._lock:
+            for rows in batches:
+                saved_count = 0
+                for user_id, latitude, longitude, timestamp in rows:
+                    timestamps, by_timestamp = self._user_track(user_id)
+                    if timestamp in by_timestamp:
+                        continue
+                    by_timestamp[timestamp] = {
+                        "id": self._next_id, "latitude": latitude, "longitude": longitude, "timestamp": timestamp
+                    }
+                    self._next_id += 1
+                    if not timestamps or timestamps[-1] < timestamp:
+                        timestamps.append(timestamp)
+                    else:
+                        insort(timestamps, timestamp)
+                    saved_count += 1
+                results.append({
+                    "saved_count": saved_count,
+                    "duplicate_count": len(rows) - saved_count,
+                    "failed_points": []
+                })
+            touched = IngestWatermark.touched_days(batches, results)
+            now = datetime.now(timezone.utc)
+            for key in touched:
+                self._watermarks[key] = now
+        IngestWatermark.invalidate_responses(touched)
+        return results
+
+    def get_range(self, user_id, start_time, end_time):
+        self._wait()
+        with self._lock:
+            timestamps, by_timestamp = self._user_track(user_id)
+            selected = timestamps[bisect_left(timestamps, start_time):bisect_left(timestamps, end_time)]
+            return [by_timestamp[timestamp] for timestamp in selected]
+
+    def iter_range(self, user_id, start_time, end_time):
+        return iter(self.get_range(user_id, start_time, end_time))
+
+    def get_page(self, user_id, start_time, end_time, limit, after=None):
+        rows = self.get_range(user_id, start_time, end_time)
+        if after:
+            rows = [row for row in rows if (row["timestamp"], row["id"]) > tuple(after)]
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1]["timestamp"], rows[-1]["id"])
+        return rows, next_key
+
+    def get_columns(self, user_id, start_time, end_time):
+        rows = self.get_range(user_id, start_time, end_time)
+        return (
+            np.array([int(row["timestamp"].timestamp() * 1000) for row in rows], dtype=np.int64),
+            np.array([row["latitude"] for row in rows], dtype=np.float64),
+            np.array([row["longitude"] for row in rows], dtype=np.float64)
+        )
+
+    def get_watermark(self, user_id, start_time, end_time):
+        self._wait()
+        first, last = IngestWatermark.day_range(start_time, end_time)
+        with self._lock:
+            values = [
+                value for (key_user, day), value in self._watermarks.items()
+                if key_user == user_id and first <= day <= last
+            ]
+        return max(values, default=None)
+
+    def save_token(self, device_token):
+        self._wait()
+        with self._lock:
+            key = (device_token.user_id, device_token.platform)
+            entry = self._tokens.get(key)
+            now = time.time()
+            if entry is None:
+                entry = {"id": self._next_id, "created_at": now}
+                self._next_id += 1
+            entry.update(device_token=device_token.device_token, updated_at=now)
+            self._tokens[key] = entry
+            return {"id": entry["id"], "created_at": entry["created_at"], "updated_at": entry["updated_at"]}
+
+    def install(self):
+        """LocationPoint・IngestWatermark・DeviceTokenのDBアクセスをこのバックエンドに差し替える"""
+        replacements = {
+            (LocationPoint, "save_batches"): staticmethod(self.save_batches),
+            (LocationPoint, "get_range"): staticmethod(self.get_range),
+            (LocationPoint, "iter_range"): staticmethod(self.iter_range),
+            (LocationPoint, "get_page"): staticmethod(self.get_page),
+            (LocationPoint, "get_columns"): staticmethod(self.get_columns),
+            (IngestWatermark, "get"): staticmethod(self.get_watermark),
+            (DeviceToken, "save"): lambda device_token: self.save_token(device_token)
+        }
+        for (cls, name), replacement in replacements.items():
+            self._originals[(cls, name)] = cls.__dict__[name]
+            setattr(cls, name, replacement)
+
+    def uninstall(self):
+        for (cls, name), original in self._originals.items():
+            setattr(cls, name, original)
+        self._originals.clear()
@@ -10,9 +10,61 @@ class Config:
     DATABASE_USER = os.getenv('DATABASE_USER')
     DATABASE_PASSWORD = os.getenv('DATABASE_PASSWORD')
     
+    # コネクションプール設定
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_CHECKOUT_TIMEOUT = float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '5'))
+    # 取得時の正常性確認（DB_POOL_HEALTH_CHECK_IDLE秒以上使われていなかった接続だけSELECT 1で確認、0で毎回確認）
+    DB_POOL_HEALTH_CHECK = os.getenv('DB_POOL_HEALTH_CHECK', 'True').lower() == 'true'
+    DB_POOL_HEALTH_CHECK_IDLE = float(os.getenv('DB_POOL_HEALTH_CHECK_IDLE', '30'))
+    
+    # メトリクス設定（SLOW_REQUEST_THRESHOLD_MSを超えたリクエストはクエリ時間をログに出力、0で無効）
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '0'))
+    
+    # ログ設定（LOG_SAMPLE_RATESは "/points=0.1" のようにエンドポイントごとのINFOログの出力割合を指定）
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+    LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SAMPLE_RATES = os.getenv('LOG_SAMPLE_RATES', '')
+    
+    # サーバー設定（server.pyによるマルチワーカー起動、SERVER_INTERFACEはwsgi（gunicorn）またはasgi（uvicorn）、SERVER_THREADSはwsgiのワーカーあたりのスレッド数）
+    SERVER_INTERFACE = os.getenv('SERVER_INTERFACE', 'wsgi')
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', '5000'))
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.getenv('WEB_CONCURRENCY', '2')))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', '8'))
+    ASYNC_DB_COMMAND_TIMEOUT = float(os.getenv('ASYNC_DB_COMMAND_TIMEOUT', '30'))
+    
     FLASK_ENV = os.getenv('FLASK_ENV')
     FLASK_DEBUG = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
+    # デバイストークン参照キャッシュ設定（REDIS_URLを設定すると複数プロセスで共有）
+    DEVICE_TOKEN_CACHE_SIZE = int(os.getenv('DEVICE_TOKEN_CACHE_SIZE', '10000'))
+    DEVICE_TOKEN_CACHE_TTL = int(os.getenv('DEVICE_TOKEN_CACHE_TTL', '60'))
+    DEVICE_TOKEN_CACHE_REDIS_URL = os.getenv('DEVICE_TOKEN_CACHE_REDIS_URL')
+    
+    # プッシュ通知送信設定
+    FCM_API_URL = os.getenv('FCM_API_URL', 'https://fcm.googleapis.com')
+    FCM_PROJECT_ID = os.getenv('FCM_PROJECT_ID')
+    FCM_CREDENTIALS_FILE = os.getenv('FCM_CREDENTIALS_FILE', os.getenv('GOOGLE_APPLICATION_CREDENTIALS'))
+    PUSH_BATCH_SIZE = int(os.getenv('PUSH_BATCH_SIZE', '500'))
+    PUSH_CONCURRENCY = int(os.getenv('PUSH_CONCURRENCY', '10'))
+    PUSH_FETCH_SIZE = int(os.getenv('PUSH_FETCH_SIZE', '2000'))
+    PUSH_HTTP_TIMEOUT = float(os.getenv('PUSH_HTTP_TIMEOUT', '10'))
+    PUSH_MAX_CONNECTIONS = int(os.getenv('PUSH_MAX_CONNECTIONS', '100'))
+    PUSH_MAX_RETRIES = int(os.getenv('PUSH_MAX_RETRIES', '3'))
+    PUSH_RETRY_BACKOFF = float(os.getenv('PUSH_RETRY_BACKOFF', '0.5'))
+    PUSH_RETRY_MAX_BACKOFF = float(os.getenv('PUSH_RETRY_MAX_BACKOFF', '30'))
+    
+    # 無効・古いトークンの削除設定（TOKEN_COMPACTION_INTERVALは秒、0で定期削除を無効化）
+    TOKEN_PRUNE_BATCH_SIZE = int(os.getenv('TOKEN_PRUNE_BATCH_SIZE', '500'))
+    TOKEN_STALE_HORIZON_DAYS = int(os.getenv('TOKEN_STALE_HORIZON_DAYS', '270'))
+    TOKEN_COMPACTION_INTERVAL = int(os.getenv('TOKEN_COMPACTION_INTERVAL', '0'))
+    
     # Supabase設定
     SUPABASE_URL = os.getenv('SUPABASE_URL')
     SUPABASE_KEY = os.getenv('SUPABASE_KEY')
@@ -20,6 +72,70 @@ class Config:
     # JWT設定
     SECRET_KEY = os.getenv('SECRET_KEY')
     
+    # 位置情報一括保存設定（1回のINSERTで送信する最大行数）
+    LOCATION_INSERT_PAGE_SIZE = int(os.getenv('LOCATION_INSERT_PAGE_SIZE', '1000'))
+    
+    # Idempotency-Keyの結果を保持する件数と秒数
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '3600'))
+    
+    # 位置情報ストリーミング設定（サーバーサイドカーソルの1回の取得件数）
+    LOCATION_STREAM_ITERSIZE = int(os.getenv('LOCATION_STREAM_ITERSIZE', '2000'))
+    
+    # 位置情報簡略化設定（simplify指定時に返す最大ポイント数）
+    SIMPLIFY_MAX_POINTS = int(os.getenv('SIMPLIFY_MAX_POINTS', '2000'))
+    
+    # 位置情報エクスポート設定（GET /points/exportで指定できる最大日数）
+    LOCATION_EXPORT_MAX_DAYS = int(os.getenv('LOCATION_EXPORT_MAX_DAYS', '366'))
+    
+    # 空間検索設定（GET /points/search、SPATIAL_QUERY_ALL_USERSがTrueの場合のみscope=allで全ユーザーを検索できる）
+    SPATIAL_QUERY_MAX_CELLS = int(os.getenv('SPATIAL_QUERY_MAX_CELLS', '2500'))
+    SPATIAL_QUERY_MAX_CANDIDATES = int(os.getenv('SPATIAL_QUERY_MAX_CANDIDATES', '50000'))
+    SPATIAL_QUERY_MAX_RESULTS = int(os.getenv('SPATIAL_QUERY_MAX_RESULTS', '10000'))
+    SPATIAL_QUERY_MAX_RADIUS_M = float(os.getenv('SPATIAL_QUERY_MAX_RADIUS_M', '50000'))
+    SPATIAL_QUERY_ALL_USERS = os.getenv('SPATIAL_QUERY_ALL_USERS', 'False').lower() == 'true'
+    
+    # 最新位置情報設定（GET /points/latest、LATEST_LOCATION_OTHER_USERSがTrueの場合のみ他のユーザーを指定できる）
+    LATEST_LOCATION_CACHE_SIZE = int(os.getenv('LATEST_LOCATION_CACHE_SIZE', '100000'))
+    LATEST_LOCATION_CACHE_TTL = int(os.getenv('LATEST_LOCATION_CACHE_TTL', '5'))
+    LATEST_LOCATION_MAX_USERS = int(os.getenv('LATEST_LOCATION_MAX_USERS', '100'))
+    LATEST_LOCATION_OTHER_USERS = os.getenv('LATEST_LOCATION_OTHER_USERS', 'False').lower() == 'true'
+    
+    # GET /pointsのレスポンスキャッシュ設定（期間が終了したレスポンスのみ、POINTS_RESPONSE_CACHE_MAX_BYTESを超える本文はキャッシュしない）
+    POINTS_RESPONSE_CACHE_SIZE = int(os.getenv('POINTS_RESPONSE_CACHE_SIZE', '1000'))
+    POINTS_RESPONSE_CACHE_TTL = int(os.getenv('POINTS_RESPONSE_CACHE_TTL', '3600'))
+    POINTS_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('POINTS_RESPONSE_CACHE_MAX_BYTES', str(1024 * 1024)))
+    
+    # 位置情報の購読設定（GET /points/subscribe、LOCATION_PUBSUB_NOTIFYがTrueの場合はLISTEN/NOTIFYで複数プロセスに配信）
+    LOCATION_STREAM_MAX_SUBSCRIBERS = int(os.getenv('LOCATION_STREAM_MAX_SUBSCRIBERS', '1000'))
+    LOCATION_STREAM_QUEUE_SIZE = int(os.getenv('LOCATION_STREAM_QUEUE_SIZE', '100'))
+    LOCATION_STREAM_HEARTBEAT = float(os.getenv('LOCATION_STREAM_HEARTBEAT', '15'))
+    LOCATION_STREAM_MAX_USERS = int(os.getenv('LOCATION_STREAM_MAX_USERS', '100'))
+    LOCATION_STREAM_OTHER_USERS = os.getenv('LOCATION_STREAM_OTHER_USERS', 'False').lower() == 'true'
+    LOCATION_PUBSUB_NOTIFY = os.getenv('LOCATION_PUBSUB_NOTIFY', 'False').lower() == 'true'
+    
+    # 日ごとの集計設定（GET /points/summary、滞在はSTAY_RADIUS_M以内にSTAY_MIN_SECONDS以上とどまった区間）
+    ROLLUP_ENABLED = os.getenv('ROLLUP_ENABLED', 'True').lower() == 'true'
+    ROLLUP_STAY_RADIUS_M = float(os.getenv('ROLLUP_STAY_RADIUS_M', '100'))
+    ROLLUP_STAY_MIN_SECONDS = float(os.getenv('ROLLUP_STAY_MIN_SECONDS', '300'))
+    ROLLUP_MOVING_SPEED_MPS = float(os.getenv('ROLLUP_MOVING_SPEED_MPS', '1.0'))
+    ROLLUP_MAX_SPEED_MPS = float(os.getenv('ROLLUP_MAX_SPEED_MPS', '100'))
+    ROLLUP_MAX_GAP_SECONDS = float(os.getenv('ROLLUP_MAX_GAP_SECONDS', '300'))
+    ROLLUP_SUMMARY_MAX_DAYS = int(os.getenv('ROLLUP_SUMMARY_MAX_DAYS', '366'))
+    
+    # 位置情報パーティション設定（LOCATION_RETENTION_MONTHSが0の場合は無期限に保持）
+    LOCATION_PARTITION_MONTHS_AHEAD = int(os.getenv('LOCATION_PARTITION_MONTHS_AHEAD', '3'))
+    LOCATION_RETENTION_MONTHS = int(os.getenv('LOCATION_RETENTION_MONTHS', '0'))
+    LOCATION_RETENTION_MODE = os.getenv('LOCATION_RETENTION_MODE', 'drop')
+    LOCATION_ARCHIVE_SCHEMA = os.getenv('LOCATION_ARCHIVE_SCHEMA', 'archive')
+    
+    # 非同期書き込み（ライトビハインド）設定
+    ASYNC_INGEST_ENABLED = os.getenv('ASYNC_INGEST_ENABLED', 'False').lower() == 'true'
+    INGEST_QUEUE_MAX_UPLOADS = int(os.getenv('INGEST_QUEUE_MAX_UPLOADS', '1000'))
+    INGEST_BATCH_MAX_POINTS = int(os.getenv('INGEST_BATCH_MAX_POINTS', '10000'))
+    INGEST_FLUSH_INTERVAL = float(os.getenv('INGEST_FLUSH_INTERVAL', '0.2'))
+    INGEST_STATUS_RETENTION = int(os.getenv('INGEST_STATUS_RETENTION', '100000'))
+    
     @property
     def DATABASE_URL(self):
         return f"postgresql://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
\ No newline at end of file
@@ -1,46 +1,219 @@
 import psycopg2
 import psycopg2.extras
+import psycopg2.extensions
+import psycopg2.pool
 import logging
+import threading
+import time
+import weakref
 from config import Config
+from utils.metrics import record_query
+
+class TimedCursor(psycopg2.extras.RealDictCursor):
+    """クエリごとの実行時間をメトリクスに記録するカーソル"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+class ConnectionPool:
+    """スレッドセーフなPostgreSQLコネクションプール"""
+
+    def __init__(self, config):
+        self.config = config
+        self.min_size = config.DB_POOL_MIN_SIZE
+        self.max_size = config.DB_POOL_MAX_SIZE
+        self.checkout_timeout = config.DB_POOL_CHECKOUT_TIMEOUT
+        self.health_check = config.DB_POOL_HEALTH_CHECK
+        self.health_check_idle = config.DB_POOL_HEALTH_CHECK_IDLE
+        self._pool = None
+        # 接続ごとの最後に返却された時刻（ヘルスチェックの要否の判定に使う）
+        self._returned_at = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "checkouts": 0,
+            "returns": 0,
+            "in_use": 0,
+            "discarded": 0,
+            "timeouts": 0,
+            "wait_time_total": 0.0
+        }
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.min_size,
+                        self.max_size,
+                        host=self.config.DATABASE_HOST,
+                        port=self.config.DATABASE_PORT,
+                        database=self.config.DATABASE_NAME,
+                        user=self.config.DATABASE_USER,
+                        password=self.config.DATABASE_PASSWORD
+                    )
+                    logging.info("コネクションプールを作成しました: min=%s, max=%s", self.min_size, self.max_size)
+        return self._pool
+
+    def _incr(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+
+    def _is_healthy(self, connection):
+        if connection.closed:
+            return False
+        if connection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if not self.health_check:
+            return True
+        with self._stats_lock:
+            returned_at = self._returned_at.get(connection)
+        # 作成直後の接続と、直前まで使われていた接続は確認を省略する
+        if returned_at is None or time.monotonic() - returned_at < self.health_check_idle:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """プールから接続を取得する（空きがない場合はタイムアウトまで待機）"""
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            self._incr("timeouts")
+            raise psycopg2.pool.PoolError("コネクションプールの接続取得がタイムアウトしました")
+
+        try:
+            pool = self._get_pool()
+            # ヘルスチェックに失敗した接続は破棄して取り直す
+            for _ in range(self.max_size + 1):
+                connection = pool.getconn()
+                if self._is_healthy(connection):
+                    break
+                self._incr("discarded")
+                logging.warning("異常な接続を破棄しました")
+                pool.putconn(connection, close=True)
+            else:
+                raise psycopg2.pool.PoolError("正常な接続を取得できませんでした")
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._stats_lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+            self._stats["wait_time_total"] += time.monotonic() - started
+        return connection
+
+    def putconn(self, connection, close=False):
+        """接続をプールに返却する"""
+        try:
+            self._get_pool().putconn(connection, close=close or connection.closed)
+        finally:
+            with self._stats_lock:
+                self._returned_at[connection] = time.monotonic()
+                self._stats["returns"] += 1
+                self._stats["in_use"] -= 1
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+                logging.info("コネクションプールを閉じました")
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["min_size"] = self.min_size
+        stats["max_size"] = self.max_size
+        stats["available"] = self.max_size - stats["in_use"]
+        return stats
 
 class Database:
     def __init__(self):
         self.config = Config()
-        self.connection = None
-        
+        self.pool = ConnectionPool(self.config)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        return getattr(self._local, 'connection', None)
+
     def connect(self):
+        """現在のスレッド用にプールから接続を取得する"""
         try:
-            self.connection = psycopg2.connect(
-                host=self.config.DATABASE_HOST,
-                port=self.config.DATABASE_PORT,
-                database=self.config.DATABASE_NAME,
-                user=self.config.DATABASE_USER,
-                password=self.config.DATABASE_PASSWORD
-            )
-            logging.info("データベース接続が成功しました")
+            self._local.connection = self.pool.getconn()
             return True
-        except psycopg2.Error as e:
-            logging.error(f"データベース接続エラー: {e}")
+        except (psycopg2.Error, psycopg2.pool.PoolError) as e:
+            logging.error("データベース接続エラー: %s", e)
             return False
-    
-    def disconnect(self):
-        if self.connection:
-            self.connection.close()
-            self.connection = None
-            logging.info("データベース接続を切断しました")
-    
-    def get_cursor(self):
+
+    def release(self):
+        """現在のスレッドの接続をプールに返却する"""
+        connection = self.connection
+        if connection:
+            self._local.connection = None
+            self.pool.putconn(connection)
+
+    def close_all(self):
+        self.release()
+        self.pool.closeall()
+
+    def _ensure_connection(self):
         if not self.connection or self.connection.closed:
+            if self.connection:
+                self.release()
             if not self.connect():
                 return None
-        return self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    
+        return self.connection
+
+    def get_cursor(self):
+        if not self._ensure_connection():
+            return None
+        return self.connection.cursor(cursor_factory=TimedCursor)
+
+    def get_named_cursor(self, name, itersize=None):
+        """サーバーサイドカーソルを取得する（結果をitersize件ずつ取得）"""
+        if not self._ensure_connection():
+            return None
+        cursor = self.connection.cursor(name=name, cursor_factory=TimedCursor)
+        if itersize:
+            cursor.itersize = itersize
+        return cursor
+
     def commit(self):
         if self.connection:
             self.connection.commit()
-    
+
     def rollback(self):
-        if self.connection:
+        if self.connection and not self.connection.closed:
             self.connection.rollback()
 
-db = Database()
\ No newline at end of file
+    def get_pool_stats(self):
+        return self.pool.get_stats()
+
+db = Database()
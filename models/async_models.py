@@ -0,0 +1,246 @@
+import contextlib
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from config import Config
+from async_database import async_db, asyncpg_query
+from models.location_point import LocationPoint
+from models.latest_location import LatestLocation
+from models.ingest_watermark import IngestWatermark
+from models.daily_rollup import DailyRollup
+from services.location_pubsub import location_pubsub, NOTIFY_CHANNEL, NOTIFY_QUERY
+from models.device_token import DeviceToken
+
+class AsyncLocationPoint:
+    """ASGIモード用の位置情報の保存・取得（asyncpg）
+
+    クエリは各モデル（LocationPoint・LatestLocation・IngestWatermark・DailyRollup）の定義を
+    asyncpg_queryでasyncpgのプレースホルダに変換して使う。
+    """
+
+    # asyncpgにはexecute_valuesがないため、列ごとの配列をunnestして1回のINSERTで保存する
+    INSERT_QUERY = """
+        INSERT INTO app_locations (user_id, latitude, longitude, timestamp)
+        SELECT * FROM unnest($1::uuid[], $2::float8[], $3::float8[], $4::timestamptz[])
+        ON CONFLICT DO NOTHING
+        RETURNING timestamp
+    """
+
+    RANGE_QUERY = asyncpg_query(LocationPoint.RANGE_QUERY)
+    LATEST_UPSERT_QUERY = asyncpg_query(LatestLocation.UPSERT_QUERY)
+    WATERMARK_UPSERT_QUERY = asyncpg_query(IngestWatermark.UPSERT_QUERY)
+    ROLLUP_LOCK_QUERY = asyncpg_query(DailyRollup.LOCK_QUERY)
+    ROLLUP_SELECT_STATE_QUERY = asyncpg_query(DailyRollup.SELECT_STATE_QUERY)
+    ROLLUP_DAY_POINTS_QUERY = asyncpg_query(DailyRollup.DAY_POINTS_QUERY)
+    ROLLUP_UPSERT_QUERY = asyncpg_query(DailyRollup.UPSERT_QUERY)
+    NOTIFY_QUERY = asyncpg_query(NOTIFY_QUERY)
+
+    @staticmethod
+    async def _insert_chunk(connection, rows):
+        columns = list(zip(*rows))
+        returned = await connection.fetch(AsyncLocationPoint.INSERT_QUERY, *columns)
+        return LocationPoint.saved_rows(rows, (row['timestamp'] for row in returned))
+
+    @staticmethod
+    async def _insert_rows(connection, rows, page_size):
+        """LocationPoint._insert_rowsと同じ規則で1件のアップロード分の行を保存する"""
+        import asyncpg
+
+        unique_rows, indices = LocationPoint._dedupe(rows)
+        saved_rows = []
+        failures = []
+        for offset in range(0, len(unique_rows), page_size):
+            chunk = unique_rows[offset:offset + page_size]
+            try:
+                async with connection.transaction():
+                    saved_rows.extend(await AsyncLocationPoint._insert_chunk(connection, chunk))
+            except asyncpg.PostgresError as e:
+                logging.warning("一括保存に失敗したため個別保存に切り替えます: offset=%s, %s", offset, e)
+                for row, index in zip(chunk, indices[offset:offset + page_size]):
+                    try:
+                        async with connection.transaction():
+                            saved_rows.extend(await AsyncLocationPoint._insert_chunk(connection, [row]))
+                    except asyncpg.PostgresError as row_error:
+                        logging.error("位置情報の保存に失敗: points[%s]: %s", index, row_error)
+                        failures.append({"index": index, "message": str(row_error).strip()})
+
+        result = {
+            "saved_count": len(saved_rows),
+            "duplicate_count": len(rows) - len(saved_rows) - len(failures),
+            "failed_points": failures
+        }
+        return result, saved_rows
+
+    @staticmethod
+    async def _apply_rollups(connection, saved_batches):
+        """DailyRollup.applyと同じく、保存した行で日ごとの集計を更新する"""
+        if not Config.ROLLUP_ENABLED:
+            return
+        for user_id, day, lat, lon, ts in DailyRollup.pending_points(saved_batches):
+            await connection.execute(AsyncLocationPoint.ROLLUP_LOCK_QUERY, DailyRollup.lock_key(user_id, day))
+            state = await connection.fetchval(AsyncLocationPoint.ROLLUP_SELECT_STATE_QUERY, user_id, day)
+            state = DailyRollup.incremental_state(json.loads(state) if state else None, lat, lon, ts)
+            if state is None:
+                rows = await connection.fetch(
+                    AsyncLocationPoint.ROLLUP_DAY_POINTS_QUERY, user_id, *DailyRollup.day_bounds(day)
+                )
+                if not rows:
+                    continue
+                state = DailyRollup.state_from_rows(rows)
+            await connection.execute(
+                AsyncLocationPoint.ROLLUP_UPSERT_QUERY, *DailyRollup.upsert_params(user_id, day, state)
+            )
+
+    @staticmethod
+    async def save_batches(batches):
+        """LocationPoint.save_batchesと同じく、複数アップロード分の行を1トランザクションで保存する"""
+        import asyncpg
+
+        page_size = Config.LOCATION_INSERT_PAGE_SIZE
+        try:
+            async with async_db.acquire() as connection:
+                async with connection.transaction():
+                    inserted = [
+                        await AsyncLocationPoint._insert_rows(connection, rows, page_size)
+                        for rows in batches
+                    ]
+                    results = [result for result, _ in inserted]
+                    saved_batches = [saved_rows for _, saved_rows in inserted]
+                    latest = []
+                    latest_rows = LatestLocation.latest_rows(batches, results)
+                    if latest_rows:
+                        latest = await connection.fetch(
+                            AsyncLocationPoint.LATEST_UPSERT_QUERY, *map(list, zip(*latest_rows))
+                        )
+                    touched = IngestWatermark.touched_days(batches, results)
+                    if touched:
+                        await connection.execute(AsyncLocationPoint.WATERMARK_UPSERT_QUERY, *map(list, zip(*touched)))
+                    await AsyncLocationPoint._apply_rollups(connection, saved_batches)
+                    events = location_pubsub.events_for(saved_batches)
+                    if location_pubsub.notify_enabled:
+                        for payload in location_pubsub.notify_payloads(events):
+                            await connection.execute(AsyncLocationPoint.NOTIFY_QUERY, NOTIFY_CHANNEL, payload)
+                        events = []
+        except asyncpg.PostgresError as e:
+            logging.error("位置情報一括保存エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+
+        LatestLocation.cache_updated(latest)
+        IngestWatermark.invalidate_responses(touched)
+        location_pubsub.publish(events)
+        return results
+
+    @staticmethod
+    async def get_range(user_id, start_time, end_time):
+        async with async_db.acquire() as connection:
+            return await connection.fetch(AsyncLocationPoint.RANGE_QUERY, user_id, start_time, end_time)
+
+    @staticmethod
+    async def get_page(user_id, start_time, end_time, limit, after=None):
+        """LocationPoint.get_pageと同じキーセットページネーション"""
+        params = [user_id, start_time, end_time]
+        after_clause = ""
+        if after:
+            after_clause = LocationPoint.PAGE_AFTER_CLAUSE
+            params.extend(after)
+        params.append(limit + 1)
+        query = asyncpg_query(LocationPoint.PAGE_QUERY.format(after_clause=after_clause))
+
+        async with async_db.acquire() as connection:
+            rows = await connection.fetch(query, *params)
+
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1]['timestamp'], rows[-1]['id'])
+        return rows, next_key
+
+    @staticmethod
+    async def iter_range(user_id, start_time, end_time):
+        """サーバーサイドカーソルで指定期間の位置情報を少しずつ取得する
+
+        LocationPoint.iter_rangeと同じく、接続の取得とクエリの発行までは呼び出し時に行うため、
+        接続エラーはレスポンス送信前に検出される。戻り値は行を返す非同期ジェネレータ。
+        """
+        stack = contextlib.AsyncExitStack()
+        try:
+            connection = await stack.enter_async_context(async_db.acquire())
+            await stack.enter_async_context(connection.transaction(readonly=True))
+            cursor = await connection.cursor(AsyncLocationPoint.RANGE_QUERY, user_id, start_time, end_time)
+        except BaseException:
+            await stack.__aexit__(*sys.exc_info())
+            raise
+
+        async def iterate():
+            # 途中切断時も含めてトランザクションを終了し、接続をプールに返却する
+            async with stack:
+                while True:
+                    rows = await cursor.fetch(Config.LOCATION_STREAM_ITERSIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+
+        return iterate()
+
+class AsyncIngestWatermark:
+    """ASGIモード用の最終取り込み時刻の取得（asyncpg）"""
+
+    SELECT_QUERY = asyncpg_query(IngestWatermark.SELECT_QUERY)
+
+    @staticmethod
+    async def get(user_id, start_time, end_time):
+        """IngestWatermark.getと同じく期間内の最終取り込み時刻を返す（位置情報がない場合はNone）"""
+        import asyncpg
+
+        try:
+            async with async_db.acquire() as connection:
+                return await connection.fetchval(
+                    AsyncIngestWatermark.SELECT_QUERY, user_id, *IngestWatermark.day_range(start_time, end_time)
+                )
+        except asyncpg.PostgresError as e:
+            logging.error("取り込み時刻取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+
+class AsyncDeviceToken:
+    """ASGIモード用のデバイストークンの保存（asyncpg）"""
+
+    UPSERT_QUERY = """
+        INSERT INTO device_tokens (user_id, device_token, platform, device_info, created_at, updated_at)
+        VALUES ($1, $2, $3, $4, $5, $5)
+        ON CONFLICT (user_id, platform)
+        DO UPDATE SET
+            device_token = EXCLUDED.device_token,
+            device_info = EXCLUDED.device_info,
+            updated_at = EXCLUDED.updated_at
+        RETURNING id, created_at, updated_at
+    """
+
+    @staticmethod
+    async def save(device_token):
+        """DeviceToken.saveと同じくトークンを登録・更新し、参照キャッシュを無効化する"""
+        import asyncpg
+
+        device_info_json = json.dumps(device_token.device_info) if device_token.device_info else None
+        try:
+            async with async_db.acquire() as connection:
+                result = await connection.fetchrow(
+                    AsyncDeviceToken.UPSERT_QUERY,
+                    device_token.user_id,
+                    device_token.device_token,
+                    device_token.platform,
+                    device_info_json,
+                    datetime.now(timezone.utc)
+                )
+        except asyncpg.PostgresError as e:
+            logging.error("トークン保存エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+
+        DeviceToken.invalidate_cache(device_token.user_id, device_token.platform)
+        logging.info("トークン保存成功: user_id=%s, platform=%s", device_token.user_id, device_token.platform)
+        return {
+            'id': result['id'],
+            'created_at': result['created_at'],
+            'updated_at': result['updated_at']
+        }
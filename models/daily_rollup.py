@@ -0,0 +1,195 @@
+import json
+import logging
+from datetime import datetime, time, timedelta, timezone
+import numpy as np
+import psycopg2
+from config import Config
+from database import db
+from utils.rollup import empty_state, apply_points, summarize
+
+class DailyRollup:
+    """ユーザー・日（UTC）ごとの移動距離・移動時間・滞在・点数の集計（user_daily_rollupテーブル）
+
+    位置情報の保存と同じトランザクションで、保存した行の日付ごとに更新される。
+    新しく保存した点が前回の最後の点より後だけの場合は保存済みの途中状態に追加し、
+    遅れて届いた点を保存した場合や集計がまだない日は、その日の位置情報だけから再集計する。
+    重複として保存されなかった点（再送など）は集計に影響しないため扱わない。
+    日をまたぐ区間は集計しない（日ごとに独立して集計する）。
+    """
+
+    # 同じ (user_id, 日) を同時に更新するトランザクションを直列化する
+    LOCK_QUERY = "SELECT pg_advisory_xact_lock(hashtext(%s))"
+
+    SELECT_STATE_QUERY = """
+        SELECT state
+        FROM user_daily_rollup
+        WHERE user_id = %s
+        AND day = %s
+    """
+
+    DAY_POINTS_QUERY = """
+        SELECT latitude, longitude, extract(epoch FROM timestamp)::float8 AS ts
+        FROM app_locations
+        WHERE user_id = %s
+        AND timestamp >= %s
+        AND timestamp < %s
+        ORDER BY timestamp ASC
+    """
+
+    UPSERT_QUERY = """
+        INSERT INTO user_daily_rollup (
+            user_id, day, point_count, distance_m, moving_seconds, stay_count, stay_seconds,
+            stays, first_timestamp, last_timestamp, state
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s, %s, %s::jsonb)
+        ON CONFLICT (user_id, day)
+        DO UPDATE SET
+            point_count = EXCLUDED.point_count,
+            distance_m = EXCLUDED.distance_m,
+            moving_seconds = EXCLUDED.moving_seconds,
+            stay_count = EXCLUDED.stay_count,
+            stay_seconds = EXCLUDED.stay_seconds,
+            stays = EXCLUDED.stays,
+            first_timestamp = EXCLUDED.first_timestamp,
+            last_timestamp = EXCLUDED.last_timestamp,
+            state = EXCLUDED.state,
+            updated_at = CURRENT_TIMESTAMP
+    """
+
+    RANGE_QUERY = """
+        SELECT day, point_count, distance_m, moving_seconds, stay_count, stay_seconds,
+               stays, first_timestamp, last_timestamp
+        FROM user_daily_rollup
+        WHERE user_id = %s
+        AND day BETWEEN %s AND %s
+        ORDER BY day ASC
+    """
+
+    @staticmethod
+    def params():
+        return {
+            "stay_radius_m": Config.ROLLUP_STAY_RADIUS_M,
+            "stay_min_seconds": Config.ROLLUP_STAY_MIN_SECONDS,
+            "moving_speed_mps": Config.ROLLUP_MOVING_SPEED_MPS,
+            "max_speed_mps": Config.ROLLUP_MAX_SPEED_MPS,
+            "max_gap_seconds": Config.ROLLUP_MAX_GAP_SECONDS
+        }
+
+    @staticmethod
+    def lock_key(user_id, day):
+        return f"rollup:{user_id}:{day.isoformat()}"
+
+    @staticmethod
+    def day_bounds(day):
+        start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        return start, start + timedelta(days=1)
+
+    @staticmethod
+    def pending_points(saved_batches):
+        """新しく保存した行（LocationPoint._insert_rowsが返す行）を (user_id, 日) ごとにまとめる
+
+        重複として保存されなかった行・保存に失敗した行は含まれないため、
+        再送されたアップロードで何も保存されなかった場合は空になる。
+        戻り値は (user_id, 日, 緯度, 経度, UNIX時刻) のリストで、各配列は時刻順・時刻の重複なし。
+        同時に更新するトランザクション間でデッドロックしないよう、常に同じ順序で返す。
+        """
+        groups = {}
+        for rows in saved_batches:
+            for row in rows:
+                key = (row[0], row[3].astimezone(timezone.utc).date())
+                groups.setdefault(key, []).append((row[1], row[2], row[3].timestamp()))
+
+        pending = []
+        for (user_id, day), points in sorted(groups.items()):
+            values = np.array(points, dtype=np.float64)
+            values = values[np.argsort(values[:, 2], kind="stable")]
+            pending.append((user_id, day, values[:, 0], values[:, 1], values[:, 2]))
+        return pending
+
+    @staticmethod
+    def incremental_state(state, lat, lon, ts):
+        """保存済みの途中状態に新しい点を追加した状態を返す
+
+        集計がない場合や、新しく保存した点が前回の最後の点以前の場合は再集計が必要なためNoneを返す。
+        """
+        if state is None or state["last"] is None or ts[0] <= state["last"][2]:
+            return None
+        return apply_points(state, lat, lon, ts, DailyRollup.params())
+
+    @staticmethod
+    def state_from_rows(rows):
+        """その日の位置情報の行（latitude, longitude, ts）から集計し直す"""
+        lat = np.fromiter((row['latitude'] for row in rows), dtype=np.float64, count=len(rows))
+        lon = np.fromiter((row['longitude'] for row in rows), dtype=np.float64, count=len(rows))
+        ts = np.fromiter((row['ts'] for row in rows), dtype=np.float64, count=len(rows))
+        return apply_points(empty_state(), lat, lon, ts, DailyRollup.params())
+
+    @staticmethod
+    def upsert_params(user_id, day, state):
+        summary = summarize(state, Config.ROLLUP_STAY_MIN_SECONDS)
+        return (
+            user_id, day,
+            summary["point_count"], summary["distance_m"], summary["moving_seconds"],
+            summary["stay_count"], summary["stay_seconds"], json.dumps(summary["stays"]),
+            summary["first_timestamp"], summary["last_timestamp"], json.dumps(state)
+        )
+
+    @staticmethod
+    def recompute(cursor, user_id, day):
+        """1日分の集計を位置情報から作り直す（位置情報がない場合は何もしない）"""
+        cursor.execute(DailyRollup.DAY_POINTS_QUERY, (user_id, *DailyRollup.day_bounds(day)))
+        rows = cursor.fetchall()
+        if not rows:
+            return False
+        cursor.execute(DailyRollup.UPSERT_QUERY, DailyRollup.upsert_params(user_id, day, DailyRollup.state_from_rows(rows)))
+        return True
+
+    @staticmethod
+    def apply(cursor, saved_batches):
+        """新しく保存した行で集計を更新し、更新した (user_id, 日) の数を返す（コミットは呼び出し側で行う）"""
+        if not Config.ROLLUP_ENABLED:
+            return 0
+
+        pending = DailyRollup.pending_points(saved_batches)
+        for user_id, day, lat, lon, ts in pending:
+            cursor.execute(DailyRollup.LOCK_QUERY, (DailyRollup.lock_key(user_id, day),))
+            cursor.execute(DailyRollup.SELECT_STATE_QUERY, (user_id, day))
+            row = cursor.fetchone()
+            state = DailyRollup.incremental_state(row['state'] if row else None, lat, lon, ts)
+            if state is None:
+                DailyRollup.recompute(cursor, user_id, day)
+            else:
+                cursor.execute(DailyRollup.UPSERT_QUERY, DailyRollup.upsert_params(user_id, day, state))
+        return len(pending)
+
+    @staticmethod
+    def to_dict(row, include_stays=False):
+        result = {
+            "date": row['day'].isoformat(),
+            "point_count": row['point_count'],
+            "distance_m": round(float(row['distance_m']), 1),
+            "moving_seconds": round(float(row['moving_seconds']), 1),
+            "stay_count": row['stay_count'],
+            "stay_seconds": round(float(row['stay_seconds']), 1),
+            "first_timestamp": row['first_timestamp'].isoformat(),
+            "last_timestamp": row['last_timestamp'].isoformat()
+        }
+        if include_stays:
+            result["stays"] = row['stays']
+        return result
+
+    @staticmethod
+    def get_range(user_id, start_day, end_day):
+        """期間内（両端を含む）の日ごとの集計を取得する"""
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(DailyRollup.RANGE_QUERY, (user_id, start_day, end_day))
+            return cursor.fetchall()
+        except psycopg2.Error as e:
+            logging.error("日ごとの集計取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
@@ -1,8 +1,13 @@
+import copy
 import logging
 import json
+import uuid
 from datetime import datetime
+from config import Config
 from database import db
+from utils.cache import TTLCache, create_shared_cache
 import psycopg2
+import psycopg2.extras
 
 class DeviceToken:
     def __init__(self, user_id=None, device_token=None, platform=None, device_info=None):
@@ -42,8 +47,9 @@ class DeviceToken:
             
             result = cursor.fetchone()
             db.commit()
+            DeviceToken.invalidate_cache(self.user_id, self.platform)
             
-            logging.info(f"トークン保存成功: user_id={self.user_id}, platform={self.platform}")
+            logging.info("トークン保存成功: user_id=%s, platform=%s", self.user_id, self.platform)
             return {
                 'id': result['id'],
                 'created_at': result['created_at'],
@@ -52,13 +58,125 @@ class DeviceToken:
             
         except psycopg2.Error as e:
             db.rollback()
-            logging.error(f"トークン保存エラー: {e}")
+            logging.error("トークン保存エラー: %s", e)
             raise Exception(f"データベースエラー: {e}")
         finally:
             cursor.close()
     
+    @staticmethod
+    def save_many(device_tokens):
+        """複数のトークンを1回のUPSERTでまとめて保存する
+
+        save()と同じく (user_id, platform) の重複時は更新する。
+        同じ (user_id, platform) が複数含まれる場合は、順に保存した場合と同様に最後のものが残る。
+        戻り値は入力と同じ順序の結果リスト。
+        """
+        if not device_tokens:
+            return []
+        
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+        
+        try:
+            now = datetime.now()
+            # 1つのINSERT内で同じ行を2回更新できないため、キーごとに最後の値だけを送る
+            latest = {}
+            for token in device_tokens:
+                latest[(token.user_id, token.platform)] = token
+            
+            rows = [
+                (
+                    token.user_id,
+                    token.device_token,
+                    token.platform,
+                    json.dumps(token.device_info) if token.device_info else None,
+                    now,
+                    now
+                )
+                for token in latest.values()
+            ]
+            
+            query = """
+                INSERT INTO device_tokens (user_id, device_token, platform, device_info, created_at, updated_at)
+                VALUES %s
+                ON CONFLICT (user_id, platform)
+                DO UPDATE SET
+                    device_token = EXCLUDED.device_token,
+                    device_info = EXCLUDED.device_info,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING id, user_id, platform, created_at, updated_at
+            """
+            
+            saved = psycopg2.extras.execute_values(cursor, query, rows, page_size=len(rows), fetch=True)
+            db.commit()
+            for user_id, platform in latest:
+                DeviceToken.invalidate_cache(user_id, platform)
+            
+            by_key = {(row['user_id'], row['platform']): row for row in saved}
+            logging.info("トークン一括保存成功: 件数=%s, 更新行数=%s", len(device_tokens), len(saved))
+            return [
+                {
+                    'id': by_key[(token.user_id, token.platform)]['id'],
+                    'created_at': by_key[(token.user_id, token.platform)]['created_at'],
+                    'updated_at': by_key[(token.user_id, token.platform)]['updated_at']
+                }
+                for token in device_tokens
+            ]
+            
+        except psycopg2.Error as e:
+            db.rollback()
+            logging.error("トークン一括保存エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def _row_to_dict(result):
+        device_info = result['device_info']
+        if isinstance(device_info, str):
+            device_info = json.loads(device_info) if device_info else None
+        return {
+            'id': result['id'],
+            'user_id': result['user_id'],
+            'device_token': result['device_token'],
+            'platform': result['platform'],
+            'device_info': device_info or None,
+            'created_at': result['created_at'],
+            'updated_at': result['updated_at']
+        }
+    
+    @staticmethod
+    def _cache_get(key):
+        """(ヒットしたか, トークン) を返す（呼び出し側が変更してもキャッシュに影響しないようコピーを返す）"""
+        hit, value = lookup_cache.get(key)
+        if not hit and shared_cache:
+            hit, value = shared_cache.get(key)
+            if hit:
+                lookup_cache.set(key, value)
+        return hit, copy.deepcopy(value)
+    
+    @staticmethod
+    def _cache_set(key, value):
+        # 呼び出し側に返す辞書とキャッシュする辞書を分ける
+        lookup_cache.set(key, copy.deepcopy(value))
+        if shared_cache:
+            shared_cache.set(key, value)
+    
+    @staticmethod
+    def invalidate_cache(user_id, platform):
+        """キャッシュされた (user_id, platform) のトークンを破棄する"""
+        lookup_cache.delete((user_id, platform))
+        if shared_cache:
+            shared_cache.delete((user_id, platform))
+    
     @staticmethod
     def get_by_user_and_platform(user_id, platform):
+        """トークンを取得する（キャッシュにない場合のみDBから取得）"""
+        hit, cached = DeviceToken._cache_get((user_id, platform))
+        if hit:
+            return cached
+        
         cursor = db.get_cursor()
         if not cursor:
             return None
@@ -73,21 +191,225 @@ class DeviceToken:
             cursor.execute(query, (user_id, platform))
             result = cursor.fetchone()
             
-            if result:
-                device_info = json.loads(result['device_info']) if result['device_info'] else None
-                return {
-                    'id': result['id'],
-                    'user_id': result['user_id'],
-                    'device_token': result['device_token'],
-                    'platform': result['platform'],
-                    'device_info': device_info,
-                    'created_at': result['created_at'],
-                    'updated_at': result['updated_at']
-                }
-            return None
+            token = DeviceToken._row_to_dict(result) if result else None
+            DeviceToken._cache_set((user_id, platform), token)
+            return token
             
         except psycopg2.Error as e:
-            logging.error(f"トークン取得エラー: {e}")
+            logging.error("トークン取得エラー: %s", e)
             return None
         finally:
-            cursor.close()
\ No newline at end of file
+            cursor.close()
+    
+    @staticmethod
+    def get_many(user_ids):
+        """複数ユーザーのトークンを取得する
+
+        キャッシュにない分だけを1回のクエリでまとめて取得する。
+        戻り値は user_id をキー、プラットフォームごとのトークンのリストを値とする辞書。
+        """
+        tokens = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            user_tokens = []
+            for platform in PLATFORMS:
+                hit, cached = DeviceToken._cache_get((user_id, platform))
+                if not hit:
+                    missing.append(user_id)
+                    break
+                if cached:
+                    user_tokens.append(cached)
+            else:
+                tokens[user_id] = user_tokens
+        
+        if not missing:
+            return tokens
+        
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+        
+        try:
+            query = """
+                SELECT id, user_id, device_token, platform, device_info, created_at, updated_at
+                FROM device_tokens
+                WHERE user_id = ANY(%s)
+            """
+            
+            cursor.execute(query, (missing,))
+            found = {}
+            for result in cursor.fetchall():
+                token = DeviceToken._row_to_dict(result)
+                found[(token['user_id'], token['platform'])] = token
+            
+            # 見つからなかった組み合わせもNoneとしてキャッシュする
+            for user_id in missing:
+                user_tokens = []
+                for platform in PLATFORMS:
+                    token = found.get((user_id, platform))
+                    DeviceToken._cache_set((user_id, platform), token)
+                    if token:
+                        user_tokens.append(token)
+                tokens[user_id] = user_tokens
+            return tokens
+            
+        except psycopg2.Error as e:
+            logging.error("トークン一括取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def iter_tokens(user_ids=None, platform=None, updated_since=None, itersize=2000):
+        """条件に一致するトークンをサーバーサイドカーソルで少しずつ取得する
+
+        条件を指定しない場合は全トークンが対象となる。
+        戻り値は (id, user_id, platform, device_token) の行を返すイテレータ。
+        """
+        conditions = []
+        params = []
+        if user_ids is not None:
+            conditions.append("user_id = ANY(%s)")
+            params.append(list(user_ids))
+        if platform is not None:
+            conditions.append("platform = %s")
+            params.append(platform)
+        if updated_since is not None:
+            conditions.append("updated_at >= %s")
+            params.append(updated_since)
+        
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT id, user_id, platform, device_token
+            FROM device_tokens
+            {where_clause}
+            ORDER BY id
+        """
+        
+        cursor = db.get_named_cursor(f"device_token_stream_{uuid.uuid4().hex}", itersize=itersize)
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+        
+        try:
+            cursor.execute(query, params)
+        except psycopg2.Error as e:
+            cursor.close()
+            db.rollback()
+            logging.error("トークン取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        
+        def iterate():
+            try:
+                for row in cursor:
+                    yield row
+            finally:
+                cursor.close()
+                db.rollback()
+        
+        return iterate()
+
+    @staticmethod
+    def delete_tokens(tokens):
+        """無効になったトークンをまとめて削除する
+
+        tokensは (id, device_token) のリスト。取得後に再登録されたトークンを消さないよう、
+        device_tokenが一致する行のみを削除する。削除した件数を返す。
+        """
+        if not tokens:
+            return 0
+        
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+        
+        try:
+            query = """
+                DELETE FROM device_tokens AS d
+                USING unnest(%s::bigint[], %s::text[]) AS dead(id, device_token)
+                WHERE d.id = dead.id AND d.device_token = dead.device_token
+                RETURNING d.user_id, d.platform
+            """
+            
+            cursor.execute(query, ([token[0] for token in tokens], [token[1] for token in tokens]))
+            deleted = cursor.fetchall()
+            db.commit()
+            for row in deleted:
+                DeviceToken.invalidate_cache(row['user_id'], row['platform'])
+            
+            logging.info("無効なトークンを削除しました: 件数=%s/%s", len(deleted), len(tokens))
+            return len(deleted)
+            
+        except psycopg2.Error as e:
+            db.rollback()
+            logging.error("トークン削除エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+    
+    @staticmethod
+    def delete_stale(updated_before, batch_size=1000):
+        """updated_atが指定日時より古いトークンをbatch_size件ずつ削除し、削除した件数を返す"""
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+        
+        query = """
+            DELETE FROM device_tokens
+            WHERE id IN (
+                SELECT id FROM device_tokens
+                WHERE updated_at < %s
+                LIMIT %s
+            )
+            RETURNING user_id, platform
+        """
+        
+        total = 0
+        try:
+            while True:
+                cursor.execute(query, (updated_before, batch_size))
+                deleted = cursor.fetchall()
+                db.commit()
+                for row in deleted:
+                    DeviceToken.invalidate_cache(row['user_id'], row['platform'])
+                total += len(deleted)
+                if len(deleted) < batch_size:
+                    break
+            
+            logging.info("古いトークンを削除しました: 件数=%s, 基準日時=%s", total, updated_before)
+            return total
+            
+        except psycopg2.Error as e:
+            db.rollback()
+            logging.error("トークン削除エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+
+def _encode_cached_token(token):
+    if token is None:
+        return None
+    return dict(
+        token,
+        created_at=token['created_at'].isoformat() if token['created_at'] else None,
+        updated_at=token['updated_at'].isoformat() if token['updated_at'] else None
+    )
+
+def _decode_cached_token(value):
+    if value is None:
+        return None
+    return dict(
+        value,
+        created_at=datetime.fromisoformat(value['created_at']) if value['created_at'] else None,
+        updated_at=datetime.fromisoformat(value['updated_at']) if value['updated_at'] else None
+    )
+
+PLATFORMS = ["android", "ios"]
+
+lookup_cache = TTLCache(Config.DEVICE_TOKEN_CACHE_SIZE, Config.DEVICE_TOKEN_CACHE_TTL)
+shared_cache = create_shared_cache(
+    Config.DEVICE_TOKEN_CACHE_REDIS_URL,
+    Config.DEVICE_TOKEN_CACHE_TTL,
+    "device_token",
+    encode=_encode_cached_token,
+    decode=_decode_cached_token
+)
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+from datetime import timedelta, timezone
+import psycopg2
+from config import Config
+from database import db
+from utils.cache import TTLCache
+
+class IngestWatermark:
+    """ユーザー・日（UTC）ごとの最終取り込み時刻（user_ingest_watermarkテーブル）
+
+    位置情報の保存と同じトランザクションで、保存した行の日付ごとに更新される。
+    GET /pointsのETag・Last-Modifiedと、期間が終了したレスポンスのキャッシュの検証に使用する。
+    """
+
+    # 同じ時刻で上書きしてもETagが変わるよう、常に以前の値より大きくする
+    UPSERT_QUERY = """
+        INSERT INTO user_ingest_watermark (user_id, day, ingested_at)
+        SELECT user_id, day, now() FROM unnest(%s::uuid[], %s::date[]) AS touched (user_id, day)
+        ON CONFLICT (user_id, day)
+        DO UPDATE SET ingested_at = GREATEST(
+            EXCLUDED.ingested_at,
+            user_ingest_watermark.ingested_at + interval '1 microsecond'
+        )
+    """
+
+    SELECT_QUERY = """
+        SELECT max(ingested_at) AS ingested_at
+        FROM user_ingest_watermark
+        WHERE user_id = %s
+        AND day BETWEEN %s AND %s
+    """
+
+    @staticmethod
+    def day_range(start_time, end_time):
+        """期間 [start_time, end_time) に含まれる最初と最後の日（UTC）を返す"""
+        return (
+            start_time.astimezone(timezone.utc).date(),
+            (end_time - timedelta(microseconds=1)).astimezone(timezone.utc).date()
+        )
+
+    @staticmethod
+    def touched_days(batches, results):
+        """保存したアップロード分の行から (user_id, 日) の組み合わせを返す（保存に失敗した行は除く）"""
+        touched = set()
+        for rows, result in zip(batches, results):
+            failed = {failure["index"] for failure in result["failed_points"]}
+            for i, row in enumerate(rows):
+                if i not in failed:
+                    touched.add((row[0], row[3].astimezone(timezone.utc).date()))
+        # 同時に更新するトランザクション間でデッドロックしないよう、常に同じ順序で更新する
+        return sorted(touched)
+
+    @staticmethod
+    def upsert(cursor, batches, results):
+        """最終取り込み時刻を更新し、更新した (user_id, 日) を返す（コミットは呼び出し側で行う）"""
+        touched = IngestWatermark.touched_days(batches, results)
+        if touched:
+            cursor.execute(IngestWatermark.UPSERT_QUERY, [list(column) for column in zip(*touched)])
+        return touched
+
+    @staticmethod
+    def get(user_id, start_time, end_time):
+        """期間内の最終取り込み時刻を返す（位置情報がない場合はNone）"""
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(IngestWatermark.SELECT_QUERY, (user_id, *IngestWatermark.day_range(start_time, end_time)))
+            return cursor.fetchone()['ingested_at']
+        except psycopg2.Error as e:
+            logging.error("取り込み時刻取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def make_etag(user_id, start_time, end_time, variant, watermark):
+        """期間・パラメータ・最終取り込み時刻からETagを作成する（レスポンス本文は読まない）"""
+        key = "|".join([
+            str(user_id),
+            start_time.isoformat(),
+            end_time.isoformat(),
+            variant,
+            watermark.isoformat() if watermark else "-"
+        ])
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def invalidate_responses(touched):
+        """保存した日を含む期間のキャッシュ済みレスポンスを削除する"""
+        if not touched:
+            return
+        days_by_user = {}
+        for user_id, day in touched:
+            days_by_user.setdefault(str(user_id), []).append(day)
+
+        def overlaps(key):
+            days = days_by_user.get(key[0])
+            if not days:
+                return False
+            first, last = IngestWatermark.day_range(key[1], key[2])
+            return any(first <= day <= last for day in days)
+
+        response_cache.delete_where(overlaps)
+
+# 期間が終了したGET /pointsのレスポンス本文（キーは (user_id, start_time, end_time, パラメータ)）
+response_cache = TTLCache(Config.POINTS_RESPONSE_CACHE_SIZE, Config.POINTS_RESPONSE_CACHE_TTL)
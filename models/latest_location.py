@@ -0,0 +1,111 @@
+import logging
+import psycopg2
+from config import Config
+from database import db
+from utils.cache import TTLCache
+
+class LatestLocation:
+    """ユーザーごとの最新の位置情報（user_latest_locationテーブル）
+
+    位置情報の保存と同じトランザクションで更新されるため、app_locationsの最新行と常に一致する。
+    """
+
+    # より新しい時刻の場合のみ更新する（遅れて届いた古い位置情報で上書きしない）
+    # 列ごとの配列をunnestするため、psycopg2・asyncpgのどちらでも1回のクエリで更新できる
+    UPSERT_QUERY = """
+        INSERT INTO user_latest_location (user_id, latitude, longitude, timestamp)
+        SELECT * FROM unnest(%s::uuid[], %s::float8[], %s::float8[], %s::timestamptz[])
+        ON CONFLICT (user_id)
+        DO UPDATE SET
+            latitude = EXCLUDED.latitude,
+            longitude = EXCLUDED.longitude,
+            timestamp = EXCLUDED.timestamp,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_latest_location.timestamp < EXCLUDED.timestamp
+        RETURNING user_id, latitude, longitude, timestamp
+    """
+
+    SELECT_QUERY = """
+        SELECT user_id, latitude, longitude, timestamp
+        FROM user_latest_location
+        WHERE user_id = ANY(%s::uuid[])
+    """
+
+    @staticmethod
+    def latest_rows(batches, results):
+        """保存したアップロード分の行からユーザーごとに最も新しい行を選ぶ（保存に失敗した行は除く）"""
+        latest = {}
+        for rows, result in zip(batches, results):
+            failed = {failure["index"] for failure in result["failed_points"]}
+            for i, row in enumerate(rows):
+                if i in failed:
+                    continue
+                current = latest.get(row[0])
+                if current is None or row[3] > current[3]:
+                    latest[row[0]] = row
+        return list(latest.values())
+
+    @staticmethod
+    def upsert(cursor, batches, results):
+        """最新の位置情報を更新し、更新した行を返す（コミットは呼び出し側で行う）"""
+        rows = LatestLocation.latest_rows(batches, results)
+        if not rows:
+            return []
+        cursor.execute(LatestLocation.UPSERT_QUERY, [list(column) for column in zip(*rows)])
+        return cursor.fetchall()
+
+    @staticmethod
+    def cache_updated(rows):
+        """コミット後に更新した行でキャッシュを書き換える"""
+        for row in rows:
+            latest_cache.set(str(row['user_id']), LatestLocation.to_dict(row))
+
+    @staticmethod
+    def to_dict(row):
+        return {
+            "user_id": str(row['user_id']),
+            "latitude": float(row['latitude']),
+            "longitude": float(row['longitude']),
+            "timestamp": row['timestamp'].isoformat()
+        }
+
+    @staticmethod
+    def get_many(user_ids):
+        """複数ユーザーの最新の位置情報を取得する
+
+        キャッシュにない分だけを1回のクエリでまとめて取得する。
+        戻り値は user_id をキー、位置情報（未登録の場合はNone）を値とする辞書。
+        """
+        locations = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            hit, cached = latest_cache.get(user_id)
+            if hit:
+                locations[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        if not missing:
+            return locations
+
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(LatestLocation.SELECT_QUERY, (missing,))
+            found = {str(row['user_id']): LatestLocation.to_dict(row) for row in cursor.fetchall()}
+        except psycopg2.Error as e:
+            logging.error("最新位置情報取得エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+
+        # 見つからなかったユーザーもNoneとしてキャッシュする
+        for user_id in missing:
+            location = found.get(user_id)
+            latest_cache.set(user_id, location)
+            locations[user_id] = location
+        return locations
+
+latest_cache = TTLCache(Config.LATEST_LOCATION_CACHE_SIZE, Config.LATEST_LOCATION_CACHE_TTL)
@@ -0,0 +1,388 @@
+import io
+import logging
+import uuid
+from datetime import timezone
+import numpy as np
+import psycopg2
+import psycopg2.extras
+from config import Config
+from database import db
+from models.latest_location import LatestLocation
+from models.ingest_watermark import IngestWatermark
+from models.daily_rollup import DailyRollup
+from services.location_pubsub import location_pubsub
+from utils.geo import cells_for_bbox
+from utils.metrics import points_ingested
+
+class LocationPoint:
+    # ON CONFLICT DO NOTHINGで除外された行は返されないため、RETURNINGで保存した行を特定する
+    INSERT_QUERY = """
+        INSERT INTO app_locations (user_id, latitude, longitude, timestamp)
+        VALUES %s
+        ON CONFLICT DO NOTHING
+        RETURNING timestamp
+    """
+
+    RANGE_QUERY = """
+        SELECT latitude, longitude, timestamp
+        FROM app_locations
+        WHERE user_id = %s
+        AND timestamp >= %s
+        AND timestamp < %s
+        ORDER BY timestamp ASC
+    """
+
+    PAGE_QUERY = """
+        SELECT id, latitude, longitude, timestamp
+        FROM app_locations
+        WHERE user_id = %s
+        AND timestamp >= %s
+        AND timestamp < %s
+        {after_clause}
+        ORDER BY timestamp ASC, id ASC
+        LIMIT %s
+    """
+    PAGE_AFTER_CLAUSE = "AND (timestamp, id) > (%s, %s)"
+
+    # 空間検索用（geocell列のインデックスで候補を絞り、緯度・経度の範囲で確定する）
+    AREA_QUERY = """
+        SELECT user_id, latitude, longitude, timestamp
+        FROM app_locations
+        WHERE {cell_clause}
+        latitude BETWEEN %s AND %s
+        AND longitude BETWEEN %s AND %s
+        AND timestamp >= %s
+        AND timestamp < %s
+        {user_clause}
+        ORDER BY timestamp ASC
+        LIMIT %s
+    """
+
+    # エクスポート用（UNIX時刻ミリ秒・緯度・経度をすべて8バイト固定長の列で取得する）
+    EXPORT_QUERY = """
+        SELECT floor(extract(epoch FROM timestamp) * 1000)::int8,
+               latitude::float8,
+               longitude::float8
+        FROM app_locations
+        WHERE user_id = %s
+        AND timestamp >= %s
+        AND timestamp < %s
+        ORDER BY timestamp ASC
+    """
+
+    # COPY ... (FORMAT binary) の1行分（列数 + 各列の長さとビッグエンディアンの値）
+    COPY_ROW_DTYPE = np.dtype([
+        ("field_count", ">i2"),
+        ("timestamp_length", ">i4"), ("timestamp_ms", ">i8"),
+        ("latitude_length", ">i4"), ("latitude", ">f8"),
+        ("longitude_length", ">i4"), ("longitude", ">f8")
+    ])
+    COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+    @staticmethod
+    def to_dict(row):
+        return {
+            "latitude": float(row['latitude']),
+            "longitude": float(row['longitude']),
+            "timestamp": row['timestamp'].isoformat()
+        }
+
+    @staticmethod
+    def to_rows(user_id, points):
+        return [
+            (user_id, point['latitude'], point['longitude'], point['parsed_timestamp'])
+            for point in points
+        ]
+
+    @staticmethod
+    def columns_to_rows(user_id, latitudes, longitudes, timestamps_ms):
+        """緯度・経度・UNIX時刻(ミリ秒)の配列から保存用の行を作成する（ポイントごとの辞書は作らない）"""
+        timestamps = [
+            value.replace(tzinfo=timezone.utc)
+            for value in np.asarray(timestamps_ms, dtype=np.int64).astype('datetime64[ms]').tolist()
+        ]
+        return list(zip(
+            [user_id] * len(timestamps),
+            np.asarray(latitudes, dtype=np.float64).tolist(),
+            np.asarray(longitudes, dtype=np.float64).tolist(),
+            timestamps
+        ))
+
+    @staticmethod
+    def _dedupe(rows):
+        """同じ (user_id, timestamp) の行を除き、残った行と元のインデックスを返す"""
+        seen = set()
+        unique_rows = []
+        indices = []
+        for i, row in enumerate(rows):
+            key = (row[0], row[3])
+            if key in seen:
+                continue
+            seen.add(key)
+            unique_rows.append(row)
+            indices.append(i)
+        return unique_rows, indices
+
+    @staticmethod
+    def saved_rows(rows, returned_timestamps):
+        """INSERTに渡した行のうち、RETURNINGで返された（重複で除外されなかった）行を元の順序で返す
+
+        1件のアップロード内の行はuser_idが同じで時刻の重複を除いてあるため、時刻で特定できる。
+        """
+        saved = set(returned_timestamps)
+        return [row for row in rows if row[3] in saved]
+
+    @staticmethod
+    def _insert_chunk(cursor, rows):
+        """行を1回のINSERTで保存し、保存した行を返す"""
+        returned = psycopg2.extras.execute_values(
+            cursor, LocationPoint.INSERT_QUERY, rows, page_size=len(rows), fetch=True
+        )
+        return LocationPoint.saved_rows(rows, (row['timestamp'] for row in returned))
+
+    @staticmethod
+    def _insert_one_by_one(cursor, rows, indices):
+        """チャンク内の各行をセーブポイント付きで個別に保存し、保存した行と失敗した行を返す"""
+        saved_rows = []
+        failures = []
+        for row, index in zip(rows, indices):
+            cursor.execute("SAVEPOINT location_row")
+            try:
+                saved_rows.extend(LocationPoint._insert_chunk(cursor, [row]))
+                cursor.execute("RELEASE SAVEPOINT location_row")
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT location_row")
+                logging.error("位置情報の保存に失敗: points[%s]: %s", index, e)
+                failures.append({"index": index, "message": str(e).strip()})
+        return saved_rows, failures
+
+    @staticmethod
+    def _insert_rows(cursor, rows, page_size):
+        """1件のアップロード分の行を保存し、({saved_count, duplicate_count, failed_points}, 保存した行) を返す
+
+        チャンク単位で1回のINSERTを発行し、チャンクが失敗した場合のみ
+        そのチャンクを1件ずつ保存し直して失敗した行を特定する。
+        保存した行には、重複として除外された行と保存に失敗した行は含まれない。
+        """
+        unique_rows, indices = LocationPoint._dedupe(rows)
+        saved_rows = []
+        failures = []
+        for offset in range(0, len(unique_rows), page_size):
+            chunk = unique_rows[offset:offset + page_size]
+            chunk_indices = indices[offset:offset + page_size]
+            cursor.execute("SAVEPOINT location_chunk")
+            try:
+                saved_rows.extend(LocationPoint._insert_chunk(cursor, chunk))
+                cursor.execute("RELEASE SAVEPOINT location_chunk")
+            except psycopg2.Error as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT location_chunk")
+                logging.warning("一括保存に失敗したため個別保存に切り替えます: offset=%s, %s", offset, e)
+                chunk_saved, chunk_failures = LocationPoint._insert_one_by_one(cursor, chunk, chunk_indices)
+                saved_rows.extend(chunk_saved)
+                failures.extend(chunk_failures)
+
+        result = {
+            "saved_count": len(saved_rows),
+            "duplicate_count": len(rows) - len(saved_rows) - len(failures),
+            "failed_points": failures
+        }
+        return result, saved_rows
+
+    @staticmethod
+    def bulk_save(user_id, points):
+        """1ユーザー分の位置情報をマルチロウINSERTで一括保存する"""
+        return LocationPoint.save_batches([LocationPoint.to_rows(user_id, points)])[0]
+
+    @staticmethod
+    def save_batches(batches):
+        """複数アップロード分の行を1トランザクションで保存する
+
+        batchesは (user_id, latitude, longitude, timestamp) の行のリストのリストで、
+        複数ユーザーのアップロードをまとめて渡せる。同じ (user_id, timestamp) の行は
+        バッチ内・保存済みの行のどちらとも重複として除外される。
+        ユーザーごとの最新の位置情報（user_latest_location）と最終取り込み時刻
+        （user_ingest_watermark）、日ごとの集計（user_daily_rollup）も同じトランザクションで更新し、
+        コミット後に購読者へ配信する。
+        戻り値はアップロードごとの {saved_count, duplicate_count, failed_points} のリスト。
+        """
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        page_size = Config.LOCATION_INSERT_PAGE_SIZE
+        try:
+            inserted = [LocationPoint._insert_rows(cursor, rows, page_size) for rows in batches]
+            results = [result for result, _ in inserted]
+            saved_batches = [saved_rows for _, saved_rows in inserted]
+            latest = LatestLocation.upsert(cursor, batches, results)
+            touched = IngestWatermark.upsert(cursor, batches, results)
+            DailyRollup.apply(cursor, saved_batches)
+            events = location_pubsub.prepare_publish(cursor, saved_batches)
+            db.commit()
+            LatestLocation.cache_updated(latest)
+            IngestWatermark.invalidate_responses(touched)
+            location_pubsub.publish(events)
+            points_ingested.inc(sum(result["saved_count"] for result in results))
+            return results
+
+        except psycopg2.Error as e:
+            db.rollback()
+            logging.error("位置情報一括保存エラー: %s", e)
+            raise Exception(f"データベースエラー: {e}")
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def get_range(user_id, start_time, end_time):
+        """指定期間の位置情報をまとめて取得する"""
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(LocationPoint.RANGE_QUERY, (user_id, start_time, end_time))
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def get_page(user_id, start_time, end_time, limit, after=None):
+        """キーセットページネーションで指定期間の位置情報を1ページ分取得する
+
+        afterには前ページ最終行の (timestamp, id) を指定する。
+        戻り値は (rows, 次ページがある場合は最終行のキー、なければNone)。
+        """
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        params = [user_id, start_time, end_time]
+        after_clause = ""
+        if after:
+            after_clause = LocationPoint.PAGE_AFTER_CLAUSE
+            params.extend(after)
+        # 次ページの有無を判定するため1件多く取得する
+        params.append(limit + 1)
+
+        try:
+            cursor.execute(LocationPoint.PAGE_QUERY.format(after_clause=after_clause), params)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        next_key = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_key = (rows[-1]['timestamp'], rows[-1]['id'])
+        return rows, next_key
+
+    @staticmethod
+    def get_area(bbox, start_time, end_time, max_rows, user_id=None):
+        """範囲 (最小緯度, 最小経度, 最大緯度, 最大経度) 内の位置情報を時刻順に最大max_rows件取得する
+
+        範囲と重なるセルがSPATIAL_QUERY_MAX_CELLSを超える場合はセルによる絞り込みを行わない。
+        user_idを省略した場合は全ユーザーを対象にする。
+        """
+        min_lat, min_lon, max_lat, max_lon = bbox
+        cells = cells_for_bbox(min_lat, min_lon, max_lat, max_lon, Config.SPATIAL_QUERY_MAX_CELLS)
+
+        params = []
+        cell_clause = ""
+        if cells is not None:
+            cell_clause = "geocell = ANY(%s) AND"
+            params.append(cells.tolist())
+        params.extend([min_lat, max_lat, min_lon, max_lon, start_time, end_time])
+        user_clause = ""
+        if user_id is not None:
+            user_clause = "AND user_id = %s"
+            params.append(user_id)
+        params.append(max_rows)
+
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(
+                LocationPoint.AREA_QUERY.format(cell_clause=cell_clause, user_clause=user_clause), params
+            )
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _parse_copy_binary(data):
+        """COPYのバイナリ出力を (UNIX時刻ミリ秒, 緯度, 経度) の配列に変換する"""
+        signature_length = len(LocationPoint.COPY_SIGNATURE)
+        if data[:signature_length] != LocationPoint.COPY_SIGNATURE:
+            raise Exception("COPYの出力形式が不正です")
+        extension_length = int.from_bytes(data[signature_length + 4:signature_length + 8], "big")
+        body = data[signature_length + 8 + extension_length:-2]
+
+        if len(body) % LocationPoint.COPY_ROW_DTYPE.itemsize != 0:
+            raise Exception("COPYの出力形式が不正です")
+        records = np.frombuffer(body, dtype=LocationPoint.COPY_ROW_DTYPE)
+        if len(records) and not (
+            (records["field_count"] == 3).all()
+            and (records["timestamp_length"] == 8).all()
+            and (records["latitude_length"] == 8).all()
+            and (records["longitude_length"] == 8).all()
+        ):
+            raise Exception("COPYの出力形式が不正です")
+
+        return (
+            records["timestamp_ms"].astype(np.int64),
+            records["latitude"].astype(np.float64),
+            records["longitude"].astype(np.float64)
+        )
+
+    @staticmethod
+    def get_columns(user_id, start_time, end_time):
+        """指定期間の位置情報を列ごとのNumPy配列で取得する（行ごとのPythonオブジェクトは作らない）
+
+        COPY ... TO STDOUT (FORMAT binary) の出力をそのまま配列として解釈する。
+        戻り値は (UNIX時刻ミリ秒, 緯度, 経度) の配列。
+        """
+        cursor = db.get_cursor()
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        buffer = io.BytesIO()
+        try:
+            query = cursor.mogrify(LocationPoint.EXPORT_QUERY, (user_id, start_time, end_time)).decode('utf-8')
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+        finally:
+            cursor.close()
+
+        return LocationPoint._parse_copy_binary(buffer.getbuffer())
+
+    @staticmethod
+    def iter_range(user_id, start_time, end_time):
+        """サーバーサイドカーソルで指定期間の位置情報を少しずつ取得する
+
+        クエリの発行までは呼び出し時に行うため、接続エラーはレスポンス送信前に検出される。
+        """
+        cursor = db.get_named_cursor(
+            f"location_stream_{uuid.uuid4().hex}",
+            itersize=Config.LOCATION_STREAM_ITERSIZE
+        )
+        if not cursor:
+            raise Exception("データベース接続に失敗しました")
+
+        try:
+            cursor.execute(LocationPoint.RANGE_QUERY, (user_id, start_time, end_time))
+        except psycopg2.Error:
+            cursor.close()
+            db.rollback()
+            raise
+
+        def iterate():
+            try:
+                for row in cursor:
+                    yield row
+            finally:
+                # 読み取り専用のトランザクションなので、途中切断時も含めてロールバックで終了する
+                cursor.close()
+                db.rollback()
+
+        return iterate()
@@ -0,0 +1,376 @@
+import asyncio
+import hashlib
+import json
+import logging
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from async_database import async_db
+from config import Config
+from models.async_models import AsyncLocationPoint, AsyncIngestWatermark, AsyncDeviceToken
+from models.device_token import DeviceToken, lookup_cache
+from models.latest_location import latest_cache
+from models.ingest_watermark import response_cache
+from models.location_point import LocationPoint
+from routes.location_routes import (
+    parse_points_body, idempotency_cache, DEFAULT_PAGE_LIMIT, STREAM_CHUNK_SIZE
+)
+from services.location_pubsub import (
+    location_pubsub, AsyncSubscription, SubscriberLimitExceeded, SSE_HEARTBEAT, sse_event, next_timeout
+)
+from utils.auth import verify_token, token_cache
+from utils.conditional import ConditionalPoints, points_response_type, response_variant
+from utils.pagination import encode_cursor, decode_cursor
+from utils.simplify import simplify_track
+from utils.validators import (
+    ValidationError, validate_register_token_request, validate_points_get_request,
+    validate_limit, validate_simplify_request, validate_idempotency_key, validate_user_ids
+)
+
+# ASGIモードのエンドポイント（/points・/points/subscribe・/api/register-token・/api/health をFlask版と同じ形式で提供する）
+
+def _error(message, error_code, status_code, headers=None):
+    return JSONResponse({
+        "status": "error",
+        "message": message,
+        "error_code": error_code
+    }, status_code=status_code, headers=headers)
+
+def get_current_user(request):
+    """Authorization headerからJWTトークンを取得してユーザー情報を返す"""
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return verify_token(auth_header.split(' ')[1])
+
+def _mimetype(request):
+    return request.headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+async def upload_points(request):
+    """位置情報を一括アップロードする"""
+    try:
+        current_user = get_current_user(request)
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return _error("認証が必要です", "UNAUTHORIZED", 401)
+
+        user_id = current_user['user_id']
+        logging.info("位置情報アップロード開始: user_id=%s", user_id)
+        body = await request.body()
+
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None:
+            validate_idempotency_key(idempotency_key)
+            fingerprint = hashlib.sha256(body).hexdigest()
+            hit, stored = idempotency_cache.get((user_id, idempotency_key))
+            if hit:
+                if stored['fingerprint'] != fingerprint:
+                    logging.warning("Idempotency-Keyが異なるリクエストで再利用されました: user_id=%s", user_id)
+                    return _error("Idempotency-Keyは別のリクエストで使用済みです", "IDEMPOTENCY_KEY_REUSED", 422)
+                logging.info("位置情報アップロード再送: user_id=%s, 前回の結果を返します", user_id)
+                return JSONResponse(stored['body'], status_code=stored['status'], headers={"Idempotent-Replayed": "true"})
+
+        # デコードとバリデーションはCPU処理なのでイベントループを止めないよう別スレッドで行う
+        rows = await run_in_threadpool(
+            parse_points_body, user_id, _mimetype(request), request.headers.get('Content-Encoding'), body
+        )
+        result = (await AsyncLocationPoint.save_batches([rows]))[0]
+        saved_count = result['saved_count']
+
+        logging.info(
+            "位置情報アップロード完了: user_id=%s, 保存件数=%s/%s, 重複件数=%s",
+            user_id, saved_count, len(rows), result['duplicate_count']
+        )
+
+        response_body = {
+            "status": "success",
+            "message": f"{saved_count}件の位置情報を保存しました",
+            "saved_count": saved_count,
+            "duplicate_count": result['duplicate_count'],
+            "total_count": len(rows),
+            "failed_points": result['failed_points']
+        }
+        if idempotency_key is not None:
+            idempotency_cache.set((user_id, idempotency_key), {"fingerprint": fingerprint, "body": response_body, "status": 201})
+        return JSONResponse(response_body, status_code=201)
+
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return _error(e.message, e.error_code, 400)
+
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return _error("内部サーバーエラーが発生しました", "INTERNAL_SERVER_ERROR", 500)
+
+async def _stream_points(rows, user_id, ndjson, start_time=None, end_time=None):
+    """位置情報をNDJSONまたは通常と同じ構造のJSONで少しずつ出力する"""
+    count = 0
+    chunk = []
+    if not ndjson:
+        yield '{"points": ['
+    try:
+        async for row in rows:
+            if ndjson:
+                chunk.append(json.dumps(LocationPoint.to_dict(row)) + '\n')
+            else:
+                chunk.append((', ' if count else '') + json.dumps(LocationPoint.to_dict(row)))
+            count += 1
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
+    except Exception as e:
+        # ヘッダー送信後はステータスを変更できないため、ログに記録して出力を打ち切る
+        logging.error("位置情報ストリーミングエラー: user_id=%s, %s", user_id, e)
+        return
+    if not ndjson:
+        yield '], ' + json.dumps({
+            "count": count,
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat()
+        })[1:]
+    logging.info("位置情報取得完了（ストリーミング）: user_id=%s, 取得件数=%s", user_id, count)
+
+async def _points_response(request, user_id, start_time, end_time):
+    """GET /pointsのレスポンスを作成する（簡略化・ページネーション・ストリーミング・通常）"""
+    args = request.query_params
+
+    # 簡略化モード（ページネーション・ストリーミングとは併用不可）
+    simplify_mode = args.get('simplify')
+    if simplify_mode is not None:
+        if args.get('limit') is not None or args.get('cursor') is not None \
+                or args.get('stream', '').lower() == 'true':
+            raise ValidationError("simplifyはlimit・cursor・streamと同時に指定できません", "PARAMETER_CONFLICT")
+
+        params = validate_simplify_request(
+            simplify_mode, args.get('tolerance'), args.get('max_points'), args.get('bucket'),
+            Config.SIMPLIFY_MAX_POINTS
+        )
+        rows = await AsyncLocationPoint.get_range(user_id, start_time, end_time)
+        points = [LocationPoint.to_dict(row) for row in simplify_track(rows, **params)]
+
+        return JSONResponse({
+            "points": points,
+            "count": len(points),
+            "original_count": len(rows),
+            "simplify": params,
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat()
+        })
+
+    # キーセットページネーション
+    limit_str = args.get('limit')
+    cursor_str = args.get('cursor')
+    if limit_str is not None or cursor_str is not None:
+        limit = validate_limit(limit_str if limit_str is not None else DEFAULT_PAGE_LIMIT)
+        after = decode_cursor(cursor_str) if cursor_str else None
+
+        rows, next_key = await AsyncLocationPoint.get_page(user_id, start_time, end_time, limit, after)
+        points = [LocationPoint.to_dict(row) for row in rows]
+
+        return JSONResponse({
+            "points": points,
+            "count": len(points),
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "limit": limit,
+            "next_cursor": encode_cursor(*next_key) if next_key else None
+        })
+
+    # ストリーミング（NDJSONを要求された場合は常にストリーミング）
+    if points_response_type(request.headers.get('Accept')) == 'application/x-ndjson':
+        rows = await AsyncLocationPoint.iter_range(user_id, start_time, end_time)
+        return StreamingResponse(_stream_points(rows, user_id, True), media_type='application/x-ndjson')
+
+    if args.get('stream', '').lower() == 'true':
+        rows = await AsyncLocationPoint.iter_range(user_id, start_time, end_time)
+        return StreamingResponse(
+            _stream_points(rows, user_id, False, start_time, end_time), media_type='application/json'
+        )
+
+    rows = await AsyncLocationPoint.get_range(user_id, start_time, end_time)
+    points = [LocationPoint.to_dict(row) for row in rows]
+
+    logging.info("位置情報取得完了: user_id=%s, 取得件数=%s", user_id, len(points))
+
+    return JSONResponse({
+        "points": points,
+        "count": len(points),
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat()
+    })
+
+async def get_points(request):
+    """指定範囲の位置情報を取得する"""
+    try:
+        current_user = get_current_user(request)
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return _error("認証が必要です", "UNAUTHORIZED", 401)
+
+        user_id = current_user['user_id']
+        args = request.query_params
+
+        start_time_str = args.get('start_time')
+        end_time_str = args.get('end_time')
+        if not start_time_str or not end_time_str:
+            return _error("start_timeとend_timeパラメータは必須です", "MISSING_PARAMETERS", 400)
+
+        start_time, end_time = validate_points_get_request(start_time_str, end_time_str)
+        logging.info("位置情報取得: user_id=%s, 期間=%s - %s", user_id, start_time, end_time)
+
+        # 条件付きGETと期間が終了したレスポンスのキャッシュ（Flask版と共通）
+        watermark = await AsyncIngestWatermark.get(user_id, start_time, end_time)
+        conditional = ConditionalPoints(
+            user_id, start_time, end_time,
+            response_variant(args.multi_items(), request.headers.get('Accept')),
+            watermark
+        )
+
+        if conditional.not_modified(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+            logging.info("位置情報取得（未変更）: user_id=%s", user_id)
+            return Response(status_code=304, headers=conditional.headers())
+
+        cached = conditional.cached()
+        if cached:
+            logging.info("位置情報取得完了（キャッシュ）: user_id=%s", user_id)
+            return Response(cached['body'], media_type=cached['mimetype'], headers=conditional.headers())
+
+        response = await _points_response(request, user_id, start_time, end_time)
+        if not isinstance(response, StreamingResponse):
+            conditional.store(response.body, response.media_type)
+        response.headers.update(conditional.headers())
+        return response
+
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return _error(e.message, e.error_code, 400)
+
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return _error("内部サーバーエラーが発生しました", "INTERNAL_SERVER_ERROR", 500)
+
+async def _stream_events(subscription, user_id, expires_at):
+    """購読したユーザーの位置情報をServer-Sent Eventsで出力する"""
+    try:
+        yield sse_event("ready", {"user_ids": sorted(subscription.user_ids)})
+        while True:
+            timeout = next_timeout(Config.LOCATION_STREAM_HEARTBEAT, expires_at)
+            if timeout <= 0:
+                yield sse_event("expired", {"message": "トークンの有効期限が切れました"})
+                return
+            event = await subscription.get(timeout)
+            if subscription.dropped:
+                yield sse_event("dropped", {"message": "受信が追いつかないため切断しました"})
+                return
+            yield sse_event("points", event) if event else SSE_HEARTBEAT
+    finally:
+        # クライアントが切断した場合も購読を解除する
+        location_pubsub.unsubscribe(subscription)
+        logging.info("位置情報の購読を終了しました: user_id=%s", user_id)
+
+def validate_subscribe_user_ids(user_id, user_ids_str):
+    """購読するユーザーIDのリストを返す（省略時は自分、許可されていない場合はNone）"""
+    if user_ids_str is None:
+        return [str(user_id)]
+    user_ids = validate_user_ids(user_ids_str, Config.LOCATION_STREAM_MAX_USERS)
+    # 他のユーザーの位置情報は設定で許可されている場合のみ購読できる
+    if not Config.LOCATION_STREAM_OTHER_USERS and any(other != user_id for other in user_ids):
+        return None
+    return user_ids
+
+async def subscribe_points(request):
+    """位置情報の更新をServer-Sent Eventsで受信する"""
+    try:
+        current_user = get_current_user(request)
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return _error("認証が必要です", "UNAUTHORIZED", 401)
+
+        user_id = current_user['user_id']
+        user_ids = validate_subscribe_user_ids(user_id, request.query_params.get('user_ids'))
+        if user_ids is None:
+            logging.warning("他のユーザーの位置情報の購読は許可されていません: user_id=%s", user_id)
+            return _error("他のユーザーの位置情報の購読は許可されていません", "FORBIDDEN", 403)
+
+        try:
+            subscription = location_pubsub.subscribe(
+                AsyncSubscription(user_ids, Config.LOCATION_STREAM_QUEUE_SIZE, asyncio.get_running_loop())
+            )
+        except SubscriberLimitExceeded as e:
+            logging.warning("位置情報の購読を受け付けられません: user_id=%s, %s", user_id, e)
+            return _error(
+                "購読者数が上限に達しています。しばらくしてから再接続してください", "SUBSCRIBER_LIMIT_EXCEEDED", 503
+            )
+
+        logging.info("位置情報の購読を開始しました: user_id=%s, 対象=%s", user_id, user_ids)
+        return StreamingResponse(
+            _stream_events(subscription, user_id, current_user.get('exp')),
+            media_type='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return _error(e.message, e.error_code, 400)
+
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return _error("内部サーバーエラーが発生しました", "INTERNAL_SERVER_ERROR", 500)
+
+async def register_token(request):
+    try:
+        if _mimetype(request) != 'application/json':
+            logging.warning("リクエストがJSON形式ではありません")
+            return _error("リクエストはJSON形式である必要があります", "INVALID_FORMAT", 400)
+
+        try:
+            data = await request.json()
+        except ValueError:
+            raise ValidationError("リクエストは有効なJSONである必要があります", "INVALID_FORMAT")
+        if not isinstance(data, dict):
+            raise ValidationError("リクエストデータはJSONオブジェクトである必要があります", "INVALID_FORMAT")
+        logging.info("トークン登録リクエスト受信: user_id=%s, platform=%s", data.get('user_id'), data.get('platform'))
+
+        validate_register_token_request(data)
+
+        await AsyncDeviceToken.save(DeviceToken(
+            user_id=data['user_id'],
+            device_token=data['device_token'],
+            platform=data['platform'].lower(),
+            device_info=data.get('device_info')
+        ))
+
+        logging.info("トークン登録成功: user_id=%s, platform=%s", data['user_id'], data['platform'])
+        return JSONResponse({
+            "status": "success",
+            "message": "トークンが登録されました"
+        })
+
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return _error(e.message, e.error_code, 400)
+
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return _error("内部サーバーエラーが発生しました", "INTERNAL_SERVER_ERROR", 500)
+
+async def health_check(request):
+    return JSONResponse({
+        "status": "success",
+        "message": "サービスは正常に動作しています",
+        "database_pool": async_db.get_pool_stats(),
+        "token_cache": token_cache.get_stats(),
+        "device_token_cache": lookup_cache.get_stats(),
+        "latest_location_cache": latest_cache.get_stats(),
+        "points_response_cache": response_cache.get_stats(),
+        "location_stream": location_pubsub.get_stats()
+    })
+
+routes = [
+    Route('/points', upload_points, methods=['POST']),
+    Route('/points', get_points, methods=['GET']),
+    Route('/points/subscribe', subscribe_points, methods=['GET']),
+    Route('/api/register-token', register_token, methods=['POST']),
+    Route('/api/health', health_check, methods=['GET'])
+]
@@ -1,12 +1,44 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+import hashlib
+import json
 import logging
-from datetime import datetime
-from utils.validators import ValidationError, validate_points_upload_request, validate_points_get_request
+import numpy as np
+from utils.validators import (
+    ValidationError, validate_points_upload_request, validate_points_get_request,
+    validate_limit, validate_simplify_request, validate_idempotency_key, validate_point_arrays,
+    validate_spatial_request, validate_user_ids, validate_summary_request
+)
+from utils.binary_points import BINARY_CONTENT_TYPES, decompress_body, decode_binary_points
+from utils.columnar_export import get_export_format, encode_export
+from utils.pagination import encode_cursor, decode_cursor
+from utils.simplify import simplify_track
+from utils.geo import haversine_m
+from utils.cache import TTLCache
+from utils.metrics import validation_duration
+from utils.conditional import ConditionalPoints, points_response_type, response_variant
+from config import Config
+from services.ingest_queue import ingest_queue, IngestQueueFull
 from utils.auth import verify_token
 from database import db
+from models.location_point import LocationPoint
+from models.latest_location import LatestLocation
+from models.ingest_watermark import IngestWatermark
+from models.daily_rollup import DailyRollup
 
 location_bp = Blueprint('location', __name__)
 
+# ストリーミング時に1回で書き出すポイント数
+STREAM_CHUNK_SIZE = 500
+
+# cursorのみ指定された場合のページサイズ
+DEFAULT_PAGE_LIMIT = 100
+
+# 空間検索でlimitを省略した場合の件数
+DEFAULT_SEARCH_LIMIT = 1000
+
+# Idempotency-Keyごとのアップロード結果（再送時に同じレスポンスを返す）
+idempotency_cache = TTLCache(Config.IDEMPOTENCY_CACHE_SIZE, Config.IDEMPOTENCY_TTL)
+
 def get_current_user():
     """Authorization headerからJWTトークンを取得してユーザー情報を返す"""
     auth_header = request.headers.get('Authorization')
@@ -19,6 +51,26 @@ def get_current_user():
     token = auth_header.split(' ')[1]
     return verify_token(token)
 
+def parse_points_body(user_id, mimetype, content_encoding, body):
+    """アップロードされたボディ（JSONまたはバイナリ形式、gzip/zstd圧縮に対応）を検証して保存用の行に変換する"""
+    if mimetype in BINARY_CONTENT_TYPES:
+        with validation_duration.time(format="binary"):
+            payload = decompress_body(body, content_encoding)
+            latitudes, longitudes, timestamps_ms = decode_binary_points(payload, mimetype)
+            validate_point_arrays(latitudes, longitudes, timestamps_ms)
+            return LocationPoint.columns_to_rows(user_id, latitudes, longitudes, timestamps_ms)
+    
+    if mimetype == 'application/json' or mimetype.endswith('+json'):
+        with validation_duration.time(format="json"):
+            try:
+                data = json.loads(decompress_body(body, content_encoding))
+            except ValueError:
+                raise ValidationError("リクエストは有効なJSONである必要があります", "INVALID_FORMAT")
+            validate_points_upload_request(data)
+            return LocationPoint.to_rows(user_id, data['points'])
+    
+    raise ValidationError("リクエストはJSON形式またはバイナリ形式である必要があります", "INVALID_FORMAT")
+
 @location_bp.route('/points', methods=['POST'])
 def upload_points():
     """位置情報を一括アップロードする"""
@@ -34,62 +86,78 @@ def upload_points():
             }), 401
         
         user_id = current_user['user_id']
-        logging.info(f"位置情報アップロード開始: user_id={user_id}")
+        logging.info("位置情報アップロード開始: user_id=%s", user_id)
         
-        # リクエストデータの検証
-        if not request.is_json:
-            logging.warning("リクエストがJSON形式ではありません")
-            return jsonify({
-                "status": "error",
-                "message": "リクエストはJSON形式である必要があります",
-                "error_code": "INVALID_FORMAT"
-            }), 400
-        
-        data = request.get_json()
-        
-        # バリデーション
-        validate_points_upload_request(data)
-        points = data['points']
+        # Idempotency-Keyが指定され、同じキーの結果が残っていれば再処理せずに返す
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None:
+            validate_idempotency_key(idempotency_key)
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            hit, stored = idempotency_cache.get((user_id, idempotency_key))
+            if hit:
+                if stored['fingerprint'] != fingerprint:
+                    logging.warning("Idempotency-Keyが異なるリクエストで再利用されました: user_id=%s", user_id)
+                    return jsonify({
+                        "status": "error",
+                        "message": "Idempotency-Keyは別のリクエストで使用済みです",
+                        "error_code": "IDEMPOTENCY_KEY_REUSED"
+                    }), 422
+                logging.info("位置情報アップロード再送: user_id=%s, 前回の結果を返します", user_id)
+                return jsonify(stored['body']), stored['status'], {"Idempotent-Replayed": "true"}
         
-        # データベースに保存
-        cursor = db.get_cursor()
-        if not cursor:
-            raise Exception("データベース接続に失敗しました")
+        # リクエストデータの読み込みとバリデーション（JSONまたはバイナリ形式、gzip/zstd圧縮に対応）
+        rows = parse_points_body(
+            user_id, request.mimetype, request.headers.get('Content-Encoding'), request.get_data()
+        )
         
-        insert_query = """
-            INSERT INTO app_locations (user_id, latitude, longitude, timestamp)
-            VALUES (%s, %s, %s, %s)
-        """
-        
-        saved_count = 0
-        for point in points:
+        # 非同期書き込みモード（キューに積んで202を返す）
+        if Config.ASYNC_INGEST_ENABLED and request.args.get('async', '').lower() == 'true':
             try:
-                cursor.execute(insert_query, (
-                    user_id,
-                    point['latitude'],
-                    point['longitude'],
-                    point['parsed_timestamp']
-                ))
-                saved_count += 1
-            except Exception as e:
-                logging.error(f"位置情報の保存に失敗: {e}")
-                # 個別のポイント保存失敗は警告レベルで記録し、処理を継続
-                continue
+                ingest_id = ingest_queue.submit_rows(user_id, rows)
+            except IngestQueueFull:
+                logging.warning("非同期書き込みキューが満杯です: user_id=%s", user_id)
+                return jsonify({
+                    "status": "error",
+                    "message": "混雑しているため受け付けできませんでした。しばらくしてから再試行してください",
+                    "error_code": "INGEST_QUEUE_FULL"
+                }), 429, {"Retry-After": "1"}
+            
+            logging.info("位置情報アップロード受付: user_id=%s, ingest_id=%s, 件数=%s", user_id, ingest_id, len(rows))
+            
+            body = {
+                "status": "accepted",
+                "message": f"{len(rows)}件の位置情報を受け付けました",
+                "ingest_id": ingest_id,
+                "total_count": len(rows),
+                "status_url": f"/points/ingest/{ingest_id}"
+            }
+            if idempotency_key is not None:
+                idempotency_cache.set((user_id, idempotency_key), {"fingerprint": fingerprint, "body": body, "status": 202})
+            return jsonify(body), 202
         
-        db.commit()
-        cursor.close()
+        # データベースに一括保存（重複するポイントは保存されない）
+        result = LocationPoint.save_batches([rows])[0]
+        saved_count = result['saved_count']
         
-        logging.info(f"位置情報アップロード完了: user_id={user_id}, 保存件数={saved_count}/{len(points)}")
+        logging.info(
+            "位置情報アップロード完了: user_id=%s, 保存件数=%s/%s, 重複件数=%s",
+            user_id, saved_count, len(rows), result['duplicate_count']
+        )
         
-        return jsonify({
+        body = {
             "status": "success",
             "message": f"{saved_count}件の位置情報を保存しました",
             "saved_count": saved_count,
-            "total_count": len(points)
-        }), 201
+            "duplicate_count": result['duplicate_count'],
+            "total_count": len(rows),
+            "failed_points": result['failed_points']
+        }
+        if idempotency_key is not None:
+            idempotency_cache.set((user_id, idempotency_key), {"fingerprint": fingerprint, "body": body, "status": 201})
+        return jsonify(body), 201
         
     except ValidationError as e:
-        logging.warning(f"バリデーションエラー: {e.message}")
+        logging.warning("バリデーションエラー: %s", e.message)
         return jsonify({
             "status": "error",
             "message": e.message,
@@ -97,7 +165,7 @@ def upload_points():
         }), 400
         
     except Exception as e:
-        logging.error(f"サーバーエラー: {str(e)}")
+        logging.error("サーバーエラー: %s", e)
         db.rollback()
         return jsonify({
             "status": "error",
@@ -105,6 +173,158 @@ def upload_points():
             "error_code": "INTERNAL_SERVER_ERROR"
         }), 500
 
+@location_bp.route('/points/ingest/<ingest_id>', methods=['GET'])
+def get_ingest_status(ingest_id):
+    """非同期アップロードの処理状況を取得する"""
+    current_user = get_current_user()
+    if not current_user:
+        logging.warning("認証に失敗しました")
+        return jsonify({
+            "status": "error",
+            "message": "認証が必要です",
+            "error_code": "UNAUTHORIZED"
+        }), 401
+    
+    ingest_status = ingest_queue.get_status(ingest_id)
+    if not ingest_status or ingest_status['user_id'] != current_user['user_id']:
+        return jsonify({
+            "status": "error",
+            "message": "指定されたingest_idは見つかりません",
+            "error_code": "INGEST_NOT_FOUND"
+        }), 404
+    
+    ingest_status.pop('user_id')
+    return jsonify(ingest_status), 200
+
+def _stream_points_json(rows, user_id, start_time, end_time):
+    """位置情報をJSON形式（通常レスポンスと同じ構造）で少しずつ出力する"""
+    count = 0
+    chunk = []
+    yield '{"points": ['
+    try:
+        for row in rows:
+            prefix = ', ' if count else ''
+            chunk.append(prefix + json.dumps(LocationPoint.to_dict(row)))
+            count += 1
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
+    except Exception as e:
+        # ヘッダー送信後はステータスを変更できないため、ログに記録して出力を打ち切る
+        logging.error("位置情報ストリーミングエラー: user_id=%s, %s", user_id, e)
+        return
+    yield '], ' + json.dumps({
+        "count": count,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat()
+    })[1:]
+    logging.info("位置情報取得完了（ストリーミング）: user_id=%s, 取得件数=%s", user_id, count)
+
+def _stream_points_ndjson(rows, user_id):
+    """位置情報をNDJSON形式（1行1ポイント）で少しずつ出力する"""
+    count = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(json.dumps(LocationPoint.to_dict(row)) + '\n')
+            count += 1
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
+    except Exception as e:
+        logging.error("位置情報ストリーミングエラー: user_id=%s, %s", user_id, e)
+        return
+    logging.info("位置情報取得完了（NDJSON）: user_id=%s, 取得件数=%s", user_id, count)
+
+def _set_validators(response, conditional):
+    response.headers.update(conditional.headers())
+    return response
+
+def _points_response(user_id, start_time, end_time):
+    """GET /pointsのレスポンスを作成する（簡略化・ページネーション・ストリーミング・通常）"""
+    # 簡略化モード（ページネーション・ストリーミングとは併用不可）
+    simplify_mode = request.args.get('simplify')
+    if simplify_mode is not None:
+        if request.args.get('limit') is not None or request.args.get('cursor') is not None \
+                or request.args.get('stream', '').lower() == 'true':
+            raise ValidationError("simplifyはlimit・cursor・streamと同時に指定できません", "PARAMETER_CONFLICT")
+        
+        params = validate_simplify_request(
+            simplify_mode,
+            request.args.get('tolerance'),
+            request.args.get('max_points'),
+            request.args.get('bucket'),
+            Config.SIMPLIFY_MAX_POINTS
+        )
+        
+        rows = LocationPoint.get_range(user_id, start_time, end_time)
+        simplified = simplify_track(rows, **params)
+        points = [LocationPoint.to_dict(row) for row in simplified]
+        
+        logging.info("位置情報取得完了（簡略化）: user_id=%s, 取得件数=%s/%s", user_id, len(points), len(rows))
+        
+        return jsonify({
+            "points": points,
+            "count": len(points),
+            "original_count": len(rows),
+            "simplify": params,
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat()
+        })
+    
+    # キーセットページネーション（limitまたはcursorが指定された場合）
+    limit_str = request.args.get('limit')
+    cursor_str = request.args.get('cursor')
+    if limit_str is not None or cursor_str is not None:
+        limit = validate_limit(limit_str if limit_str is not None else DEFAULT_PAGE_LIMIT)
+        after = decode_cursor(cursor_str) if cursor_str else None
+        
+        rows, next_key = LocationPoint.get_page(user_id, start_time, end_time, limit, after)
+        points = [LocationPoint.to_dict(row) for row in rows]
+        
+        logging.info("位置情報取得完了（ページ）: user_id=%s, 取得件数=%s", user_id, len(points))
+        
+        return jsonify({
+            "points": points,
+            "count": len(points),
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "limit": limit,
+            "next_cursor": encode_cursor(*next_key) if next_key else None
+        })
+    
+    # ストリーミングモードの判定（NDJSONを要求された場合は常にストリーミング）
+    if points_response_type(request.headers.get('Accept')) == 'application/x-ndjson':
+        rows = LocationPoint.iter_range(user_id, start_time, end_time)
+        return Response(
+            stream_with_context(_stream_points_ndjson(rows, user_id)),
+            mimetype='application/x-ndjson'
+        )
+    
+    if request.args.get('stream', '').lower() == 'true':
+        rows = LocationPoint.iter_range(user_id, start_time, end_time)
+        return Response(
+            stream_with_context(_stream_points_json(rows, user_id, start_time, end_time)),
+            mimetype='application/json'
+        )
+    
+    # データベースから取得
+    rows = LocationPoint.get_range(user_id, start_time, end_time)
+    
+    # レスポンス用のデータ形式に変換
+    points = [LocationPoint.to_dict(row) for row in rows]
+    
+    logging.info("位置情報取得完了: user_id=%s, 取得件数=%s", user_id, len(points))
+    
+    return jsonify({
+        "points": points,
+        "count": len(points),
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat()
+    })
+
 @location_bp.route('/points', methods=['GET'])
 def get_points():
     """指定範囲の位置情報を取得する"""
@@ -135,47 +355,269 @@ def get_points():
         # バリデーション
         start_time, end_time = validate_points_get_request(start_time_str, end_time_str)
         
-        logging.info(f"位置情報取得: user_id={user_id}, 期間={start_time} - {end_time}")
+        logging.info("位置情報取得: user_id=%s, 期間=%s - %s", user_id, start_time, end_time)
         
-        # データベースから取得
-        cursor = db.get_cursor()
-        if not cursor:
-            raise Exception("データベース接続に失敗しました")
+        # 条件付きGETと期間が終了したレスポンスのキャッシュ（ASGIモードと共通）
+        watermark = IngestWatermark.get(user_id, start_time, end_time)
+        conditional = ConditionalPoints(
+            user_id, start_time, end_time,
+            response_variant(request.args.items(multi=True), request.headers.get('Accept')),
+            watermark
+        )
         
-        query = """
-            SELECT latitude, longitude, timestamp
-            FROM app_locations
-            WHERE user_id = %s 
-            AND timestamp >= %s 
-            AND timestamp < %s
-            ORDER BY timestamp ASC
-        """
+        if conditional.not_modified(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+            logging.info("位置情報取得（未変更）: user_id=%s", user_id)
+            return _set_validators(Response(status=304), conditional)
         
-        cursor.execute(query, (user_id, start_time, end_time))
-        rows = cursor.fetchall()
+        cached = conditional.cached()
+        if cached:
+            logging.info("位置情報取得完了（キャッシュ）: user_id=%s", user_id)
+            return _set_validators(Response(cached['body'], mimetype=cached['mimetype']), conditional)
         
-        # レスポンス用のデータ形式に変換
-        points = []
-        for row in rows:
-            points.append({
-                "latitude": float(row['latitude']),
-                "longitude": float(row['longitude']),
-                "timestamp": row['timestamp'].isoformat()
-            })
+        response = _points_response(user_id, start_time, end_time)
+        if not response.is_streamed:
+            conditional.store(response.get_data(), response.mimetype)
+        return _set_validators(response, conditional)
         
-        cursor.close()
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return jsonify({
+            "status": "error",
+            "message": e.message,
+            "error_code": e.error_code
+        }), 400
         
-        logging.info(f"位置情報取得完了: user_id={user_id}, 取得件数={len(points)}")
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return jsonify({
+            "status": "error",
+            "message": "内部サーバーエラーが発生しました",
+            "error_code": "INTERNAL_SERVER_ERROR"
+        }), 500
+
+@location_bp.route('/points/export', methods=['GET'])
+def export_points():
+    """指定範囲の位置情報を列指向のバイナリ形式（delta / arrow / parquet）でエクスポートする"""
+    try:
+        # 認証チェック
+        current_user = get_current_user()
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return jsonify({
+                "status": "error",
+                "message": "認証が必要です",
+                "error_code": "UNAUTHORIZED"
+            }), 401
+        
+        user_id = current_user['user_id']
+        
+        start_time_str = request.args.get('start_time')
+        end_time_str = request.args.get('end_time')
+        
+        if not start_time_str or not end_time_str:
+            return jsonify({
+                "status": "error",
+                "message": "start_timeとend_timeパラメータは必須です",
+                "error_code": "MISSING_PARAMETERS"
+            }), 400
         
+        # バリデーション（エクスポートは通常の取得より長い期間を指定できる）
+        start_time, end_time = validate_points_get_request(
+            start_time_str, end_time_str, max_days=Config.LOCATION_EXPORT_MAX_DAYS
+        )
+        format_name = request.args.get('format', 'delta')
+        content_type, extension = get_export_format(format_name)
+        
+        logging.info("位置情報エクスポート: user_id=%s, 形式=%s, 期間=%s - %s", user_id, format_name, start_time, end_time)
+        
+        # 列ごとの配列で取得し、そのままエンコードする
+        timestamps_ms, latitudes, longitudes = LocationPoint.get_columns(user_id, start_time, end_time)
+        payload = encode_export(format_name, timestamps_ms, latitudes, longitudes)
+        
+        logging.info(
+            "位置情報エクスポート完了: user_id=%s, 取得件数=%s, サイズ=%sバイト",
+            user_id, len(timestamps_ms), len(payload)
+        )
+        
+        filename = f"points_{start_time:%Y%m%d}_{end_time:%Y%m%d}.{extension}"
+        return Response(payload, mimetype=content_type, headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Point-Count": str(len(timestamps_ms))
+        })
+        
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return jsonify({
+            "status": "error",
+            "message": e.message,
+            "error_code": e.error_code
+        }), 400
+        
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
         return jsonify({
+            "status": "error",
+            "message": "内部サーバーエラーが発生しました",
+            "error_code": "INTERNAL_SERVER_ERROR"
+        }), 500
+
+@location_bp.route('/points/search', methods=['GET'])
+def search_points():
+    """範囲（bboxまたは中心と半径）と期間を指定して位置情報を検索する"""
+    try:
+        # 認証チェック
+        current_user = get_current_user()
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return jsonify({
+                "status": "error",
+                "message": "認証が必要です",
+                "error_code": "UNAUTHORIZED"
+            }), 401
+        
+        user_id = current_user['user_id']
+        
+        start_time_str = request.args.get('start_time')
+        end_time_str = request.args.get('end_time')
+        
+        if not start_time_str or not end_time_str:
+            return jsonify({
+                "status": "error",
+                "message": "start_timeとend_timeパラメータは必須です",
+                "error_code": "MISSING_PARAMETERS"
+            }), 400
+        
+        start_time, end_time = validate_points_get_request(start_time_str, end_time_str)
+        area = validate_spatial_request(
+            request.args.get('bbox'), request.args.get('lat'), request.args.get('lon'),
+            request.args.get('radius'), Config.SPATIAL_QUERY_MAX_RADIUS_M
+        )
+        limit = validate_limit(
+            request.args.get('limit', DEFAULT_SEARCH_LIMIT), max_limit=Config.SPATIAL_QUERY_MAX_RESULTS
+        )
+        
+        # 他のユーザーの位置情報は設定で許可されている場合のみ検索できる
+        scope = request.args.get('scope', 'self')
+        if scope not in ('self', 'all'):
+            raise ValidationError("scopeはselfまたはallである必要があります", "SCOPE_INVALID")
+        if scope == 'all' and not Config.SPATIAL_QUERY_ALL_USERS:
+            logging.warning("全ユーザーの空間検索は許可されていません: user_id=%s", user_id)
+            return jsonify({
+                "status": "error",
+                "message": "全ユーザーを対象にした検索は許可されていません",
+                "error_code": "FORBIDDEN"
+            }), 403
+        
+        logging.info("位置情報空間検索: user_id=%s, scope=%s, 範囲=%s, 期間=%s - %s", user_id, scope, area, start_time, end_time)
+        
+        # 半径指定の場合はbboxの候補を取得してから距離で絞り込む
+        center = area['center']
+        max_rows = Config.SPATIAL_QUERY_MAX_CANDIDATES if center else limit
+        rows = LocationPoint.get_area(
+            area['bbox'], start_time, end_time, max_rows + 1, None if scope == 'all' else user_id
+        )
+        truncated = len(rows) > max_rows
+        rows = rows[:max_rows]
+        candidate_count = len(rows)
+        
+        distances = None
+        if center:
+            latitudes = np.fromiter((row['latitude'] for row in rows), dtype=np.float64, count=len(rows))
+            longitudes = np.fromiter((row['longitude'] for row in rows), dtype=np.float64, count=len(rows))
+            distances = haversine_m(center[0], center[1], latitudes, longitudes)
+            hits = np.flatnonzero(distances <= area['radius_m'])
+            if len(hits) > limit:
+                hits = hits[:limit]
+                truncated = True
+            rows = [rows[i] for i in hits.tolist()]
+            distances = distances[hits].tolist()
+        
+        points = []
+        for i, row in enumerate(rows):
+            point = LocationPoint.to_dict(row)
+            if scope == 'all':
+                point['user_id'] = str(row['user_id'])
+            if distances is not None:
+                point['distance_m'] = round(distances[i], 2)
+            points.append(point)
+        
+        logging.info(
+            "位置情報空間検索完了: user_id=%s, 候補件数=%s, 取得件数=%s, truncated=%s",
+            user_id, candidate_count, len(points), truncated
+        )
+        
+        response = {
             "points": points,
             "count": len(points),
+            "truncated": truncated,
+            "bbox": [area['bbox'][1], area['bbox'][0], area['bbox'][3], area['bbox'][2]],
             "start_time": start_time.isoformat(),
             "end_time": end_time.isoformat()
-        }), 200
+        }
+        if center:
+            response["center"] = {"latitude": center[0], "longitude": center[1]}
+            response["radius_m"] = area['radius_m']
+        return jsonify(response)
+        
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return jsonify({
+            "status": "error",
+            "message": e.message,
+            "error_code": e.error_code
+        }), 400
+        
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return jsonify({
+            "status": "error",
+            "message": "内部サーバーエラーが発生しました",
+            "error_code": "INTERNAL_SERVER_ERROR"
+        }), 500
+
+@location_bp.route('/points/latest', methods=['GET'])
+def get_latest_points():
+    """1人または複数ユーザーの最新の位置情報を取得する"""
+    try:
+        # 認証チェック
+        current_user = get_current_user()
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return jsonify({
+                "status": "error",
+                "message": "認証が必要です",
+                "error_code": "UNAUTHORIZED"
+            }), 401
+        
+        user_id = current_user['user_id']
+        
+        user_ids_str = request.args.get('user_ids')
+        if user_ids_str is None:
+            user_ids = [user_id]
+        else:
+            user_ids = validate_user_ids(user_ids_str, Config.LATEST_LOCATION_MAX_USERS)
+            # 他のユーザーの位置情報は設定で許可されている場合のみ取得できる
+            if not Config.LATEST_LOCATION_OTHER_USERS and any(other != user_id for other in user_ids):
+                logging.warning("他のユーザーの最新位置情報の取得は許可されていません: user_id=%s", user_id)
+                return jsonify({
+                    "status": "error",
+                    "message": "他のユーザーの位置情報の取得は許可されていません",
+                    "error_code": "FORBIDDEN"
+                }), 403
+        
+        locations = LatestLocation.get_many(user_ids)
+        found = [locations[uid] for uid in user_ids if locations[uid] is not None]
+        
+        logging.info("最新位置情報取得: user_id=%s, 指定件数=%s, 取得件数=%s", user_id, len(user_ids), len(found))
+        
+        return jsonify({
+            "locations": found,
+            "count": len(found),
+            "not_found": [uid for uid in user_ids if locations[uid] is None]
+        })
         
     except ValidationError as e:
-        logging.warning(f"バリデーションエラー: {e.message}")
+        logging.warning("バリデーションエラー: %s", e.message)
         return jsonify({
             "status": "error",
             "message": e.message,
@@ -183,9 +625,79 @@ def get_points():
         }), 400
         
     except Exception as e:
-        logging.error(f"サーバーエラー: {str(e)}")
+        logging.error("サーバーエラー: %s", e)
         return jsonify({
             "status": "error",
             "message": "内部サーバーエラーが発生しました",
             "error_code": "INTERNAL_SERVER_ERROR"
-        }), 500
\ No newline at end of file
+        }), 500
+
+@location_bp.route('/points/summary', methods=['GET'])
+def get_points_summary():
+    """日ごとの移動距離・移動時間・滞在・点数を取得する（集計テーブルのみを参照する）"""
+    try:
+        # 認証チェック
+        current_user = get_current_user()
+        if not current_user:
+            logging.warning("認証に失敗しました")
+            return jsonify({
+                "status": "error",
+                "message": "認証が必要です",
+                "error_code": "UNAUTHORIZED"
+            }), 401
+        
+        user_id = current_user['user_id']
+        
+        start_date, end_date = validate_summary_request(
+            request.args.get('start_date'), request.args.get('end_date'), Config.ROLLUP_SUMMARY_MAX_DAYS
+        )
+        include_stays = request.args.get('stays', 'false').lower() == 'true'
+        
+        days = [DailyRollup.to_dict(row, include_stays) for row in DailyRollup.get_range(user_id, start_date, end_date)]
+        totals = {
+            "point_count": sum(day["point_count"] for day in days),
+            "distance_m": round(sum(day["distance_m"] for day in days), 1),
+            "moving_seconds": round(sum(day["moving_seconds"] for day in days), 1),
+            "stay_count": sum(day["stay_count"] for day in days),
+            "stay_seconds": round(sum(day["stay_seconds"] for day in days), 1)
+        }
+        
+        logging.info("日ごとの集計取得: user_id=%s, 期間=%s〜%s, 日数=%s", user_id, start_date, end_date, len(days))
+        
+        return jsonify({
+            "user_id": user_id,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+            "days": days,
+            "totals": totals
+        })
+        
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return jsonify({
+            "status": "error",
+            "message": e.message,
+            "error_code": e.error_code
+        }), 400
+        
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
+        return jsonify({
+            "status": "error",
+            "message": "内部サーバーエラーが発生しました",
+            "error_code": "INTERNAL_SERVER_ERROR"
+        }), 500
+
+@location_bp.route('/points/subscribe', methods=['GET'])
+def subscribe_points():
+    """位置情報の購読（Server-Sent Events）はASGIモードでのみ提供する
+
+    WSGIサーバーでは購読1件ごとにワーカースレッドを占有し、クライアントの切断や
+    受信の遅れも検知できないため、ストリームを開かずに503を返す。
+    """
+    logging.warning("位置情報の購読はASGIモードでのみ提供しています")
+    return jsonify({
+        "status": "error",
+        "message": "位置情報の購読はASGIモード（server.py --interface asgi）でのみ利用できます",
+        "error_code": "STREAMING_UNAVAILABLE"
+    }), 503
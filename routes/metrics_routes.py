@@ -0,0 +1,23 @@
+from flask import Blueprint, Response
+from database import db
+from services.ingest_queue import ingest_queue
+from utils.metrics import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+db_pool_connections = registry.gauge(
+    "db_pool_connections", "コネクションプールの接続数", ("state",)
+)
+ingest_queue_uploads = registry.gauge(
+    "ingest_queue_uploads", "非同期書き込みキューに積まれているアップロード数"
+)
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus形式のメトリクスを返す"""
+    pool_stats = db.get_pool_stats()
+    db_pool_connections.set(pool_stats['in_use'], state="in_use")
+    db_pool_connections.set(pool_stats['available'], state="available")
+    ingest_queue_uploads.set(ingest_queue.get_stats()['queued_uploads'])
+    
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,7 +1,12 @@
 from flask import Blueprint, request, jsonify
 import logging
-from utils.validators import validate_register_token_request, ValidationError
-from models.device_token import DeviceToken
+from utils.validators import validate_register_token_request, validate_register_tokens_request, ValidationError
+from models.device_token import DeviceToken, lookup_cache
+from models.latest_location import latest_cache
+from models.ingest_watermark import response_cache
+from services.location_pubsub import location_pubsub
+from database import db
+from utils.auth import token_cache
 
 token_bp = Blueprint('token', __name__)
 
@@ -17,7 +22,7 @@ def register_token():
             }), 400
         
         data = request.get_json()
-        logging.info(f"トークン登録リクエスト受信: user_id={data.get('user_id')}, platform={data.get('platform')}")
+        logging.info("トークン登録リクエスト受信: user_id=%s, platform=%s", data.get('user_id'), data.get('platform'))
         
         validate_register_token_request(data)
         
@@ -30,14 +35,14 @@ def register_token():
         
         result = device_token.save()
         
-        logging.info(f"トークン登録成功: user_id={data['user_id']}, platform={data['platform']}")
+        logging.info("トークン登録成功: user_id=%s, platform=%s", data['user_id'], data['platform'])
         return jsonify({
             "status": "success",
             "message": "トークンが登録されました"
         }), 200
         
     except ValidationError as e:
-        logging.warning(f"バリデーションエラー: {e.message}")
+        logging.warning("バリデーションエラー: %s", e.message)
         return jsonify({
             "status": "error",
             "message": e.message,
@@ -45,7 +50,79 @@ def register_token():
         }), 400
         
     except Exception as e:
-        logging.error(f"サーバーエラー: {str(e)}")
+        logging.error("サーバーエラー: %s", e)
+        return jsonify({
+            "status": "error",
+            "message": "内部サーバーエラーが発生しました",
+            "error_code": "INTERNAL_SERVER_ERROR"
+        }), 500
+
+@token_bp.route('/api/register-tokens', methods=['POST'])
+def register_tokens():
+    """複数のトークンをまとめて登録・更新する"""
+    try:
+        if not request.is_json:
+            logging.warning("リクエストがJSON形式ではありません")
+            return jsonify({
+                "status": "error",
+                "message": "リクエストはJSON形式である必要があります",
+                "error_code": "INVALID_FORMAT"
+            }), 400
+        
+        data = request.get_json()
+        validate_register_tokens_request(data)
+        items = data['tokens']
+        logging.info("トークン一括登録リクエスト受信: 件数=%s", len(items))
+        
+        results = [None] * len(items)
+        valid_indices = []
+        device_tokens = []
+        for i, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError("トークンデータはオブジェクトである必要があります")
+                validate_register_token_request(item)
+            except ValidationError as e:
+                results[i] = {
+                    "index": i,
+                    "status": "error",
+                    "message": e.message,
+                    "error_code": e.error_code
+                }
+                continue
+            
+            valid_indices.append(i)
+            device_tokens.append(DeviceToken(
+                user_id=item['user_id'],
+                device_token=item['device_token'],
+                platform=item['platform'].lower(),
+                device_info=item.get('device_info')
+            ))
+        
+        DeviceToken.save_many(device_tokens)
+        for i in valid_indices:
+            results[i] = {"index": i, "status": "success"}
+        
+        registered_count = len(valid_indices)
+        logging.info("トークン一括登録完了: 成功=%s/%s", registered_count, len(items))
+        return jsonify({
+            "status": "success",
+            "message": f"{registered_count}件のトークンが登録されました",
+            "registered_count": registered_count,
+            "total_count": len(items),
+            "results": results
+        }), 200
+        
+    except ValidationError as e:
+        logging.warning("バリデーションエラー: %s", e.message)
+        return jsonify({
+            "status": "error",
+            "message": e.message,
+            "error_code": e.error_code
+        }), 400
+        
+    except Exception as e:
+        logging.error("サーバーエラー: %s", e)
         return jsonify({
             "status": "error",
             "message": "内部サーバーエラーが発生しました",
@@ -56,5 +133,11 @@ def register_token():
 def health_check():
     return jsonify({
         "status": "success",
-        "message": "サービスは正常に動作しています"
+        "message": "サービスは正常に動作しています",
+        "database_pool": db.get_pool_stats(),
+        "token_cache": token_cache.get_stats(),
+        "device_token_cache": lookup_cache.get_stats(),
+        "latest_location_cache": latest_cache.get_stats(),
+        "points_response_cache": response_cache.get_stats(),
+        "location_stream": location_pubsub.get_stats()
     }), 200
\ No newline at end of file
@@ -0,0 +1,74 @@
+import argparse
+import logging
+from config import Config
+
+# ワーカープロセスごとに読み込むアプリケーション（factory形式）
+APPLICATIONS = {
+    "wsgi": "app:create_app",
+    "asgi": "asgi_app:create_asgi_app"
+}
+
+def run_wsgi(args):
+    """gunicornのgthreadワーカーでFlask版を起動する（アプリケーションはワーカーごとに作成する）"""
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads
+    }
+
+    class FlaskApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(f"{APPLICATIONS['wsgi']}()")
+
+    FlaskApplication().run()
+
+def run_asgi(args):
+    import uvicorn
+
+    uvicorn.run(
+        APPLICATIONS["asgi"],
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        proxy_headers=True,
+        # コネクションプールの作成に失敗した場合に起動を中止する
+        lifespan="on",
+        # ログは各ワーカーでsetup_loggingにより設定する
+        log_config=None
+    )
+
+def main():
+    """本番用のマルチワーカーサーバーを起動する（開発用の app.run の代わり）
+
+    wsgi: gunicorn（gthreadワーカー）でFlask版を起動する
+    asgi: uvicornで非同期版（Starlette + asyncpg）を起動する
+    """
+    parser = argparse.ArgumentParser(description="APIサーバーを起動します")
+    parser.add_argument("--interface", choices=list(APPLICATIONS), default=Config.SERVER_INTERFACE,
+                        help="wsgi: Flask版（gunicornのスレッドワーカー） / asgi: asyncpgを使う非同期版（uvicorn）")
+    parser.add_argument("--host", default=Config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument("--threads", type=int, default=Config.SERVER_THREADS,
+                        help="wsgiモードでのワーカーあたりのスレッド数")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info("APIサーバーを起動しています: interface=%s, workers=%s", args.interface, args.workers)
+    
+    if args.interface == "asgi":
+        run_asgi(args)
+    else:
+        run_wsgi(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from config import Config
+from database import db
+from models.location_point import LocationPoint
+
+class IngestQueueFull(Exception):
+    pass
+
+class IngestQueue:
+    """位置情報アップロードを非同期でまとめて書き込むライトビハインドキュー
+
+    アップロードは有界キューに積まれ、バックグラウンドの書き込みスレッドが
+    複数ユーザー分のアップロードをまとめて1トランザクションで保存する。
+    """
+
+    def __init__(self, max_uploads, batch_max_points, flush_interval, status_retention):
+        self.batch_max_points = batch_max_points
+        self.flush_interval = flush_interval
+        self.status_retention = status_retention
+        self._queue = queue.Queue(maxsize=max_uploads)
+        self._statuses = OrderedDict()
+        self._status_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def start(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+                logging.info("非同期書き込みスレッドを開始しました")
+
+    def stop(self, timeout=30):
+        """新規受付を止め、キューに残っているアップロードを書き込んでから終了する"""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+            if thread.is_alive():
+                logging.warning("非同期書き込みキューのドレインがタイムアウトしました: 残り=%s件", self._queue.qsize())
+            else:
+                logging.info("非同期書き込みキューをドレインしました")
+
+    def submit_rows(self, user_id, rows):
+        """(user_id, latitude, longitude, timestamp) の行をキューに積み、ingest_idを返す（満杯の場合はIngestQueueFull）"""
+        if self._stopping.is_set():
+            raise IngestQueueFull("非同期書き込みキューは停止中です")
+
+        self.start()
+        ingest_id = uuid.uuid4().hex
+        self._set_status(ingest_id, {
+            "ingest_id": ingest_id,
+            "user_id": user_id,
+            "status": "queued",
+            "total_count": len(rows),
+            "queued_at": datetime.now(timezone.utc).isoformat()
+        })
+        try:
+            self._queue.put_nowait((ingest_id, rows))
+        except queue.Full:
+            with self._status_lock:
+                self._statuses.pop(ingest_id, None)
+            raise IngestQueueFull("非同期書き込みキューが満杯です")
+        return ingest_id
+
+    def get_status(self, ingest_id):
+        with self._status_lock:
+            status = self._statuses.get(ingest_id)
+            return dict(status) if status else None
+
+    def get_stats(self):
+        return {
+            "queued_uploads": self._queue.qsize(),
+            "max_uploads": self._queue.maxsize,
+            "running": self._thread is not None and self._thread.is_alive()
+        }
+
+    def _set_status(self, ingest_id, status):
+        with self._status_lock:
+            self._statuses[ingest_id] = status
+            self._statuses.move_to_end(ingest_id)
+            while len(self._statuses) > self.status_retention:
+                self._statuses.popitem(last=False)
+
+    def _update_status(self, ingest_id, **fields):
+        with self._status_lock:
+            status = self._statuses.get(ingest_id)
+            if status is not None:
+                status.update(fields)
+
+    def _next_batch(self):
+        """最初のアップロードを待ち、flush_interval内に届いた分をbatch_max_pointsまでまとめる"""
+        try:
+            first = self._queue.get(timeout=0.5)
+        except queue.Empty:
+            return []
+
+        batch = [first]
+        point_count = len(first[1])
+        deadline = time.monotonic() + self.flush_interval
+        while point_count < self.batch_max_points:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stopping.is_set():
+                    job = self._queue.get_nowait()
+                else:
+                    job = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(job)
+            point_count += len(job[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+            elif self._stopping.is_set():
+                break
+
+    def _write(self, batch):
+        point_count = 0
+        for ingest_id, job_rows in batch:
+            self._update_status(ingest_id, status="writing")
+            point_count += len(job_rows)
+
+        try:
+            results = LocationPoint.save_batches([job_rows for _, job_rows in batch])
+        except Exception as e:
+            logging.error("非同期書き込みエラー: uploads=%s, points=%s, %s", len(batch), point_count, e)
+            for ingest_id, _ in batch:
+                self._update_status(ingest_id, status="failed", message="データベースへの保存に失敗しました")
+            return
+        finally:
+            db.release()
+            for _ in batch:
+                self._queue.task_done()
+
+        completed_at = datetime.now(timezone.utc).isoformat()
+        for (ingest_id, _), result in zip(batch, results):
+            self._update_status(ingest_id, status="completed", completed_at=completed_at, **result)
+
+        saved_count = sum(result["saved_count"] for result in results)
+        logging.info("非同期書き込み完了: uploads=%s, 保存件数=%s/%s", len(batch), saved_count, point_count)
+
+ingest_queue = IngestQueue(
+    Config.INGEST_QUEUE_MAX_UPLOADS,
+    Config.INGEST_BATCH_MAX_POINTS,
+    Config.INGEST_FLUSH_INTERVAL,
+    Config.INGEST_STATUS_RETENTION
+)
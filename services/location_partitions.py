@@ -0,0 +1,353 @@
+import argparse
+import json
+import logging
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2 import sql
+from config import Config
+from database import db
+from utils.geo import GRID_CELL_SQL
+
+TABLE_NAME = "app_locations"
+DEFAULT_PARTITION = "app_locations_default"
+LEGACY_TABLE = "app_locations_legacy"
+COVERING_INDEX = "idx_app_locations_user_time_cover"
+
+# (user_id, timestamp, id) の順で並べ、緯度経度をINCLUDEしてGET /pointsをインデックスのみで処理できるようにする
+CREATE_COVERING_INDEX = f"""
+    CREATE INDEX IF NOT EXISTS {COVERING_INDEX}
+    ON {TABLE_NAME} (user_id, timestamp, id) INCLUDE (latitude, longitude)
+"""
+
+# 空間検索（GET /points/search）用のグリッドセル列とインデックス
+# 生成列なので、どの経路で保存した行でもINSERT時に自動的に値が入る
+GEOCELL_INDEX = "idx_app_locations_geocell_time"
+ADD_GEOCELL_COLUMN = f"""
+    ALTER TABLE {TABLE_NAME}
+    ADD COLUMN IF NOT EXISTS geocell BIGINT GENERATED ALWAYS AS {GRID_CELL_SQL} STORED
+"""
+CREATE_GEOCELL_INDEX = f"""
+    CREATE INDEX IF NOT EXISTS {GEOCELL_INDEX}
+    ON {TABLE_NAME} (geocell, timestamp)
+"""
+
+# パーティションテーブルで作成するインデックス（移行時は旧テーブルの同名のインデックスの名前を変える）
+UNIQUE_INDEX = "uk_app_locations_user_time"
+PARTITIONED_INDEXES = ("pk_app_locations", UNIQUE_INDEX, COVERING_INDEX, GEOCELL_INDEX)
+
+# geocellは生成列のため、行を移動・コピーするときは生成列以外の列を指定する
+COLUMNS = "id, user_id, latitude, longitude, timestamp, created_at"
+
+CREATE_PARTITIONED_TABLE = f"""
+    CREATE TABLE {TABLE_NAME} (
+        id BIGINT NOT NULL DEFAULT nextval('app_locations_id_seq'),
+        user_id UUID NOT NULL,
+        latitude DOUBLE PRECISION NOT NULL,
+        longitude DOUBLE PRECISION NOT NULL,
+        timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        geocell BIGINT GENERATED ALWAYS AS {GRID_CELL_SQL} STORED,
+
+        CONSTRAINT pk_app_locations PRIMARY KEY (id, timestamp),
+        CONSTRAINT {UNIQUE_INDEX} UNIQUE (user_id, timestamp),
+        CONSTRAINT chk_latitude CHECK (latitude >= -90 AND latitude <= 90),
+        CONSTRAINT chk_longitude CHECK (longitude >= -180 AND longitude <= 180)
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(start):
+    return f"{TABLE_NAME}_y{start.year:04d}m{start.month:02d}"
+
+def _list_partitions(cursor):
+    """(パーティション名, 下限) のリストを返す（DEFAULTパーティションは除く）"""
+    cursor.execute("""
+        SELECT child.relname AS name
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s
+    """, (TABLE_NAME,))
+    partitions = []
+    for row in cursor.fetchall():
+        name = row['name']
+        if name == DEFAULT_PARTITION:
+            continue
+        try:
+            start = datetime.strptime(name[len(TABLE_NAME) + 1:], "y%Ym%m").replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        partitions.append((name, start))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def _table_indexes(cursor, table, names):
+    """テーブルのインデックスのうち、namesに含まれるものの名前の集合を返す"""
+    cursor.execute("""
+        SELECT indexname
+        FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s AND indexname = ANY(%s)
+    """, (table, list(names)))
+    return {row['indexname'] for row in cursor.fetchall()}
+
+def _rename_legacy_indexes(cursor):
+    """旧テーブルのインデックスのうち、パーティションテーブルと同じ名前のものを変更する
+
+    インデックス名はスキーマ内で一意のため、名前が残っているとCREATE INDEX IF NOT EXISTSが
+    何もせずに終わり、新しいテーブルにインデックスが作成されない。
+    """
+    for name in sorted(_table_indexes(cursor, LEGACY_TABLE, PARTITIONED_INDEXES)):
+        cursor.execute(sql.SQL("ALTER INDEX {name} RENAME TO {legacy_name}").format(
+            name=sql.Identifier(name),
+            legacy_name=sql.Identifier(name.replace(TABLE_NAME, LEGACY_TABLE, 1))
+        ))
+
+def _create_partition(cursor, start):
+    """1か月分のパーティションを作成する（DEFAULTパーティションに該当期間の行があれば移動する）"""
+    end = add_months(start, 1)
+    name = partition_name(start)
+    cursor.execute("SELECT to_regclass(%s) AS oid", (name,))
+    if cursor.fetchone()['oid'] is not None:
+        return False
+
+    # DEFAULTパーティションに範囲内の行があるとパーティションを作成できないため、一時テーブルに退避する
+    cursor.execute("SELECT to_regclass(%s) AS oid", (DEFAULT_PARTITION,))
+    has_default = cursor.fetchone()['oid'] is not None
+    moved = 0
+    if has_default:
+        cursor.execute(sql.SQL("""
+            CREATE TEMP TABLE partition_moved ON COMMIT DROP AS
+            SELECT * FROM {default} WHERE timestamp >= %s AND timestamp < %s
+        """).format(default=sql.Identifier(DEFAULT_PARTITION)), (start, end))
+        moved = cursor.rowcount
+        if moved:
+            cursor.execute(sql.SQL("DELETE FROM {default} WHERE timestamp >= %s AND timestamp < %s").format(
+                default=sql.Identifier(DEFAULT_PARTITION)
+            ), (start, end))
+
+    cursor.execute(sql.SQL("CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)").format(
+        name=sql.Identifier(name),
+        table=sql.Identifier(TABLE_NAME)
+    ), (start, end))
+
+    if has_default:
+        if moved:
+            cursor.execute(sql.SQL("INSERT INTO {table} ({columns}) SELECT {columns} FROM partition_moved").format(
+                table=sql.Identifier(TABLE_NAME),
+                columns=sql.SQL(COLUMNS)
+            ))
+        cursor.execute("DROP TABLE partition_moved")
+
+    logging.info("パーティションを作成しました: %s, 移動件数=%s", name, moved)
+    return True
+
+def ensure_partitions(months_ahead=None, now=None):
+    """当月から months_ahead か月先までのパーティションと共通インデックスを作成する"""
+    months_ahead = Config.LOCATION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now or datetime.now(timezone.utc))
+
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+
+    try:
+        created = []
+        for offset in range(months_ahead + 1):
+            start = add_months(current, offset)
+            if _create_partition(cursor, start):
+                created.append(partition_name(start))
+        cursor.execute(CREATE_COVERING_INDEX)
+        db.commit()
+        return created
+    except psycopg2.Error as e:
+        db.rollback()
+        logging.error("パーティション作成エラー: %s", e)
+        raise Exception(f"データベースエラー: {e}")
+    finally:
+        cursor.close()
+
+def apply_retention(retention_months=None, mode=None, archive_schema=None, now=None):
+    """保持期間を過ぎたパーティションを削除またはアーカイブ用スキーマへ移動する"""
+    retention_months = Config.LOCATION_RETENTION_MONTHS if retention_months is None else retention_months
+    mode = mode or Config.LOCATION_RETENTION_MODE
+    archive_schema = archive_schema or Config.LOCATION_ARCHIVE_SCHEMA
+    if retention_months <= 0:
+        return []
+
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+
+    try:
+        expired = []
+        for name, start in _list_partitions(cursor):
+            # パーティションの終端が保持期間の開始以前のものだけを対象にする
+            if add_months(start, 1) > cutoff:
+                continue
+            cursor.execute(sql.SQL("ALTER TABLE {table} DETACH PARTITION {name}").format(
+                table=sql.Identifier(TABLE_NAME),
+                name=sql.Identifier(name)
+            ))
+            if mode == "archive":
+                cursor.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {schema}").format(
+                    schema=sql.Identifier(archive_schema)
+                ))
+                cursor.execute(sql.SQL("ALTER TABLE {name} SET SCHEMA {schema}").format(
+                    name=sql.Identifier(name),
+                    schema=sql.Identifier(archive_schema)
+                ))
+            else:
+                cursor.execute(sql.SQL("DROP TABLE {name}").format(name=sql.Identifier(name)))
+            expired.append(name)
+            logging.info("保持期間を過ぎたパーティションを処理しました: %s, mode=%s", name, mode)
+        db.commit()
+        return expired
+    except psycopg2.Error as e:
+        db.rollback()
+        logging.error("パーティション削除エラー: %s", e)
+        raise Exception(f"データベースエラー: {e}")
+    finally:
+        cursor.close()
+
+def migrate_to_partitioned(months_ahead=None, drop_legacy=False):
+    """既存の非パーティションテーブルを月次パーティションテーブルに変換する
+
+    既存テーブルを app_locations_legacy に名前変更し、同じ列構成のパーティションテーブルを作成して
+    月単位で行をコピーする。処理は1トランザクションで行われ、途中で失敗した場合は元に戻る。
+    """
+    months_ahead = Config.LOCATION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+
+    try:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", (TABLE_NAME,))
+        row = cursor.fetchone()
+        if row is None:
+            raise Exception(f"{TABLE_NAME}テーブルが存在しません")
+        if row['relkind'] == 'p':
+            logging.info("%sは既にパーティションテーブルです", TABLE_NAME)
+            return {"migrated": False, "copied": 0}
+
+        cursor.execute(sql.SQL("LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE").format(
+            table=sql.Identifier(TABLE_NAME)
+        ))
+        cursor.execute(sql.SQL("ALTER TABLE {table} RENAME TO {legacy}").format(
+            table=sql.Identifier(TABLE_NAME),
+            legacy=sql.Identifier(LEGACY_TABLE)
+        ))
+        _rename_legacy_indexes(cursor)
+        # シーケンスは新しいテーブルで使い続けるため、旧テーブルとの所有関係を外す
+        cursor.execute("ALTER SEQUENCE app_locations_id_seq OWNED BY NONE")
+        cursor.execute("ALTER SEQUENCE app_locations_id_seq AS BIGINT")
+        cursor.execute(CREATE_PARTITIONED_TABLE)
+        cursor.execute(sql.SQL("CREATE TABLE {default} PARTITION OF {table} DEFAULT").format(
+            default=sql.Identifier(DEFAULT_PARTITION),
+            table=sql.Identifier(TABLE_NAME)
+        ))
+
+        cursor.execute(sql.SQL("SELECT min(timestamp) AS first, max(timestamp) AS last FROM {legacy}").format(
+            legacy=sql.Identifier(LEGACY_TABLE)
+        ))
+        bounds = cursor.fetchone()
+        now = month_start(datetime.now(timezone.utc))
+        first = month_start(bounds['first']) if bounds['first'] else now
+        last = max(month_start(bounds['last']) if bounds['last'] else now, add_months(now, months_ahead))
+
+        copied = 0
+        start = first
+        while start <= last:
+            _create_partition(cursor, start)
+            cursor.execute(sql.SQL("""
+                INSERT INTO {table} ({columns})
+                SELECT {columns}
+                FROM {legacy}
+                WHERE timestamp >= %s AND timestamp < %s
+                ON CONFLICT DO NOTHING
+            """).format(
+                table=sql.Identifier(TABLE_NAME),
+                columns=sql.SQL(COLUMNS),
+                legacy=sql.Identifier(LEGACY_TABLE)
+            ), (start, add_months(start, 1)))
+            copied += cursor.rowcount
+            start = add_months(start, 1)
+
+        cursor.execute(CREATE_COVERING_INDEX)
+        cursor.execute(CREATE_GEOCELL_INDEX)
+        missing = set(PARTITIONED_INDEXES) - _table_indexes(cursor, TABLE_NAME, PARTITIONED_INDEXES)
+        if missing:
+            db.rollback()
+            raise Exception(f"パーティションテーブルにインデックスが作成されませんでした: {', '.join(sorted(missing))}")
+        if drop_legacy:
+            cursor.execute(sql.SQL("DROP TABLE {legacy}").format(legacy=sql.Identifier(LEGACY_TABLE)))
+        db.commit()
+        logging.info("パーティションテーブルへの移行が完了しました: コピー件数=%s", copied)
+        return {"migrated": True, "copied": copied}
+    except psycopg2.Error as e:
+        db.rollback()
+        logging.error("パーティション移行エラー: %s", e)
+        raise Exception(f"データベースエラー: {e}")
+    finally:
+        cursor.close()
+
+def add_geocell():
+    """既存のテーブルに空間検索用のgeocell列とインデックスを追加する（既存の行の値も計算される）"""
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+
+    try:
+        cursor.execute(ADD_GEOCELL_COLUMN)
+        cursor.execute(CREATE_GEOCELL_INDEX)
+        db.commit()
+        logging.info("geocell列とインデックスを追加しました: %s", GEOCELL_INDEX)
+        return {"geocell": True}
+    except psycopg2.Error as e:
+        db.rollback()
+        logging.error("geocell列追加エラー: %s", e)
+        raise Exception(f"データベースエラー: {e}")
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="app_locationsの月次パーティションを管理します")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    maintain = subparsers.add_parser("maintain", help="先のパーティションを作成し、保持期間を過ぎたものを処理する")
+    maintain.add_argument("--months-ahead", type=int)
+    maintain.add_argument("--retention-months", type=int)
+    maintain.add_argument("--mode", choices=["drop", "archive"])
+
+    migrate = subparsers.add_parser("migrate", help="既存テーブルをパーティションテーブルに変換する")
+    migrate.add_argument("--months-ahead", type=int)
+    migrate.add_argument("--drop-legacy", action="store_true", help="移行後に旧テーブルを削除する")
+
+    subparsers.add_parser("geocell", help="空間検索用のgeocell列とインデックスを追加する")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    try:
+        if args.command == "migrate":
+            result = migrate_to_partitioned(args.months_ahead, args.drop_legacy)
+        elif args.command == "geocell":
+            result = add_geocell()
+        else:
+            result = {
+                "created": ensure_partitions(args.months_ahead),
+                "expired": apply_retention(args.retention_months, args.mode)
+            }
+    finally:
+        db.close_all()
+    print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
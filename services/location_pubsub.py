@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+from config import Config
+from utils.metrics import registry
+
+# LISTEN/NOTIFYのチャンネル名と1通知あたりのペイロードの上限（PostgreSQLの上限は8000バイト）
+NOTIFY_CHANNEL = "location_points"
+NOTIFY_QUERY = "SELECT pg_notify(%s, %s)"
+NOTIFY_PAYLOAD_MAX_BYTES = 7500
+
+events_published = registry.counter(
+    "location_stream_events_total", "購読者に配信した位置情報イベントの件数"
+)
+subscribers_dropped = registry.counter(
+    "location_stream_dropped_total", "受信が追いつかず切断した購読者の数"
+)
+
+# Server-Sent Eventsのハートビート（コメント行なのでクライアントのイベントにはならない）
+SSE_HEARTBEAT = ": heartbeat\n\n"
+
+class SubscriberLimitExceeded(Exception):
+    pass
+
+def sse_event(name, data):
+    """Server-Sent Eventsの1イベント分の文字列を作成する"""
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def next_timeout(heartbeat, expires_at):
+    """次のハートビートまたはトークンの有効期限までの秒数を返す（期限切れの場合は0）"""
+    if expires_at is None:
+        return heartbeat
+    return max(min(heartbeat, expires_at - time.time()), 0)
+
+class AsyncSubscription:
+    """1つのストリームの購読（イベントループで受信する、配信は任意のスレッドから行える）
+
+    未送信のイベントがmax_queue件に達した購読者は受信が追いついていないとみなして切断する。
+    """
+
+    def __init__(self, user_ids, max_queue, loop):
+        self.user_ids = frozenset(user_ids)
+        self.dropped = False
+        self._max_queue = max_queue
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def deliver(self, event):
+        with self._lock:
+            if self._pending >= self._max_queue:
+                self.dropped = True
+                return False
+            self._pending += 1
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        except RuntimeError:
+            # イベントループが終了している
+            self.dropped = True
+            return False
+        return True
+
+    async def get(self, timeout):
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        with self._lock:
+            self._pending -= 1
+        return event
+
+class LocationPubSub:
+    """保存した位置情報を購読者に配信するプロセス内のpub/sub
+
+    LOCATION_PUBSUB_NOTIFYが有効な場合は保存と同じトランザクションでpg_notifyを送り、
+    各プロセスのLISTENスレッドが受け取った通知を配信する（複数プロセス構成向け）。
+    """
+
+    def __init__(self, max_subscribers, notify_enabled):
+        self.max_subscribers = max_subscribers
+        self.notify_enabled = notify_enabled
+        self._subscribers = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def subscribe(self, subscription):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise SubscriberLimitExceeded("購読者数が上限に達しています")
+            for user_id in subscription.user_ids:
+                self._subscribers.setdefault(user_id, set()).add(subscription)
+            self._count += 1
+        if self.notify_enabled:
+            self.start_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            removed = False
+            for user_id in subscription.user_ids:
+                subscribers = self._subscribers.get(user_id)
+                if subscribers and subscription in subscribers:
+                    subscribers.discard(subscription)
+                    removed = True
+                    if not subscribers:
+                        del self._subscribers[user_id]
+            if removed:
+                self._count -= 1
+
+    def has_subscribers(self, user_id):
+        return str(user_id) in self._subscribers
+
+    def events_for(self, saved_batches):
+        """新しく保存した行（LocationPoint._insert_rowsが返す行）から配信するイベント {user_id, points} のリストを作成する
+
+        重複として保存されなかった行は配信しない（再送されたアップロードで何も保存されなかった場合はイベントなし）。
+        通知を使わない場合は、このプロセスに購読者がいるユーザーの分だけを作成する。
+        """
+        events = []
+        for rows in saved_batches:
+            if not rows:
+                continue
+            user_id = str(rows[0][0])
+            if not self.notify_enabled and not self.has_subscribers(user_id):
+                continue
+            events.append({
+                "user_id": user_id,
+                "points": [
+                    {"latitude": row[1], "longitude": row[2], "timestamp": row[3].isoformat()}
+                    for row in rows
+                ]
+            })
+        return events
+
+    def notify_payloads(self, events):
+        """イベントをpg_notifyのペイロードの上限に収まるように分割してJSONにする"""
+        payloads = []
+        for event in events:
+            overhead = len(json.dumps({"user_id": event["user_id"], "points": []}))
+            chunk = []
+            size = overhead
+            for point in event["points"]:
+                point_size = len(json.dumps(point)) + 2
+                if chunk and size + point_size > NOTIFY_PAYLOAD_MAX_BYTES:
+                    payloads.append(json.dumps({"user_id": event["user_id"], "points": chunk}))
+                    chunk = []
+                    size = overhead
+                chunk.append(point)
+                size += point_size
+            if chunk:
+                payloads.append(json.dumps({"user_id": event["user_id"], "points": chunk}))
+        return payloads
+
+    def publish(self, events):
+        """イベントをこのプロセスの購読者に配信する（受信が追いつかない購読者は切断する）"""
+        for event in events:
+            with self._lock:
+                subscribers = list(self._subscribers.get(event["user_id"], ()))
+            for subscription in subscribers:
+                if subscription.deliver(event):
+                    events_published.inc()
+                else:
+                    self.unsubscribe(subscription)
+                    subscribers_dropped.inc()
+                    logging.warning("受信が追いつかない購読者を切断しました: user_id=%s", event["user_id"])
+
+    def prepare_publish(self, cursor, saved_batches):
+        """保存処理のコミット前に呼び出す（通知を使う場合は同じトランザクションでpg_notifyを送る）
+
+        戻り値はコミット後にpublishに渡すイベントのリスト（通知を使う場合はLISTEN側で配信するため空）。
+        """
+        events = self.events_for(saved_batches)
+        if not self.notify_enabled:
+            return events
+        for payload in self.notify_payloads(events):
+            cursor.execute(NOTIFY_QUERY, (NOTIFY_CHANNEL, payload))
+        return []
+
+    def start_listener(self):
+        with self._listener_lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="location-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """LISTENで受け取った通知をこのプロセスの購読者に配信する（切断時は再接続する）"""
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(
+                    host=Config.DATABASE_HOST,
+                    port=Config.DATABASE_PORT,
+                    database=Config.DATABASE_NAME,
+                    user=Config.DATABASE_USER,
+                    password=Config.DATABASE_PASSWORD
+                )
+                connection.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                logging.info("位置情報の通知の受信を開始しました: channel=%s", NOTIFY_CHANNEL)
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notify = connection.notifies.pop(0)
+                        try:
+                            self.publish([json.loads(notify.payload)])
+                        except ValueError:
+                            logging.warning("位置情報の通知の形式が不正です")
+            except Exception as e:
+                logging.error("位置情報の通知の受信エラー: %s", e)
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "subscribers": self._count,
+                "users": len(self._subscribers),
+                "max_subscribers": self.max_subscribers,
+                "notify": self.notify_enabled
+            }
+
+location_pubsub = LocationPubSub(Config.LOCATION_STREAM_MAX_SUBSCRIBERS, Config.LOCATION_PUBSUB_NOTIFY)
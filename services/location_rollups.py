@@ -0,0 +1,74 @@
+import argparse
+import json
+import logging
+from datetime import date
+import psycopg2
+from database import db
+from models.daily_rollup import DailyRollup
+
+# 集計対象の (user_id, 日) の一覧（日はUTC）
+DAYS_QUERY = """
+    SELECT DISTINCT user_id, (timestamp AT TIME ZONE 'UTC')::date AS day
+    FROM app_locations
+    WHERE {conditions}
+    ORDER BY user_id, day
+"""
+
+def backfill(user_id=None, start_day=None, end_day=None):
+    """保存済みの位置情報から日ごとの集計を作り直す（両端の日を含む、1日ごとにコミットする）
+
+    集計を導入する前の位置情報や、集計の設定を変更した後の再計算に使用する。
+    """
+    cursor = db.get_cursor()
+    if not cursor:
+        raise Exception("データベース接続に失敗しました")
+
+    conditions = ["TRUE"]
+    params = []
+    if user_id:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+    if start_day:
+        conditions.append("timestamp >= %s")
+        params.append(DailyRollup.day_bounds(start_day)[0])
+    if end_day:
+        conditions.append("timestamp < %s")
+        params.append(DailyRollup.day_bounds(end_day)[1])
+
+    try:
+        cursor.execute(DAYS_QUERY.format(conditions=" AND ".join(conditions)), params)
+        days = [(row['user_id'], row['day']) for row in cursor.fetchall()]
+
+        for key_user, day in days:
+            cursor.execute(DailyRollup.LOCK_QUERY, (DailyRollup.lock_key(key_user, day),))
+            DailyRollup.recompute(cursor, key_user, day)
+            db.commit()
+        logging.info("日ごとの集計を作り直しました: %s日分", len(days))
+        return {"days": len(days)}
+    except psycopg2.Error as e:
+        db.rollback()
+        logging.error("日ごとの集計の作り直しエラー: %s", e)
+        raise Exception(f"データベースエラー: {e}")
+    finally:
+        cursor.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="位置情報の日ごとの集計（user_daily_rollup）を管理します")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser("backfill", help="保存済みの位置情報から日ごとの集計を作り直す")
+    backfill_parser.add_argument("--user-id")
+    backfill_parser.add_argument("--start-date", type=date.fromisoformat, help="YYYY-MM-DD（UTC）")
+    backfill_parser.add_argument("--end-date", type=date.fromisoformat, help="YYYY-MM-DD（UTC、この日を含む）")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    try:
+        result = backfill(args.user_id, args.start_date, args.end_date)
+    finally:
+        db.close_all()
+    print(json.dumps(result, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from config import Config
+from database import db
+from models.device_token import DeviceToken
+from services.token_pruner import DeadTokenCollector
+
+# FCM HTTP v1 APIのOAuth2スコープ
+FCM_SCOPE = "https://www.googleapis.com/auth/firebase.messaging"
+GOOGLE_TOKEN_URI = "https://oauth2.googleapis.com/token"
+JWT_BEARER_GRANT = "urn:ietf:params:oauth:grant-type:jwt-bearer"
+
+# 時間をおいて再送すれば成功する可能性があるHTTPステータス
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class ServiceAccountCredentials:
+    """サービスアカウントの鍵からOAuth2アクセストークンを取得する（JWT Bearer）
+
+    取得したトークンは有効期限のREFRESH_MARGIN秒前まで再利用する。
+    get_token(client) を持つオブジェクトであれば任意の認証情報に差し替えられる。
+    """
+
+    REFRESH_MARGIN = 300
+
+    def __init__(self, info, scope=FCM_SCOPE):
+        self.client_email = info["client_email"]
+        self.private_key = info["private_key"]
+        self.token_uri = info.get("token_uri", GOOGLE_TOKEN_URI)
+        self.project_id = info.get("project_id")
+        self.scope = scope
+        self._token = None
+        self._expires_at = 0
+        self._lock = None
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def invalidate(self):
+        self._token = None
+
+    async def get_token(self, client):
+        if self._token and time.time() < self._expires_at - self.REFRESH_MARGIN:
+            return self._token
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._token and time.time() < self._expires_at - self.REFRESH_MARGIN:
+                return self._token
+            from jose import jwt
+
+            now = int(time.time())
+            assertion = jwt.encode({
+                "iss": self.client_email,
+                "scope": self.scope,
+                "aud": self.token_uri,
+                "iat": now,
+                "exp": now + 3600
+            }, self.private_key, algorithm="RS256")
+            response = await client.post(
+                self.token_uri, data={"grant_type": JWT_BEARER_GRANT, "assertion": assertion}
+            )
+            response.raise_for_status()
+            body = response.json()
+            self._token = body["access_token"]
+            self._expires_at = now + int(body.get("expires_in", 3600))
+            return self._token
+
+def fcm_error_code(response):
+    """FCM HTTP v1 APIのエラーレスポンスからエラーコード（UNREGISTERED など）を取り出す"""
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        return f"HTTP_{response.status_code}"
+    for detail in error.get("details", []):
+        if detail.get("errorCode"):
+            return detail["errorCode"]
+    return error.get("status") or f"HTTP_{response.status_code}"
+
+class FcmHttpTransport:
+    """FCM HTTP v1 API（projects/{project_id}/messages:send）で送信するトランスポート
+
+    v1 APIにはマルチキャストがないため、バッチ内のトークンごとにhttpxのコネクションプールから
+    最大max_connections件を同時に送信する。429・5xx・通信エラーは指数バックオフで再送する
+    （Retry-Afterがあればその秒数待つ）。
+    send_multicast(tokens, message) と close() を持つオブジェクトであれば
+    任意のトランスポートに差し替えられる。
+    """
+
+    def __init__(self, project_id, credentials, max_connections, timeout,
+                 max_retries=3, backoff=0.5, max_backoff=30.0, api_url="https://fcm.googleapis.com"):
+        import httpx
+
+        self.url = f"{api_url.rstrip('/')}/v1/projects/{project_id}/messages:send"
+        self.credentials = credentials
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout
+        )
+        self._semaphore = asyncio.Semaphore(max_connections)
+
+    async def send_multicast(self, tokens, message):
+        """トークンごとの送信結果 {"success": bool, "error": エラーコード} のリストを返す"""
+        return await asyncio.gather(*(self._send_one(token, message) for token in tokens))
+
+    def _retry_delay(self, attempt, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        # 同時に失敗した送信が一斉に再送しないよう揺らぎを加える
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1.0)
+
+    async def _send_one(self, token, message):
+        import httpx
+
+        payload = json.dumps({"message": dict(message, token=token)})
+        error = None
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with self._semaphore:
+                access_token = await self.credentials.get_token(self.client)
+                try:
+                    response = await self.client.post(self.url, content=payload, headers={
+                        "Authorization": f"Bearer {access_token}",
+                        "Content-Type": "application/json"
+                    })
+                except httpx.TransportError as e:
+                    logging.warning("プッシュ通知の送信で通信エラー: %s", e)
+                    error = "UNAVAILABLE"
+
+            if response is not None:
+                if response.status_code == 200:
+                    return {"success": True, "error": None}
+                error = fcm_error_code(response)
+                if response.status_code == 401:
+                    # アクセストークンが失効している場合は取得し直して再送する
+                    self.credentials.invalidate()
+                elif response.status_code not in RETRYABLE_STATUS:
+                    return {"success": False, "error": error}
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(attempt, response))
+        return {"success": False, "error": error}
+
+    async def close(self):
+        await self.client.aclose()
+
+class PushDispatcher:
+    """保存済みトークンに対してプッシュ通知をまとめて送信する
+
+    対象トークンをDBから少しずつ読み出し、batch_size件ずつのマルチキャストに分けて
+    最大concurrency件を同時に送信する。
+    """
+
+    def __init__(self, transport, batch_size=500, concurrency=10, fetch_size=2000):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.fetch_size = fetch_size
+        self.result_handlers = []
+
+    def add_result_handler(self, handler):
+        """バッチごとの送信結果 [(token_row, result), ...] を受け取るハンドラを登録する
+
+        ハンドラはコルーチン関数でもよい。
+        """
+        self.result_handlers.append(handler)
+
+    async def dispatch_async(self, message, user_ids=None, platform=None, updated_since=None):
+        summary = {"batches": 0, "sent": 0, "success": 0, "failure": 0, "errors": {}}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+        tasks = set()
+
+        # DBアクセスは1つのスレッドにまとめ、接続の取得から返却までを同じスレッドで行う
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="push-db") as db_executor:
+            rows = None
+            try:
+                rows = await loop.run_in_executor(
+                    db_executor,
+                    lambda: DeviceToken.iter_tokens(user_ids, platform, updated_since, self.fetch_size)
+                )
+                while True:
+                    batch = await loop.run_in_executor(
+                        db_executor, lambda: list(islice(rows, self.batch_size))
+                    )
+                    if not batch:
+                        break
+
+                    await semaphore.acquire()
+                    task = asyncio.create_task(self._send_batch(batch, message, summary))
+                    task.add_done_callback(lambda _: semaphore.release())
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+
+                if tasks:
+                    await asyncio.gather(*tasks)
+            finally:
+                if rows is not None:
+                    await loop.run_in_executor(db_executor, rows.close)
+                await loop.run_in_executor(db_executor, db.release)
+
+        return summary
+
+    async def _send_batch(self, batch, message, summary):
+        tokens = [row['device_token'] for row in batch]
+        try:
+            results = await self.transport.send_multicast(tokens, message)
+            if len(results) != len(tokens):
+                raise ValueError(f"送信結果の件数が一致しません: {len(results)}/{len(tokens)}")
+        except Exception as e:
+            logging.error("プッシュ通知の送信に失敗: tokens=%s, %s", len(tokens), e)
+            results = [{"success": False, "error": "TRANSPORT_ERROR"}] * len(tokens)
+
+        summary["batches"] += 1
+        summary["sent"] += len(tokens)
+        for result in results:
+            if result["success"]:
+                summary["success"] += 1
+            else:
+                summary["failure"] += 1
+                summary["errors"][result["error"]] = summary["errors"].get(result["error"], 0) + 1
+
+        for handler in self.result_handlers:
+            try:
+                outcome = handler(list(zip(batch, results)))
+                if inspect.isawaitable(outcome):
+                    await outcome
+            except Exception as e:
+                logging.error("送信結果の処理に失敗: %s", e)
+
+    def dispatch(self, message, user_ids=None, platform=None, updated_since=None):
+        return asyncio.run(self._dispatch_and_close(message, user_ids, platform, updated_since))
+
+    async def _dispatch_and_close(self, message, user_ids, platform, updated_since):
+        started = time.monotonic()
+        try:
+            summary = await self.dispatch_async(message, user_ids, platform, updated_since)
+        finally:
+            await self.transport.close()
+        summary["elapsed_seconds"] = round(time.monotonic() - started, 3)
+        logging.info(
+            "プッシュ通知送信完了: 送信数=%s, 成功=%s, 失敗=%s, バッチ数=%s",
+            summary['sent'], summary['success'], summary['failure'], summary['batches']
+        )
+        return summary
+
+def create_dispatcher(transport=None):
+    """設定値からPushDispatcherを作成する（transportを省略した場合はFCMに送信）"""
+    if transport is None:
+        if not Config.FCM_CREDENTIALS_FILE:
+            raise Exception("FCM_CREDENTIALS_FILE（サービスアカウントの鍵ファイル）が設定されていません")
+        credentials = ServiceAccountCredentials.from_file(Config.FCM_CREDENTIALS_FILE)
+        transport = FcmHttpTransport(
+            Config.FCM_PROJECT_ID or credentials.project_id,
+            credentials,
+            Config.PUSH_MAX_CONNECTIONS,
+            Config.PUSH_HTTP_TIMEOUT,
+            max_retries=Config.PUSH_MAX_RETRIES,
+            backoff=Config.PUSH_RETRY_BACKOFF,
+            max_backoff=Config.PUSH_RETRY_MAX_BACKOFF,
+            api_url=Config.FCM_API_URL
+        )
+    return PushDispatcher(
+        transport,
+        batch_size=Config.PUSH_BATCH_SIZE,
+        concurrency=Config.PUSH_CONCURRENCY,
+        fetch_size=Config.PUSH_FETCH_SIZE
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="保存済みトークンにプッシュ通知を送信します")
+    parser.add_argument("--title", required=True)
+    parser.add_argument("--body", required=True)
+    parser.add_argument("--data", help="通知に付与するデータ（JSONオブジェクト）")
+    parser.add_argument("--user-id", action="append", dest="user_ids", help="送信対象のユーザー（複数指定可）")
+    parser.add_argument("--platform", choices=["android", "ios"])
+    parser.add_argument("--updated-since", help="この日時以降に更新されたトークンのみ対象（ISO 8601形式）")
+    parser.add_argument("--no-prune", action="store_true", help="無効なトークンを削除しない")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    message = {"notification": {"title": args.title, "body": args.body}}
+    if args.data:
+        # HTTP v1 APIのdataの値は文字列のみ
+        message["data"] = {
+            key: value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+            for key, value in json.loads(args.data).items()
+        }
+
+    dispatcher = create_dispatcher()
+    collector = None
+    if not args.no_prune:
+        collector = DeadTokenCollector(Config.TOKEN_PRUNE_BATCH_SIZE)
+        dispatcher.add_result_handler(collector.handle_results)
+
+    summary = dispatcher.dispatch(
+        message,
+        user_ids=args.user_ids,
+        platform=args.platform,
+        updated_since=args.updated_since
+    )
+    if collector:
+        collector.flush()
+        summary["pruned_tokens"] = collector.deleted_count
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
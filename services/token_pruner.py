@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from config import Config
+from database import db
+from models.device_token import DeviceToken
+
+# このエラーが返ったトークンは再送しても届かないため削除する
+# （INVALID_ARGUMENTはメッセージ本文の誤りでも返るため対象にしない）
+DEAD_TOKEN_ERRORS = {"UNREGISTERED"}
+
+class DeadTokenCollector:
+    """プッシュ通知の送信結果から無効なトークンを集め、batch_size件ごとにまとめて削除する
+
+    PushDispatcher.add_result_handler(collector.handle_results) で登録して使う。
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.deleted_count = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, token_id, device_token):
+        with self._lock:
+            self._pending.append((token_id, device_token))
+            return len(self._pending) >= self.batch_size
+
+    async def handle_results(self, pairs):
+        should_flush = False
+        for row, result in pairs:
+            if not result["success"] and result["error"] in DEAD_TOKEN_ERRORS:
+                should_flush = self.add(row['id'], row['device_token']) or should_flush
+        if should_flush:
+            # 削除はイベントループを止めないよう別スレッドで行う
+            await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def flush(self):
+        """溜まっている無効なトークンを削除する（呼び出したスレッドの接続は返却される）"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        try:
+            for offset in range(0, len(pending), self.batch_size):
+                deleted = DeviceToken.delete_tokens(pending[offset:offset + self.batch_size])
+                with self._lock:
+                    self.deleted_count += deleted
+        except Exception as e:
+            logging.error("無効なトークンの削除に失敗: 件数=%s, %s", len(pending), e)
+            return 0
+        finally:
+            db.release()
+        return len(pending)
+
+def compact_stale_tokens(horizon_days=None, batch_size=None):
+    """updated_atが保持期間より古いトークンを削除し、削除件数を返す"""
+    horizon_days = Config.TOKEN_STALE_HORIZON_DAYS if horizon_days is None else horizon_days
+    batch_size = batch_size or Config.TOKEN_PRUNE_BATCH_SIZE
+    updated_before = datetime.now(timezone.utc) - timedelta(days=horizon_days)
+    try:
+        return DeviceToken.delete_stale(updated_before, batch_size)
+    finally:
+        db.release()
+
+class TokenCompactor:
+    """古いトークンの削除を一定間隔で実行するバックグラウンドジョブ"""
+
+    def __init__(self, interval_seconds):
+        self.interval_seconds = interval_seconds
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="token-compactor", daemon=True)
+        self._thread.start()
+        logging.info("トークンの定期削除を開始しました: 間隔=%s秒", self.interval_seconds)
+
+    def stop(self):
+        self._stopping.set()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval_seconds):
+            try:
+                compact_stale_tokens()
+            except Exception as e:
+                logging.error("トークンの定期削除に失敗: %s", e)
+
+token_compactor = TokenCompactor(Config.TOKEN_COMPACTION_INTERVAL)
+
+def main():
+    parser = argparse.ArgumentParser(description="更新が途絶えたデバイストークンを削除します")
+    parser.add_argument("--horizon-days", type=int, default=Config.TOKEN_STALE_HORIZON_DAYS,
+                        help="この日数より前から更新されていないトークンを削除する")
+    parser.add_argument("--batch-size", type=int, default=Config.TOKEN_PRUNE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+
+    deleted = compact_stale_tokens(args.horizon_days, args.batch_size)
+    db.close_all()
+    print(json.dumps({"deleted": deleted, "horizon_days": args.horizon_days}))
+
+if __name__ == '__main__':
+    main()
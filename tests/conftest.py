@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# テスト中のログはリポジトリ外に出力する
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "push-notification-api-test.log"))
+
+USER_ID = "123e4567-e89b-12d3-a456-426614174000"
+
+@pytest.fixture
+def app():
+    from app import create_app
+    app = create_app()
+    app.config["TESTING"] = True
+    return app
+
+@pytest.fixture
+def client(app, monkeypatch):
+    """認証済みユーザーとしてリクエストするテストクライアント"""
+    import routes.location_routes as location_routes
+    monkeypatch.setattr(location_routes, "get_current_user", lambda: {"user_id": USER_ID})
+    return app.test_client()
+
+@pytest.fixture
+def asgi_client(monkeypatch):
+    """ASGIモードのアプリケーションに認証済みユーザーとしてリクエストするテストクライアント
+
+    lifespanは実行しないため、asyncpgのコネクションプールは作成されない。
+    """
+    from starlette.testclient import TestClient
+    from asgi_app import create_asgi_app
+    import routes.asgi_routes as asgi_routes
+    monkeypatch.setattr(asgi_routes, "get_current_user", lambda request: {"user_id": USER_ID})
+    return TestClient(create_asgi_app())
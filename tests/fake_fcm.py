@@ -0,0 +1,112 @@
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from jose import jwt
+
+# HTTPステータスとFCM HTTP v1 APIのエラー（status, errorCode）
+FCM_ERRORS = {
+    400: ("INVALID_ARGUMENT", "INVALID_ARGUMENT"),
+    404: ("NOT_FOUND", "UNREGISTERED"),
+    429: ("RESOURCE_EXHAUSTED", "QUOTA_EXCEEDED"),
+    500: ("INTERNAL", "INTERNAL"),
+    503: ("UNAVAILABLE", "UNAVAILABLE")
+}
+
+class FakeFcmServer:
+    """ローカルで動かす疑似FCMサーバー（OAuth2トークンの発行とHTTP v1 APIの送信）
+
+    トークンごとの応答は script[device_token] にHTTPステータスのリストで指定する
+    （先頭から順に使い、最後の値を繰り返す）。"dead-" で始まるトークンは常に404 UNREGISTERED、
+    それ以外は200を返す。429の応答にはRetry-After: 0を付ける。
+    """
+
+    def __init__(self):
+        self.script = {}
+        self.sends = []
+        self.assertions = []
+        self.access_tokens = set()
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def revoke_access_tokens(self):
+        with self._lock:
+            self.access_tokens.clear()
+
+    def send_count(self, device_token):
+        with self._lock:
+            return sum(1 for send in self.sends if send["message"]["token"] == device_token)
+
+    def _issue_token(self, form):
+        assert form["grant_type"] == ["urn:ietf:params:oauth:grant-type:jwt-bearer"]
+        with self._lock:
+            self.assertions.append(jwt.get_unverified_claims(form["assertion"][0]))
+            access_token = f"fake-access-token-{next(self._counter)}"
+            self.access_tokens.add(access_token)
+        return 200, {"access_token": access_token, "expires_in": 3600, "token_type": "Bearer"}, {}
+
+    def _send(self, authorization, body):
+        with self._lock:
+            if authorization.removeprefix("Bearer ") not in self.access_tokens:
+                return 401, {"error": {"code": 401, "status": "UNAUTHENTICATED"}}, {}
+            self.sends.append(body)
+            device_token = body["message"]["token"]
+            statuses = self.script.get(device_token)
+            if statuses:
+                status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            else:
+                status = 404 if device_token.startswith("dead-") else 200
+
+        if status == 200:
+            return 200, {"name": f"projects/test/messages/{next(self._counter)}"}, {}
+        error_status, error_code = FCM_ERRORS[status]
+        headers = {"Retry-After": "0"} if status == 429 else {}
+        return status, {"error": {
+            "code": status,
+            "status": error_status,
+            "details": [{"@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError", "errorCode": error_code}]
+        }}, headers
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/token":
+                    status, body, headers = fake._issue_token(parse_qs(raw.decode()))
+                elif self.path.endswith("/messages:send"):
+                    status, body, headers = fake._send(self.headers.get("Authorization", ""), json.loads(raw))
+                else:
+                    status, body, headers = 404, {}, {}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,100 @@
+from datetime import datetime, timezone
+import pytest
+from models.async_models import AsyncIngestWatermark, AsyncLocationPoint
+from models.ingest_watermark import IngestWatermark, response_cache
+from models.location_point import LocationPoint
+from tests.conftest import USER_ID
+
+WINDOW = {"start_time": "2025-01-01T00:00:00Z", "end_time": "2025-01-02T00:00:00Z"}
+WATERMARK = datetime(2025, 1, 2, 3, 4, 5, 678900, tzinfo=timezone.utc)
+ROWS = [{"id": 1, "latitude": 35.6812, "longitude": 139.7671, "timestamp": datetime(2025, 1, 1, 12, tzinfo=timezone.utc)}]
+
+@pytest.fixture
+def async_points(monkeypatch):
+    """ASGIモードのGET /pointsのDBアクセスを固定の位置情報と取り込み時刻に差し替える"""
+    calls = []
+
+    async def get_range(user_id, start_time, end_time):
+        calls.append("range")
+        return ROWS
+
+    async def iter_range(user_id, start_time, end_time):
+        calls.append("stream")
+
+        async def rows():
+            for row in ROWS:
+                yield row
+        return rows()
+
+    async def get_watermark(user_id, start_time, end_time):
+        return WATERMARK
+
+    monkeypatch.setattr(AsyncLocationPoint, "get_range", staticmethod(get_range))
+    monkeypatch.setattr(AsyncLocationPoint, "iter_range", staticmethod(iter_range))
+    monkeypatch.setattr(AsyncIngestWatermark, "get", staticmethod(get_watermark))
+    response_cache.clear()
+    return calls
+
+def test_get_points_sets_validators_and_answers_304(asgi_client, async_points):
+    response = asgi_client.get("/points", params=WINDOW)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert response.headers["Last-Modified"] == "Thu, 02 Jan 2025 03:04:05 GMT"
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    not_modified = asgi_client.get("/points", params=WINDOW, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+
+    since = asgi_client.get("/points", params=WINDOW, headers={"If-Modified-Since": response.headers["Last-Modified"]})
+    assert since.status_code == 304
+
+def test_get_points_serves_closed_window_from_cache(asgi_client, async_points):
+    first = asgi_client.get("/points", params=WINDOW)
+    second = asgi_client.get("/points", params=WINDOW)
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert async_points == ["range"]
+
+def test_get_points_etag_matches_flask(asgi_client, client, async_points, monkeypatch):
+    monkeypatch.setattr(LocationPoint, "get_range", staticmethod(lambda user_id, start_time, end_time: ROWS))
+    monkeypatch.setattr(IngestWatermark, "get", staticmethod(lambda user_id, start_time, end_time: WATERMARK))
+
+    asgi_response = asgi_client.get("/points", params=WINDOW)
+    flask_response = client.get("/points", query_string=WINDOW)
+
+    assert asgi_response.headers["ETag"] == flask_response.headers["ETag"]
+    assert asgi_response.headers["Last-Modified"] == flask_response.headers["Last-Modified"]
+
+@pytest.mark.parametrize("accept, ndjson", [
+    ("application/x-ndjson", True),
+    ("application/json;q=0.5, application/x-ndjson", True),
+    ("application/x-ndjson;q=0.1, application/json", False),
+    ("application/x-ndjson;q=0", False),
+    ("*/*", False)
+])
+def test_get_points_selects_ndjson_by_accept_quality(asgi_client, async_points, accept, ndjson):
+    response = asgi_client.get("/points", params=WINDOW, headers={"Accept": accept})
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"].startswith("application/x-ndjson" if ndjson else "application/json")
+    assert async_points == (["stream"] if ndjson else ["range"])
+
+def test_subscribe_streams_from_asgi_app(asgi_client, monkeypatch):
+    import time
+    import routes.asgi_routes as asgi_routes
+    from services.location_pubsub import location_pubsub
+    # 有効期限が切れたトークンでは、ready の直後に expired を送って終了する
+    monkeypatch.setattr(asgi_routes, "get_current_user", lambda request: {"user_id": USER_ID, "exp": time.time() - 1})
+
+    response = asgi_client.get("/points/subscribe")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert [line for line in response.text.splitlines() if line.startswith("event:")] == [
+        "event: ready", "event: expired"
+    ]
+    assert not location_pubsub.has_subscribers(USER_ID)
@@ -0,0 +1,106 @@
+import contextlib
+from datetime import datetime, timedelta, timezone
+import pytest
+from async_database import async_db, asyncpg_query
+from models.async_models import AsyncLocationPoint
+from models.daily_rollup import DailyRollup
+from models.location_point import LocationPoint
+
+WINDOW = {"start_time": "2025-01-01T00:00:00Z", "end_time": "2025-01-02T00:00:00Z", "stream": "true"}
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    async def fetch(self, count):
+        rows, self.rows = self.rows[:count], self.rows[count:]
+        return rows
+
+class FakeConnection:
+    """サーバーサイドカーソルとトランザクションだけを再現するasyncpgの接続"""
+
+    def __init__(self, rows, fail_query=False, watermark=None):
+        self.rows = rows
+        self.fail_query = fail_query
+        self.watermark = watermark
+        self.queries = []
+        self.transactions = []
+
+    async def fetchval(self, query, *args):
+        self.queries.append((query, args))
+        return self.watermark
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, readonly=False):
+        self.transactions.append("begin")
+        try:
+            yield
+        except BaseException:
+            self.transactions.append("rollback")
+            raise
+        self.transactions.append("commit")
+
+    async def cursor(self, query, *args):
+        self.queries.append((query, args))
+        if self.fail_query:
+            raise RuntimeError("relation \"app_locations\" does not exist")
+        return FakeCursor(self.rows)
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+        self.released = 0
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        try:
+            yield self.connection
+        finally:
+            self.released += 1
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    def install(connection):
+        pool = FakePool(connection)
+        monkeypatch.setattr(async_db, "pool", pool)
+        return pool
+    return install
+
+def test_asyncpg_query_numbers_placeholders():
+    assert asyncpg_query("WHERE a = %s AND b LIKE 'x%%' LIMIT %s") == "WHERE a = $1 AND b LIKE 'x%' LIMIT $2"
+    assert AsyncLocationPoint.RANGE_QUERY == asyncpg_query(LocationPoint.RANGE_QUERY)
+    assert "$11::jsonb" in AsyncLocationPoint.ROLLUP_UPSERT_QUERY
+    assert "%s" not in AsyncLocationPoint.ROLLUP_UPSERT_QUERY
+    assert AsyncLocationPoint.ROLLUP_LOCK_QUERY == asyncpg_query(DailyRollup.LOCK_QUERY)
+
+def test_stream_returns_error_response_when_pool_is_unavailable(asgi_client):
+    response = asgi_client.get("/points", params=WINDOW)
+
+    assert response.status_code == 500
+    assert response.json()["error_code"] == "INTERNAL_SERVER_ERROR"
+
+def test_stream_returns_error_response_when_query_fails(asgi_client, fake_pool):
+    connection = FakeConnection([], fail_query=True)
+    pool = fake_pool(connection)
+
+    response = asgi_client.get("/points", params=WINDOW)
+
+    assert response.status_code == 500
+    assert response.json()["error_code"] == "INTERNAL_SERVER_ERROR"
+    assert connection.transactions == ["begin", "rollback"]
+    # 取り込み時刻の取得とストリーミングの両方で接続を返却している
+    assert pool.released == 2
+
+def test_stream_releases_connection_after_last_row(asgi_client, fake_pool):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rows = [{"latitude": 35.0, "longitude": 139.0, "timestamp": start + timedelta(minutes=i)} for i in range(5)]
+    connection = FakeConnection(rows)
+    pool = fake_pool(connection)
+
+    response = asgi_client.get("/points", params=WINDOW)
+
+    assert response.status_code == 200
+    assert response.json()["count"] == 5
+    assert connection.queries[-1][0] == AsyncLocationPoint.RANGE_QUERY
+    assert connection.transactions == ["begin", "commit"]
+    assert pool.released == 2
@@ -0,0 +1,27 @@
+import time
+from utils.auth import TokenCache
+
+USER = {"user_id": "123e4567-e89b-12d3-a456-426614174000"}
+
+def test_token_cache_entry_does_not_outlive_exp():
+    cache = TokenCache(max_size=10, ttl_seconds=300, negative_ttl_seconds=60)
+
+    cache.put("expiring", USER, exp=time.time() + 0.05)
+    cache.put("expired", USER, exp=time.time() - 1)
+
+    assert cache.get("expiring") == (True, USER)
+    assert cache.get("expired") == (False, None)
+    time.sleep(0.1)
+    assert cache.get("expiring") == (False, None)
+
+def test_token_cache_stats_separate_negative_hits():
+    cache = TokenCache(max_size=10, ttl_seconds=300, negative_ttl_seconds=60)
+    cache.put("valid", USER)
+    cache.put("invalid", None)
+
+    assert cache.get("valid") == (True, USER)
+    assert cache.get("invalid") == (True, None)
+    assert cache.get("unknown") == (False, None)
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["negative_hits"], stats["misses"], stats["size"]) == (1, 1, 1, 2)
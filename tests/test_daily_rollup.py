@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+import numpy as np
+import pytest
+from config import Config
+from models.daily_rollup import DailyRollup
+from utils.rollup import empty_state, apply_points
+
+USER_ID = "123e4567-e89b-12d3-a456-426614174000"
+
+def at(second):
+    return datetime(2025, 1, 1, 0, 0, second, tzinfo=timezone.utc)
+
+class FakeCursor:
+    """保存済みの途中状態を返し、実行したクエリを記録するカーソル"""
+
+    def __init__(self, state):
+        self.state = state
+        self.queries = []
+        self.last_query = None
+
+    def execute(self, query, params=None):
+        self.queries.append(query)
+        self.last_query = query
+
+    def fetchone(self):
+        return {"state": self.state} if self.last_query == DailyRollup.SELECT_STATE_QUERY else None
+
+    def fetchall(self):
+        return [{"latitude": 35.0, "longitude": 139.0, "ts": at(second).timestamp()} for second in range(3)]
+
+@pytest.fixture
+def stored_state(monkeypatch):
+    """0秒・1秒の点を集計済みの途中状態"""
+    monkeypatch.setattr(Config, "ROLLUP_ENABLED", True)
+    ts = np.array([at(0).timestamp(), at(1).timestamp()])
+    return apply_points(empty_state(), np.array([35.0, 35.0]), np.array([139.0, 139.0]), ts, DailyRollup.params())
+
+def test_retry_without_saved_rows_does_not_touch_rollup(stored_state):
+    cursor = FakeCursor(stored_state)
+
+    # 再送で全件が重複だった場合、保存した行は空になる
+    assert DailyRollup.apply(cursor, [[]]) == 0
+    assert cursor.queries == []
+
+def test_newer_saved_rows_extend_state(stored_state):
+    cursor = FakeCursor(stored_state)
+
+    DailyRollup.apply(cursor, [[(USER_ID, 35.0, 139.0, at(2))]])
+
+    assert DailyRollup.DAY_POINTS_QUERY not in cursor.queries
+    assert cursor.queries[-1] == DailyRollup.UPSERT_QUERY
+
+def test_late_saved_rows_recompute_day(stored_state):
+    cursor = FakeCursor(stored_state)
+
+    DailyRollup.apply(cursor, [[(USER_ID, 35.0, 139.0, datetime(2025, 1, 1, 0, 0, 0, 500000, tzinfo=timezone.utc))]])
+
+    assert DailyRollup.DAY_POINTS_QUERY in cursor.queries
+    assert cursor.queries[-1] == DailyRollup.UPSERT_QUERY
@@ -0,0 +1,108 @@
+import types
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+import database
+from config import Config
+from database import ConnectionPool
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, vars=None):
+        self.connection.queries.append(query)
+        if self.connection.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+        self.info = types.SimpleNamespace(transaction_status=psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        pass
+
+class FakePool:
+    """ThreadedConnectionPoolの代わりに、返却された接続を再利用するプール"""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.idle = []
+        self.created = []
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        connection = FakeConnection()
+        self.created.append(connection)
+        return connection
+
+    def putconn(self, connection, close=False):
+        if close:
+            connection.closed = 1
+        else:
+            self.idle.append(connection)
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(database.time, "monotonic", lambda: now[0])
+    return now
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(psycopg2.pool, "ThreadedConnectionPool", FakePool)
+
+    def make(health_check=True, idle=30):
+        config = Config()
+        config.DB_POOL_HEALTH_CHECK = health_check
+        config.DB_POOL_HEALTH_CHECK_IDLE = idle
+        return ConnectionPool(config)
+    return make
+
+def test_health_check_is_enabled_by_default():
+    assert Config.DB_POOL_HEALTH_CHECK is True
+
+def test_health_check_skips_recently_used_connections(make_pool, clock):
+    pool = make_pool(idle=30)
+    connection = pool.getconn()
+    pool.putconn(connection)
+
+    clock[0] += 10
+    assert pool.getconn() is connection
+    assert connection.queries == []
+
+def test_health_check_replaces_broken_idle_connection(make_pool, clock):
+    pool = make_pool(idle=30)
+    connection = pool.getconn()
+    pool.putconn(connection)
+    connection.broken = True
+
+    clock[0] += 31
+    replacement = pool.getconn()
+
+    assert replacement is not connection
+    assert connection.queries == ["SELECT 1"]
+    assert connection.closed
+    assert pool.get_stats()["discarded"] == 1
+
+def test_health_check_disabled(make_pool, clock):
+    pool = make_pool(health_check=False)
+    connection = pool.getconn()
+    pool.putconn(connection)
+
+    clock[0] += 3600
+    assert pool.getconn() is connection
+    assert connection.queries == []
@@ -0,0 +1,50 @@
+from models import device_token
+from models.device_token import DeviceToken
+from utils.cache import TTLCache
+
+def test_cached_token_is_not_shared_with_callers(monkeypatch):
+    monkeypatch.setattr(device_token, "lookup_cache", TTLCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(device_token, "shared_cache", None)
+    key = ("user-1", "ios")
+    token = {"device_token": "abc", "platform": "ios", "device_info": {"model": "iPhone"}}
+
+    DeviceToken._cache_set(key, token)
+    token["device_info"]["model"] = "changed"
+    _, cached = DeviceToken._cache_get(key)
+    cached["device_token"] = "changed"
+    cached["device_info"]["model"] = "changed"
+
+    assert DeviceToken._cache_get(key) == (True, {
+        "device_token": "abc", "platform": "ios", "device_info": {"model": "iPhone"}
+    })
+
+class FakeNamedCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = None
+        self.closed = False
+
+    def execute(self, query, params=None):
+        self.executed = (" ".join(query.split()), params)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def close(self):
+        self.closed = True
+
+def test_iter_tokens_streams_filtered_rows_and_closes_cursor(monkeypatch):
+    rows = [{"id": 1, "user_id": "user-1", "platform": "ios", "device_token": "abc"}]
+    cursor = FakeNamedCursor(rows)
+    rollbacks = []
+    monkeypatch.setattr(device_token.db, "get_named_cursor", lambda name, itersize=None: cursor)
+    monkeypatch.setattr(device_token.db, "rollback", lambda: rollbacks.append(True))
+
+    tokens = DeviceToken.iter_tokens(user_ids=("user-1",), platform="ios", updated_since="2025-01-01")
+
+    query, params = cursor.executed
+    assert "WHERE user_id = ANY(%s) AND platform = %s AND updated_at >= %s ORDER BY id" in query
+    assert params == [["user-1"], "ios", "2025-01-01"]
+    assert list(tokens) == rows
+    # 読み終えたらカーソルを閉じ、読み取り用のトランザクションを終える
+    assert cursor.closed and rollbacks == [True]
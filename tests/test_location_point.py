@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+import psycopg2
+import pytest
+from models import location_point
+from models.location_point import LocationPoint
+
+USER_ID = "123e4567-e89b-12d3-a456-426614174000"
+
+class FakeCursor:
+    """app_locationsへのINSERTとセーブポイントだけを再現するカーソル
+
+    INSERTは ON CONFLICT DO NOTHING ... RETURNING timestamp と同じく、保存した行の時刻だけを返す。
+    緯度が範囲外の行を含むINSERTはCHECK制約違反としてエラーにする。
+    """
+
+    def __init__(self, stored):
+        self.stored = set(stored)
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append(query)
+
+    def insert(self, rows):
+        if any(not -90 <= row[1] <= 90 for row in rows):
+            raise psycopg2.Error("new row violates check constraint \"chk_latitude\"")
+        returned = []
+        for row in rows:
+            if (row[0], row[3]) not in self.stored:
+                self.stored.add((row[0], row[3]))
+                returned.append({"timestamp": row[3]})
+        return returned
+
+@pytest.fixture
+def fake_execute_values(monkeypatch):
+    def execute_values(cursor, query, rows, template=None, page_size=100, fetch=False):
+        cursor.statements.append(query)
+        returned = cursor.insert(rows)
+        return returned if fetch else None
+
+    monkeypatch.setattr(location_point.psycopg2.extras, "execute_values", execute_values)
+
+def test_insert_rows_one_by_one_fallback_counts(fake_execute_values):
+    duplicate_time = datetime(2025, 1, 1, 0, 0, 1, tzinfo=timezone.utc)
+    rows = [
+        (USER_ID, 35.0, 139.0, datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)),
+        (USER_ID, 35.1, 139.1, duplicate_time),
+        (USER_ID, 95.0, 139.2, datetime(2025, 1, 1, 0, 0, 2, tzinfo=timezone.utc))
+    ]
+    cursor = FakeCursor(stored=[(USER_ID, duplicate_time)])
+
+    result, saved_rows = LocationPoint._insert_rows(cursor, rows, page_size=1000)
+
+    # チャンク全体のINSERTが失敗し、1件ずつの保存に切り替わっている
+    assert "ROLLBACK TO SAVEPOINT location_chunk" in cursor.statements
+    assert result["saved_count"] == 1
+    assert result["duplicate_count"] == 1
+    assert [failure["index"] for failure in result["failed_points"]] == [2]
+    # 重複・失敗した行は保存した行に含まれない
+    assert saved_rows == [rows[0]]
+
+def test_insert_rows_retry_saves_nothing(fake_execute_values):
+    rows = [
+        (USER_ID, 35.0, 139.0, datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc)),
+        (USER_ID, 35.1, 139.1, datetime(2025, 1, 1, 0, 0, 1, tzinfo=timezone.utc))
+    ]
+    cursor = FakeCursor(stored=[])
+    LocationPoint._insert_rows(cursor, rows, page_size=1000)
+
+    result, saved_rows = LocationPoint._insert_rows(cursor, rows, page_size=1000)
+
+    assert result["saved_count"] == 0
+    assert result["duplicate_count"] == 2
+    assert saved_rows == []
+
+def test_events_include_only_inserted_rows(fake_execute_values):
+    from services.location_pubsub import LocationPubSub
+    pubsub = LocationPubSub(max_subscribers=10, notify_enabled=True)
+    first = [(USER_ID, 35.0, 139.0, datetime(2025, 1, 1, 0, 0, 0, tzinfo=timezone.utc))]
+    retry = first + [(USER_ID, 35.1, 139.1, datetime(2025, 1, 1, 0, 0, 1, tzinfo=timezone.utc))]
+    cursor = FakeCursor(stored=[])
+    LocationPoint._insert_rows(cursor, first, page_size=1000)
+
+    _, saved_rows = LocationPoint._insert_rows(cursor, retry, page_size=1000)
+    _, nothing_saved = LocationPoint._insert_rows(cursor, retry, page_size=1000)
+
+    events = pubsub.events_for([saved_rows, nothing_saved])
+    # 再送で重複した行・何も保存されなかったアップロードは配信しない
+    assert events == [{
+        "user_id": USER_ID,
+        "points": [{"latitude": 35.1, "longitude": 139.1, "timestamp": "2025-01-01T00:00:01+00:00"}]
+    }]
@@ -0,0 +1,42 @@
+from datetime import datetime, timezone
+import pytest
+from models.ingest_watermark import IngestWatermark, response_cache
+from models.location_point import LocationPoint
+
+@pytest.fixture
+def stored_points(monkeypatch):
+    """GET /pointsのDBアクセスを固定の位置情報に差し替える"""
+    rows = [{"id": 1, "latitude": 35.6812, "longitude": 139.7671,
+             "timestamp": datetime(2025, 1, 1, 12, tzinfo=timezone.utc)}]
+    calls = []
+
+    def get_range(user_id, start_time, end_time):
+        calls.append((start_time, end_time))
+        return rows
+
+    monkeypatch.setattr(LocationPoint, "get_range", staticmethod(get_range))
+    monkeypatch.setattr(IngestWatermark, "get", staticmethod(lambda user_id, start_time, end_time: None))
+    response_cache.clear()
+    return calls
+
+@pytest.mark.parametrize("suffix", ["", "Z", "+09:00"])
+def test_get_points_accepts_window_with_or_without_offset(client, stored_points, suffix):
+    response = client.get("/points", query_string={
+        "start_time": f"2025-01-01T00:00:00{suffix}",
+        "end_time": f"2025-01-02T00:00:00{suffix}"
+    })
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 1
+
+def test_get_points_treats_naive_window_as_utc(client, stored_points):
+    response = client.get("/points?start_time=2025-01-01T00:00:00&end_time=2025-01-02T00:00:00")
+    assert response.status_code == 200
+    start_time, end_time = stored_points[0]
+    assert start_time == datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert end_time == datetime(2025, 1, 2, tzinfo=timezone.utc)
+    assert response.get_json()["start_time"] == "2025-01-01T00:00:00+00:00"
+
+def test_subscribe_is_not_served_by_wsgi_app(client):
+    response = client.get("/points/subscribe")
+    assert response.status_code == 503
+    assert response.get_json()["error_code"] == "STREAMING_UNAVAILABLE"
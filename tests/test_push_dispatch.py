@@ -0,0 +1,238 @@
+import asyncio
+import pytest
+import rsa
+from models.device_token import DeviceToken
+from services import push_dispatch
+from services.push_dispatch import FcmHttpTransport, PushDispatcher, ServiceAccountCredentials
+from services.token_pruner import DeadTokenCollector
+from tests.fake_fcm import FakeFcmServer
+
+MESSAGE = {"notification": {"title": "お知らせ", "body": "本文"}}
+
+@pytest.fixture(scope="module")
+def private_key():
+    _, key = rsa.newkeys(1024)
+    return key.save_pkcs1().decode()
+
+@pytest.fixture
+def fake_fcm():
+    server = FakeFcmServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def make_transport(fake_fcm, private_key):
+    def make(**kwargs):
+        credentials = ServiceAccountCredentials({
+            "client_email": "push@test-project.iam.gserviceaccount.com",
+            "private_key": private_key,
+            "token_uri": f"{fake_fcm.url}/token",
+            "project_id": "test-project"
+        })
+        options = {"max_retries": 3, "backoff": 0.001, "max_backoff": 0.01, "api_url": fake_fcm.url}
+        options.update(kwargs)
+        return FcmHttpTransport(credentials.project_id, credentials, 10, 5, **options)
+    return make
+
+@pytest.fixture
+def stored_tokens(monkeypatch):
+    """DeviceToken.iter_tokensを指定したトークンの行に差し替える"""
+    def store(tokens):
+        rows = [
+            {"id": i + 1, "user_id": f"user-{i}", "platform": "android", "device_token": token}
+            for i, token in enumerate(tokens)
+        ]
+        monkeypatch.setattr(
+            DeviceToken, "iter_tokens",
+            staticmethod(lambda user_ids=None, platform=None, updated_since=None, itersize=2000: (row for row in rows))
+        )
+        return rows
+    return store
+
+def send(transport, tokens):
+    async def run():
+        try:
+            return await transport.send_multicast(tokens, MESSAGE)
+        finally:
+            await transport.close()
+    return asyncio.run(run())
+
+class RecordingTransport:
+    """送信したバッチと同時に送信中のバッチ数を記録するトランスポート"""
+
+    def __init__(self):
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.closed = False
+
+    async def send_multicast(self, tokens, message):
+        self.batches.append(len(tokens))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return [{"success": True, "error": None}] * len(tokens)
+
+    async def close(self):
+        self.closed = True
+
+def test_dispatch_splits_tokens_into_batches(stored_tokens):
+    stored_tokens([f"token-{i}" for i in range(1201)])
+    transport = RecordingTransport()
+    dispatcher = PushDispatcher(transport, batch_size=500, concurrency=2, fetch_size=100)
+
+    summary = dispatcher.dispatch(MESSAGE)
+
+    assert sorted(transport.batches) == [201, 500, 500]
+    assert transport.max_in_flight <= 2
+    assert transport.closed
+    assert summary["batches"] == 3
+    assert summary["sent"] == summary["success"] == 1201
+
+def test_transport_sends_v1_messages_with_oauth_token(fake_fcm, make_transport):
+    results = send(make_transport(), ["token-a", "token-b", "token-c"])
+
+    assert results == [{"success": True, "error": None}] * 3
+    assert sorted(send["message"]["token"] for send in fake_fcm.sends) == ["token-a", "token-b", "token-c"]
+    assert fake_fcm.sends[0]["message"]["notification"] == MESSAGE["notification"]
+    # アクセストークンは1回だけ取得して再利用する
+    assert len(fake_fcm.assertions) == 1
+    assert fake_fcm.assertions[0]["scope"] == push_dispatch.FCM_SCOPE
+    assert fake_fcm.assertions[0]["aud"] == f"{fake_fcm.url}/token"
+
+def test_transport_retries_5xx_and_429(fake_fcm, make_transport):
+    fake_fcm.script = {"flaky": [503, 500, 200], "throttled": [429, 200]}
+
+    results = send(make_transport(), ["flaky", "throttled"])
+
+    assert results == [{"success": True, "error": None}] * 2
+    assert fake_fcm.send_count("flaky") == 3
+    assert fake_fcm.send_count("throttled") == 2
+
+def test_transport_gives_up_after_max_retries(fake_fcm, make_transport):
+    fake_fcm.script = {"down": [503]}
+
+    results = send(make_transport(max_retries=2), ["down"])
+
+    assert results == [{"success": False, "error": "UNAVAILABLE"}]
+    assert fake_fcm.send_count("down") == 3
+
+def test_transport_does_not_retry_permanent_errors(fake_fcm, make_transport):
+    fake_fcm.script = {"bad": [400]}
+
+    results = send(make_transport(), ["dead-1", "bad"])
+
+    assert results == [
+        {"success": False, "error": "UNREGISTERED"},
+        {"success": False, "error": "INVALID_ARGUMENT"}
+    ]
+    assert fake_fcm.send_count("dead-1") == 1
+    assert fake_fcm.send_count("bad") == 1
+
+def test_transport_refreshes_rejected_access_token(fake_fcm, make_transport):
+    transport = make_transport()
+
+    async def run():
+        try:
+            first = await transport.send_multicast(["token-a"], MESSAGE)
+            fake_fcm.revoke_access_tokens()
+            second = await transport.send_multicast(["token-b"], MESSAGE)
+            return first + second
+        finally:
+            await transport.close()
+
+    assert asyncio.run(run()) == [{"success": True, "error": None}] * 2
+    assert len(fake_fcm.assertions) == 2
+
+def test_retry_delay_uses_backoff_and_retry_after(make_transport, monkeypatch):
+    monkeypatch.setattr(push_dispatch.random, "uniform", lambda low, high: high)
+    transport = make_transport(backoff=0.5, max_backoff=4.0)
+
+    assert [transport._retry_delay(attempt, None) for attempt in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+    class Response:
+        headers = {"Retry-After": "2"}
+
+    assert transport._retry_delay(0, Response()) == 2.0
+    Response.headers = {"Retry-After": "120"}
+    assert transport._retry_delay(0, Response()) == 4.0
+    asyncio.run(transport.close())
+
+def test_dispatch_prunes_unregistered_tokens(fake_fcm, make_transport, stored_tokens, monkeypatch):
+    rows = stored_tokens(["token-a", "dead-1", "token-b", "dead-2"])
+    fake_fcm.script = {"token-b": [503, 200]}
+    deleted = []
+
+    def delete_tokens(tokens):
+        deleted.extend(tokens)
+        return len(tokens)
+
+    monkeypatch.setattr(DeviceToken, "delete_tokens", staticmethod(delete_tokens))
+    dispatcher = PushDispatcher(make_transport(), batch_size=2, concurrency=2)
+    collector = DeadTokenCollector(batch_size=100)
+    dispatcher.add_result_handler(collector.handle_results)
+
+    summary = dispatcher.dispatch(MESSAGE)
+    collector.flush()
+
+    assert summary["success"] == 2
+    assert summary["errors"] == {"UNREGISTERED": 2}
+    dead = {(row["id"], row["device_token"]) for row in rows if row["device_token"].startswith("dead-")}
+    assert set(deleted) == dead
+    assert collector.deleted_count == 2
+
+class FailingTransport(RecordingTransport):
+    async def send_multicast(self, tokens, message):
+        raise RuntimeError("connection reset")
+
+def test_dispatch_passes_filters_and_isolates_failures(monkeypatch):
+    requested = []
+
+    def iter_tokens(user_ids=None, platform=None, updated_since=None, itersize=2000):
+        requested.append((user_ids, platform, updated_since, itersize))
+        rows = [{"id": 1, "user_id": "user-1", "platform": "ios", "device_token": "token-a"}]
+        return (row for row in rows)
+
+    monkeypatch.setattr(DeviceToken, "iter_tokens", staticmethod(iter_tokens))
+    handled = []
+
+    def failing_handler(pairs):
+        raise ValueError("handler error")
+
+    dispatcher = PushDispatcher(FailingTransport(), batch_size=500, concurrency=2, fetch_size=100)
+    dispatcher.add_result_handler(failing_handler)
+    dispatcher.add_result_handler(handled.extend)
+
+    summary = dispatcher.dispatch(MESSAGE, user_ids=["user-1"], platform="ios", updated_since="2025-01-01")
+
+    assert requested == [(["user-1"], "ios", "2025-01-01", 100)]
+    # 送信の失敗はバッチ内の全トークンの失敗として扱い、ハンドラの例外は他のハンドラに影響しない
+    assert summary["errors"] == {"TRANSPORT_ERROR": 1}
+    assert [result for _, result in handled] == [{"success": False, "error": "TRANSPORT_ERROR"}]
+
+@pytest.mark.parametrize("status, body, expected", [
+    (404, {"error": {"status": "NOT_FOUND", "details": [
+        {"@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError", "errorCode": "UNREGISTERED"}
+    ]}}, "UNREGISTERED"),
+    (400, {"error": {"status": "INVALID_ARGUMENT"}}, "INVALID_ARGUMENT"),
+    (502, None, "HTTP_502")
+])
+def test_fcm_error_code(status, body, expected):
+    import httpx
+    response = httpx.Response(status, json=body) if body is not None else httpx.Response(status, text="Bad Gateway")
+
+    assert push_dispatch.fcm_error_code(response) == expected
+
+def test_collector_prunes_only_unregistered_tokens():
+    collector = DeadTokenCollector(batch_size=100)
+    pairs = [
+        ({"id": 1, "device_token": "dead"}, {"success": False, "error": "UNREGISTERED"}),
+        ({"id": 2, "device_token": "bad-payload"}, {"success": False, "error": "INVALID_ARGUMENT"}),
+        ({"id": 3, "device_token": "down"}, {"success": False, "error": "UNAVAILABLE"}),
+        ({"id": 4, "device_token": "ok"}, {"success": True, "error": None})
+    ]
+
+    asyncio.run(collector.handle_results(pairs))
+
+    assert collector._pending == [(1, "dead")]
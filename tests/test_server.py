@@ -0,0 +1,25 @@
+import sys
+import server
+
+def test_wsgi_mode_runs_gunicorn_gthread(monkeypatch):
+    from gunicorn.app.base import BaseApplication
+    started = []
+    monkeypatch.setattr(BaseApplication, "run", lambda self: started.append(self.cfg))
+    monkeypatch.setattr(sys, "argv", ["server.py", "--interface", "wsgi", "--workers", "2", "--threads", "4"])
+
+    server.main()
+
+    cfg = started[0]
+    assert (cfg.worker_class_str, cfg.workers, cfg.threads) == ("gthread", 2, 4)
+
+def test_asgi_mode_runs_uvicorn_factory(monkeypatch):
+    import uvicorn
+    calls = []
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: calls.append((app, kwargs)))
+    monkeypatch.setattr(sys, "argv", ["server.py", "--interface", "asgi", "--workers", "2"])
+
+    server.main()
+
+    app, kwargs = calls[0]
+    assert app == "asgi_app:create_asgi_app"
+    assert kwargs["factory"] and kwargs["workers"] == 2
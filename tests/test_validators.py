@@ -0,0 +1,84 @@
+import time
+from datetime import date, datetime, timedelta, timezone
+import pytest
+from dateutil import parser
+from models.daily_rollup import DailyRollup
+from models.ingest_watermark import IngestWatermark
+from models.location_point import LocationPoint
+from utils.validators import ValidationError, parse_iso8601, validate_points_batch, validate_point
+
+def make_point(**overrides):
+    point = {"latitude": 35.0, "longitude": 139.0, "timestamp": "2025-01-01T00:00:00Z"}
+    point.update(overrides)
+    return point
+
+@pytest.mark.parametrize("value", [
+    "2025-08-31T12:00:00Z",
+    "2025-08-31T12:00:00.123Z",
+    "2025-08-31T12:00:00+09:00",
+    "2025-08-31T12:00:00-23:59",
+    "2025-08-31T12:00:00"
+])
+def test_parse_iso8601_matches_isoparse(value):
+    assert parse_iso8601(value) == parser.isoparse(value)
+    assert parse_iso8601(value).utcoffset() == parser.isoparse(value).utcoffset()
+
+@pytest.mark.parametrize("value", [
+    "2025-08-31T12:00:00+05:60",
+    "2025-08-31T12:00:00+24:00",
+    "２０２５-08-31T12:00:00Z",
+    "2025-08-31T12:00:00Z\n"
+])
+def test_parse_iso8601_rejects_what_isoparse_rejects(value):
+    with pytest.raises(ValueError):
+        parser.isoparse(value)
+    with pytest.raises(ValueError):
+        parse_iso8601(value)
+
+def test_points_batch_sets_parsed_timestamp():
+    points = [make_point(timestamp="2025-01-01T09:00:00+09:00"), make_point(latitude=-90, longitude=180)]
+
+    assert validate_points_batch(points)
+    assert points[0]["parsed_timestamp"] == datetime(2025, 1, 1, 9, tzinfo=timezone(timedelta(hours=9)))
+
+@pytest.mark.parametrize("overrides, message", [
+    ({"latitude": 90.5}, "latitude: 緯度は-90から90の範囲である必要があります"),
+    ({"longitude": -180.5}, "longitude: 経度は-180から180の範囲である必要があります"),
+    ({"latitude": "35.0"}, "latitude: 緯度は数値である必要があります"),
+    ({"longitude": None}, "longitude: 経度は必須です"),
+    ({"latitude": 10 ** 400}, "latitude: 緯度は-90から90の範囲である必要があります"),
+    ({"timestamp": "2025-01-01T00:00:00+05:60"}, "timestamp: タイムスタンプはISO 8601形式である必要があります")
+])
+def test_points_batch_reports_first_invalid_point(overrides, message):
+    points = [make_point(), make_point(**overrides), make_point(latitude=100)]
+
+    with pytest.raises(ValidationError) as error:
+        validate_points_batch(points)
+
+    assert error.value.message == f"points[1]: {message}"
+
+@pytest.fixture
+def tokyo_local_time(monkeypatch):
+    """サーバーのローカル時刻をUTC以外（Asia/Tokyo）にする"""
+    monkeypatch.setenv("TZ", "Asia/Tokyo")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_offsetless_upload_timestamps_are_utc(tokyo_local_time):
+    points = [make_point(timestamp="2025-01-01T03:00:00"), make_point(timestamp="2025-01-01T03:00:01.5")]
+    single = make_point(timestamp="2025-01-01T03:00:00")
+
+    validate_points_batch(points)
+    validate_point(single)
+
+    assert points[0]["parsed_timestamp"] == datetime(2025, 1, 1, 3, tzinfo=timezone.utc)
+    assert points[1]["parsed_timestamp"].tzinfo == timezone.utc
+    assert single["parsed_timestamp"] == datetime(2025, 1, 1, 3, tzinfo=timezone.utc)
+
+    # 取り込み時刻と日ごとの集計は、ローカル時刻ではなくUTCの日で更新される
+    rows = LocationPoint.to_rows("user-1", points)
+    results = [{"saved_count": 2, "duplicate_count": 0, "failed_points": []}]
+    assert IngestWatermark.touched_days([rows], results) == [("user-1", date(2025, 1, 1))]
+    assert [pending[1] for pending in DailyRollup.pending_points([rows])] == [date(2025, 1, 1)]
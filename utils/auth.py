@@ -1,8 +1,13 @@
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from typing import Optional
+import hashlib
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from utils.cache import TTLCache
+from utils.metrics import jwt_verify_duration
 
 load_dotenv()
 
@@ -10,6 +15,67 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-for-jwt")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# 検証済みトークンのキャッシュ設定
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_NEGATIVE_TTL_SECONDS", "60"))
+
+class TokenCache:
+    """検証済みJWTのクレームを保持するキャッシュ（キーはトークンのSHA-256）
+
+    TTLCacheに、エントリの有効期限をトークンのexpで打ち切る処理と
+    無効なトークン用の短いTTL・署名検証時間の統計を加えたもの。
+    """
+
+    def __init__(self, max_size, ttl_seconds, negative_ttl_seconds):
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._cache = TTLCache(max_size, ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = {"negative_hits": 0, "verify_count": 0, "verify_time_total": 0.0}
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token):
+        """キャッシュ済みならTrueと結果を返す（結果がNoneの場合は無効なトークン）"""
+        hit, user = self._cache.get(self._key(token))
+        if hit and user is None:
+            with self._lock:
+                self._stats["negative_hits"] += 1
+        return hit, user
+
+    def put(self, token, user, exp=None):
+        if user is None:
+            ttl = self.negative_ttl_seconds
+        else:
+            ttl = self._cache.ttl_seconds
+            # キャッシュがトークンの有効期限を超えないようにする
+            if exp is not None:
+                ttl = min(ttl, float(exp) - time.time())
+        self._cache.set(self._key(token), user, ttl_seconds=ttl)
+
+    def record_verify(self, elapsed):
+        with self._lock:
+            self._stats["verify_count"] += 1
+            self._stats["verify_time_total"] += elapsed
+
+    def clear(self):
+        self._cache.clear()
+
+    def get_stats(self):
+        stats = self._cache.get_stats()
+        with self._lock:
+            stats.update(self._stats)
+        # TTLCacheのヒット数には無効なトークンのヒットも含まれる
+        stats["hits"] -= stats["negative_hits"]
+        average = stats["verify_time_total"] / stats["verify_count"] if stats["verify_count"] else 0.0
+        # キャッシュヒットにより省略できた署名検証時間の推定値
+        stats["estimated_time_saved"] = average * (stats["hits"] + stats["negative_hits"])
+        return stats
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL_SECONDS, TOKEN_CACHE_NEGATIVE_TTL_SECONDS)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """JWTアクセストークンを作成"""
     to_encode = data.copy()
@@ -22,12 +88,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(token: str):
-    """JWTトークンを検証してユーザー情報を取得"""
+    """JWTトークンを検証してユーザー情報を取得（検証結果はキャッシュされる）"""
+    started = time.perf_counter()
+    cached, user = token_cache.get(token)
+    if cached:
+        jwt_verify_duration.observe(time.perf_counter() - started, cached="true")
+        return dict(user) if user else None
+
+    started = time.perf_counter()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            return None
-        return {"user_id": user_id, "email": payload.get("email")}
     except JWTError:
-        return None
\ No newline at end of file
+        token_cache.put(token, None)
+        return None
+    finally:
+        elapsed = time.perf_counter() - started
+        token_cache.record_verify(elapsed)
+        jwt_verify_duration.observe(elapsed, cached="false")
+
+    user_id: str = payload.get("sub")
+    if user_id is None:
+        token_cache.put(token, None)
+        return None
+
+    user = {"user_id": user_id, "email": payload.get("email"), "exp": payload.get("exp")}
+    token_cache.put(token, user, payload.get("exp"))
+    return dict(user)
\ No newline at end of file
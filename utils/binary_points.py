@@ -0,0 +1,88 @@
+import zlib
+import numpy as np
+from utils.validators import ValidationError
+
+# (float64 緯度, float64 経度, int64 UNIX時刻ミリ秒) のリトルエンディアン固定長レコード
+PACKED_CONTENT_TYPE = "application/x-location-batch"
+PACKED_DTYPE = np.dtype([("latitude", "<f8"), ("longitude", "<f8"), ("timestamp_ms", "<i8")])
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+BINARY_CONTENT_TYPES = (PACKED_CONTENT_TYPE,) + MSGPACK_CONTENT_TYPES
+
+# 展開後のリクエストボディの上限（圧縮爆弾対策）
+MAX_DECOMPRESSED_BYTES = 4 * 1024 * 1024
+
+def decompress_body(data, content_encoding):
+    """Content-Encoding（gzip / zstd）に応じてリクエストボディを展開する"""
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return data
+
+    if encoding in ("gzip", "x-gzip"):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(data, MAX_DECOMPRESSED_BYTES + 1)
+        except zlib.error:
+            raise ValidationError("gzipデータを展開できません", "INVALID_ENCODING")
+    elif encoding == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ValidationError("zstdには対応していません", "UNSUPPORTED_ENCODING")
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(data)
+            body = reader.read(MAX_DECOMPRESSED_BYTES + 1)
+        except zstandard.ZstdError:
+            raise ValidationError("zstdデータを展開できません", "INVALID_ENCODING")
+    else:
+        raise ValidationError(f"Content-Encoding '{encoding}' には対応していません", "UNSUPPORTED_ENCODING")
+
+    if len(body) > MAX_DECOMPRESSED_BYTES:
+        raise ValidationError("展開後のリクエストが大きすぎます", "REQUEST_TOO_LARGE")
+    return body
+
+def decode_packed(data):
+    """固定長レコードの配列を (緯度, 経度, UNIX時刻ミリ秒) の配列に変換する"""
+    if len(data) % PACKED_DTYPE.itemsize != 0:
+        raise ValidationError(
+            f"データ長は{PACKED_DTYPE.itemsize}バイトの倍数である必要があります", "POINTS_INVALID_FORMAT"
+        )
+    records = np.frombuffer(data, dtype=PACKED_DTYPE)
+    return records["latitude"], records["longitude"], records["timestamp_ms"]
+
+def decode_msgpack(data):
+    """MessagePackの {"points": [[緯度, 経度, UNIX時刻ミリ秒], ...]} を配列に変換する"""
+    try:
+        import msgpack
+    except ImportError:
+        raise ValidationError("MessagePackには対応していません", "UNSUPPORTED_MEDIA_TYPE")
+
+    try:
+        payload = msgpack.unpackb(data, raw=False)
+    except Exception:
+        raise ValidationError("MessagePackデータを解析できません", "POINTS_INVALID_FORMAT")
+
+    points = payload.get("points") if isinstance(payload, dict) else None
+    if not isinstance(points, list):
+        raise ValidationError("pointsは配列である必要があります", "POINTS_INVALID_TYPE")
+    if not points:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    try:
+        coordinates = np.array([point[:2] for point in points], dtype=np.float64)
+        timestamps = np.array([point[2] for point in points], dtype=np.int64)
+    except (TypeError, ValueError, IndexError, OverflowError):
+        raise ValidationError(
+            "pointsの各要素は[緯度, 経度, UNIX時刻(ミリ秒)]の配列である必要があります", "POINTS_INVALID_FORMAT"
+        )
+    if coordinates.shape != (len(points), 2):
+        raise ValidationError(
+            "pointsの各要素は[緯度, 経度, UNIX時刻(ミリ秒)]の配列である必要があります", "POINTS_INVALID_FORMAT"
+        )
+    return coordinates[:, 0], coordinates[:, 1], timestamps
+
+def decode_binary_points(data, content_type):
+    if content_type == PACKED_CONTENT_TYPE:
+        return decode_packed(data)
+    return decode_msgpack(data)
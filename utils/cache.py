@@ -0,0 +1,113 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """スレッドセーフなLRU/TTLキャッシュ（Noneも値としてキャッシュできる）"""
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key):
+        """(ヒットしたか, 値) を返す"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return True, entry[1]
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def delete_where(self, predicate):
+        """条件に一致するキーをまとめて削除する"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self._stats["invalidations"] += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        stats["max_size"] = self.max_size
+        return stats
+
+class RedisCache:
+    """複数プロセスで共有するRedisキャッシュ（redisパッケージが必要）"""
+
+    def __init__(self, url, ttl_seconds, prefix, encode=None, decode=None):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda value: value)
+
+    def _key(self, key):
+        if isinstance(key, tuple):
+            key = ":".join(str(part) for part in key)
+        return f"{self.prefix}:{key}"
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            logging.warning("共有キャッシュの取得に失敗しました: %s", e)
+            return False, None
+        if raw is None:
+            return False, None
+        return True, self.decode(json.loads(raw))
+
+    def set(self, key, value):
+        try:
+            self.client.set(self._key(key), json.dumps(self.encode(value)), ex=self.ttl_seconds)
+        except Exception as e:
+            logging.warning("共有キャッシュの保存に失敗しました: %s", e)
+
+    def delete(self, key):
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logging.warning("共有キャッシュの削除に失敗しました: %s", e)
+
+def create_shared_cache(url, ttl_seconds, prefix, encode=None, decode=None):
+    """URLが設定されていれば共有キャッシュを作成する（redis未インストール時はNone）"""
+    if not url:
+        return None
+    try:
+        return RedisCache(url, ttl_seconds, prefix, encode, decode)
+    except ImportError:
+        logging.warning("redisパッケージがインストールされていないため、共有キャッシュは無効です")
+        return None
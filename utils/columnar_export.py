@@ -0,0 +1,120 @@
+import io
+import struct
+import zlib
+import numpy as np
+from utils.validators import ValidationError
+
+# 差分符号化形式のヘッダー（マジック, バージョン, 圧縮方式, 座標の小数桁数, 件数）
+DELTA_MAGIC = b"LOCD"
+DELTA_VERSION = 1
+DELTA_HEADER = struct.Struct("<4sBBBI")
+DELTA_COORDINATE_DIGITS = 7
+DELTA_CODECS = {"deflate": 1, "zstd": 2}
+
+EXPORT_FORMATS = {
+    "delta": ("application/x-location-delta", "bin"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+def get_export_format(name):
+    """エクスポート形式名から (Content-Type, 拡張子) を返す"""
+    if name not in EXPORT_FORMATS:
+        raise ValidationError(f"formatは{list(EXPORT_FORMATS)}のいずれかである必要があります", "FORMAT_INVALID")
+    return EXPORT_FORMATS[name]
+
+def encode_delta(timestamps_ms, latitudes, longitudes):
+    """時刻（ミリ秒）と座標（10^-7度単位の整数）を前の値との差分にして圧縮する
+
+    ヘッダーの後に「時刻差分 int64 × 件数、緯度差分 int32 × 件数、経度差分 int32 × 件数」
+    （リトルエンディアン、先頭要素は差分ではなく値そのもの）を圧縮したデータが続く。
+    経度の差分はint32の範囲を超えることがあるため、桁あふれさせたまま格納する。
+    """
+    scale = 10 ** DELTA_COORDINATE_DIGITS
+    columns = [
+        np.diff(np.asarray(timestamps_ms, dtype=np.int64), prepend=np.int64(0)).astype("<i8"),
+        np.diff(np.rint(np.asarray(latitudes) * scale).astype(np.int64), prepend=np.int64(0)).astype("<i4"),
+        np.diff(np.rint(np.asarray(longitudes) * scale).astype(np.int64), prepend=np.int64(0)).astype("<i4")
+    ]
+    payload = b"".join(column.tobytes() for column in columns)
+
+    try:
+        import zstandard
+        codec = "zstd"
+        compressed = zstandard.ZstdCompressor(level=3).compress(payload)
+    except ImportError:
+        codec = "deflate"
+        compressed = zlib.compress(payload, 6)
+
+    header = DELTA_HEADER.pack(
+        DELTA_MAGIC, DELTA_VERSION, DELTA_CODECS[codec], DELTA_COORDINATE_DIGITS, len(columns[0])
+    )
+    return header + compressed
+
+def _arrow_table(timestamps_ms, latitudes, longitudes):
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValidationError("Arrow/Parquet形式には対応していません", "UNSUPPORTED_FORMAT")
+
+    return pyarrow.table({
+        "timestamp": pyarrow.array(
+            np.asarray(timestamps_ms, dtype=np.int64).astype("datetime64[ms]"),
+            type=pyarrow.timestamp("ms", tz="UTC")
+        ),
+        "latitude": pyarrow.array(latitudes, type=pyarrow.float64()),
+        "longitude": pyarrow.array(longitudes, type=pyarrow.float64())
+    })
+
+def encode_arrow(timestamps_ms, latitudes, longitudes):
+    """Apache Arrow IPCストリーム形式（zstd圧縮）に変換する"""
+    table = _arrow_table(timestamps_ms, latitudes, longitudes)
+    import pyarrow.ipc
+
+    sink = io.BytesIO()
+    options = pyarrow.ipc.IpcWriteOptions(compression="zstd")
+    with pyarrow.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def encode_parquet(timestamps_ms, latitudes, longitudes):
+    """Parquet形式（zstd圧縮）に変換する"""
+    table = _arrow_table(timestamps_ms, latitudes, longitudes)
+    import pyarrow.parquet
+
+    sink = io.BytesIO()
+    pyarrow.parquet.write_table(table, sink, compression="zstd")
+    return sink.getvalue()
+
+def encode_export(format_name, timestamps_ms, latitudes, longitudes):
+    if format_name == "arrow":
+        return encode_arrow(timestamps_ms, latitudes, longitudes)
+    if format_name == "parquet":
+        return encode_parquet(timestamps_ms, latitudes, longitudes)
+    return encode_delta(timestamps_ms, latitudes, longitudes)
+
+def decode_delta(data):
+    """encode_deltaの出力を (UNIX時刻ミリ秒, 緯度, 経度) の配列に戻す"""
+    magic, version, codec, digits, count = DELTA_HEADER.unpack_from(data)
+    if magic != DELTA_MAGIC or version != DELTA_VERSION:
+        raise ValueError("差分符号化形式のデータではありません")
+
+    compressed = bytes(data[DELTA_HEADER.size:])
+    if codec == DELTA_CODECS["zstd"]:
+        import zstandard
+        payload = zstandard.ZstdDecompressor().decompress(compressed, max_output_size=count * 16)
+    else:
+        payload = zlib.decompress(compressed)
+
+    timestamp_deltas = np.frombuffer(payload, dtype="<i8", count=count)
+    latitude_deltas = np.frombuffer(payload, dtype="<i4", count=count, offset=count * 8)
+    longitude_deltas = np.frombuffer(payload, dtype="<i4", count=count, offset=count * 12)
+
+    # 桁あふれさせた差分はint32のまま累積すれば元の値に戻る
+    scale = 10 ** digits
+    with np.errstate(over="ignore"):
+        return (
+            np.cumsum(timestamp_deltas, dtype=np.int64),
+            np.cumsum(latitude_deltas, dtype=np.int32) / scale,
+            np.cumsum(longitude_deltas, dtype=np.int32) / scale
+        )
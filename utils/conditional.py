@@ -0,0 +1,65 @@
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags, quote_etag
+from config import Config
+from models.ingest_watermark import IngestWatermark, response_cache
+
+# GET /pointsの応答形式（Acceptヘッダーで選択する）
+POINTS_RESPONSE_TYPES = ['application/json', 'application/x-ndjson']
+
+def points_response_type(accept_header):
+    """Acceptヘッダーから応答形式を選ぶ（Flaskのrequest.accept_mimetypes.best_matchと同じ判定）"""
+    return parse_accept_header(accept_header, MIMEAccept).best_match(
+        POINTS_RESPONSE_TYPES, default='application/json'
+    )
+
+def response_variant(query_items, accept_header):
+    """期間以外のレスポンスに影響するパラメータ（クエリパラメータと応答形式）を文字列にする"""
+    args = sorted((key, value) for key, value in query_items if key not in ('start_time', 'end_time'))
+    return urlencode(args) + '|' + points_response_type(accept_header)
+
+class ConditionalPoints:
+    """GET /pointsの条件付きGETと、期間が終了したレスポンスのキャッシュ（Flask・ASGIで共通）
+
+    ETagは期間内の最終取り込み時刻から作成し、レスポンス本文は読まない。
+    期間が終了したレスポンスは取り込み時刻と一緒にキャッシュし、取り込み時刻が変わっていなければ再利用する。
+    """
+
+    def __init__(self, user_id, start_time, end_time, variant, watermark):
+        self.watermark = watermark
+        self.etag = IngestWatermark.make_etag(user_id, start_time, end_time, variant, watermark)
+        self.cache_key = (str(user_id), start_time, end_time, variant)
+        self.closed = end_time <= datetime.now(timezone.utc)
+
+    def not_modified(self, if_none_match, if_modified_since):
+        """If-None-Match・If-Modified-Sinceヘッダーの値から未変更かを判定する"""
+        if if_none_match:
+            return parse_etags(if_none_match).contains_weak(self.etag)
+        if if_modified_since and self.watermark:
+            since = parse_date(if_modified_since)
+            return since is not None and self.watermark.replace(microsecond=0) <= since
+        return False
+
+    def cached(self):
+        """キャッシュ済みのレスポンス {body, mimetype} を返す（ない場合・期間が終了していない場合はNone）"""
+        if not self.closed:
+            return None
+        hit, cached = response_cache.get(self.cache_key)
+        if hit and cached['watermark'] == self.watermark:
+            return cached
+        return None
+
+    def store(self, body, mimetype):
+        """期間が終了したレスポンスの本文をキャッシュする（上限を超える本文はキャッシュしない）"""
+        if self.closed and len(body) <= Config.POINTS_RESPONSE_CACHE_MAX_BYTES:
+            response_cache.set(self.cache_key, {"watermark": self.watermark, "body": body, "mimetype": mimetype})
+
+    def headers(self):
+        """レスポンスに付けるETag・Last-Modified・Cache-Controlヘッダー"""
+        headers = {"ETag": quote_etag(self.etag)}
+        if self.watermark:
+            headers["Last-Modified"] = http_date(self.watermark)
+        # クライアントには毎回ETagで再検証させる
+        headers["Cache-Control"] = "private, no-cache"
+        return headers
@@ -0,0 +1,50 @@
+import math
+import numpy as np
+from utils.simplify import EARTH_RADIUS_M
+
+# 空間検索用のグリッド（緯度・経度を0.01度ごとのセルに分け、セル番号をgeocell列に保存する）
+GRID_CELL_DEGREES = 0.01
+GRID_COLUMNS = 36000
+
+# geocell列の生成式（_grid_row・_grid_columnと同じ計算をDB側で行う）
+GRID_CELL_SQL = (
+    f"(floor((latitude + 90) / {GRID_CELL_DEGREES})::bigint * {GRID_COLUMNS}"
+    f" + LEAST(floor((longitude + 180) / {GRID_CELL_DEGREES})::bigint, {GRID_COLUMNS - 1}))"
+)
+
+def _grid_row(lat):
+    return np.floor((np.asarray(lat, dtype=np.float64) + 90) / GRID_CELL_DEGREES).astype(np.int64)
+
+def _grid_column(lon):
+    columns = np.floor((np.asarray(lon, dtype=np.float64) + 180) / GRID_CELL_DEGREES).astype(np.int64)
+    return np.minimum(columns, GRID_COLUMNS - 1)
+
+def cells_for_bbox(min_lat, min_lon, max_lat, max_lon, max_cells):
+    """範囲と重なるセル番号の配列を返す（max_cellsを超える場合はNone）"""
+    rows = np.arange(_grid_row(min_lat), _grid_row(max_lat) + 1, dtype=np.int64)
+    columns = np.arange(_grid_column(min_lon), _grid_column(max_lon) + 1, dtype=np.int64)
+    if len(rows) * len(columns) > max_cells:
+        return None
+    return (rows[:, None] * GRID_COLUMNS + columns[None, :]).ravel()
+
+def bbox_for_radius(lat, lon, radius_m):
+    """中心と半径（メートル）を含む範囲 (min_lat, min_lon, max_lat, max_lon) を返す
+
+    経度±180度をまたぐ部分は範囲外として切り捨てる。
+    """
+    delta_lat = math.degrees(radius_m / EARTH_RADIUS_M)
+    min_lat = max(lat - delta_lat, -90.0)
+    max_lat = min(lat + delta_lat, 90.0)
+
+    # 極に近い場合は経度方向の範囲を全体にする
+    max_abs_lat = max(abs(min_lat), abs(max_lat))
+    if max_abs_lat >= 90:
+        return min_lat, -180.0, max_lat, 180.0
+    delta_lon = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(max_abs_lat))))
+    return min_lat, max(lon - delta_lon, -180.0), max_lat, min(lon + delta_lon, 180.0)
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """2点間の大円距離（メートル）をベクトル化して計算する"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
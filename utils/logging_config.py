@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from utils.metrics import registry
+
+# LogRecordの標準属性（これ以外の属性はextraとしてJSONに出力する）
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+dropped_records = registry.counter(
+    "log_records_dropped_total", "ログキューが満杯のため破棄したログの件数"
+)
+
+_listener = None
+_listener_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """ログを1行1件のJSONに変換する"""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """ログをキューに積むだけのハンドラ（メッセージの組み立ては書き出し側のスレッドで行う）
+
+    キューが満杯の場合は待たずに破棄する。同一プロセス内のキューなので、
+    標準のQueueHandlerと違ってmsg・argsを文字列に変換せずにそのまま渡す。
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc()
+
+class RequestSamplingFilter(logging.Filter):
+    """エンドポイントごとにINFO以下のログを間引き、リクエストの情報をログに付与する
+
+    間引くかどうかはリクエストごとに1回だけ決めるため、残ったリクエストのログは
+    すべて出力される。WARNING以上のログは常に出力する。
+    """
+
+    def __init__(self, sample_rates):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record):
+        from flask import g, has_request_context, request
+
+        if not has_request_context():
+            return True
+
+        endpoint = request.url_rule.rule if request.url_rule else None
+        record.method = request.method
+        record.endpoint = endpoint
+        if record.levelno > logging.INFO:
+            return True
+
+        rate = self.sample_rates.get(endpoint)
+        if rate is None or rate >= 1:
+            return True
+        if "_log_sampled" not in g:
+            g._log_sampled = random.random() < rate
+        return g._log_sampled
+
+def parse_sample_rates(value):
+    """ "/points=0.1,/api/register-token=0.5" 形式の設定を {エンドポイント: 割合} に変換する"""
+    rates = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        endpoint, _, rate = item.rpartition("=")
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+def setup_logging(config):
+    """キュー経由でログを書き出すように設定する（リクエスト処理のスレッドではファイル書き込みを行わない）
+
+    ファイルはLOG_MAX_BYTESごとにローテーションする。
+    """
+    global _listener
+
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        if config.LOG_FORMAT == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+
+        file_handler = logging.handlers.RotatingFileHandler(
+            config.LOG_FILE,
+            maxBytes=config.LOG_MAX_BYTES,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        stream_handler = logging.StreamHandler()
+        for handler in (file_handler, stream_handler):
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=config.LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        queue_handler.addFilter(RequestSamplingFilter(parse_sample_rates(config.LOG_SAMPLE_RATES)))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(config.LOG_LEVEL)
+
+        _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+        _listener.start()
+        # 終了時にキューに残っているログを書き出す
+        atexit.register(_listener.stop)
+        return _listener
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# レイテンシ用のヒストグラムの区切り（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 1リクエストあたりのクエリ数用の区切り
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# スローリクエストログに残すクエリの最大件数と、クエリ文の最大文字数
+SLOW_LOG_MAX_QUERIES = 50
+SLOW_LOG_STATEMENT_LENGTH = 200
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [
+        f'{name}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [区切りごとの件数（+Inf含む）, 合計, 件数]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class MetricsRegistry:
+    """メトリクスを保持し、Prometheusのテキスト形式で出力する"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "endpoint", "status")
+)
+request_db_queries = registry.histogram(
+    "http_request_db_queries", "1リクエストあたりのクエリ数", ("endpoint",), COUNT_BUCKETS
+)
+request_db_duration = registry.histogram(
+    "http_request_db_duration_seconds", "1リクエストあたりのクエリ実行時間の合計", ("endpoint",)
+)
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "クエリ1回あたりの実行時間"
+)
+points_ingested = registry.counter(
+    "location_points_ingested_total", "保存した位置情報の件数"
+)
+validation_duration = registry.histogram(
+    "location_validation_duration_seconds", "位置情報アップロードのデコードとバリデーションの時間", ("format",)
+)
+jwt_verify_duration = registry.histogram(
+    "jwt_verify_duration_seconds", "JWT検証の時間", ("cached",)
+)
+
+# リクエスト処理中のスレッドで実行されたクエリの記録
+_local = threading.local()
+
+def start_request(collect_statements=False):
+    _local.request = {
+        "started": time.perf_counter(),
+        "query_count": 0,
+        "query_time": 0.0,
+        "statements": [] if collect_statements else None
+    }
+
+def finish_request():
+    """現在のリクエストの記録を取り出す（開始していなければNone）"""
+    state = getattr(_local, "request", None)
+    _local.request = None
+    if state is not None:
+        state["duration"] = time.perf_counter() - state["started"]
+    return state
+
+def record_query(statement, seconds):
+    """クエリ1回分の実行時間を記録する（リクエスト外のスレッドでは全体の集計のみ）"""
+    db_query_duration.observe(seconds)
+    state = getattr(_local, "request", None)
+    if state is None:
+        return
+    state["query_count"] += 1
+    state["query_time"] += seconds
+    statements = state["statements"]
+    if statements is not None and len(statements) < SLOW_LOG_MAX_QUERIES:
+        if isinstance(statement, bytes):
+            statement = statement.decode("utf-8", errors="replace")
+        statements.append((" ".join(str(statement).split())[:SLOW_LOG_STATEMENT_LENGTH], seconds))
+
+def install_request_metrics(app, slow_request_threshold_ms=0):
+    """リクエストごとの処理時間・クエリ数を記録するミドルウェアを登録する
+
+    ストリーミングレスポンスはヘッダー送信までの時間を記録する。
+    slow_request_threshold_msを超えたリクエストは実行したクエリとその時間をログに出す。
+    """
+    from flask import request
+
+    def endpoint_label():
+        return request.url_rule.rule if request.url_rule else "unmatched"
+
+    @app.before_request
+    def _start_request_metrics():
+        start_request(collect_statements=slow_request_threshold_ms > 0)
+
+    @app.after_request
+    def _record_request_metrics(response):
+        state = finish_request()
+        if state is None:
+            return response
+
+        endpoint = endpoint_label()
+        request_duration.observe(
+            state["duration"], method=request.method, endpoint=endpoint, status=str(response.status_code)
+        )
+        request_db_queries.observe(state["query_count"], endpoint=endpoint)
+        request_db_duration.observe(state["query_time"], endpoint=endpoint)
+
+        duration_ms = state["duration"] * 1000
+        if slow_request_threshold_ms > 0 and duration_ms >= slow_request_threshold_ms:
+            queries = "; ".join(
+                f"{seconds * 1000:.1f}ms {statement}" for statement, seconds in state["statements"]
+            )
+            logging.warning(
+                "スローリクエスト: %s %s status=%s, 処理時間=%.1fms, クエリ数=%s, クエリ時間=%.1fms, クエリ=[%s]",
+                request.method, endpoint, response.status_code, duration_ms,
+                state["query_count"], state["query_time"] * 1000, queries
+            )
+        return response
+
+    @app.teardown_request
+    def _discard_request_metrics(error):
+        # 例外でafter_requestが呼ばれなかった場合の後始末
+        finish_request()
@@ -0,0 +1,22 @@
+import base64
+import json
+from dateutil import parser
+from utils.validators import ValidationError
+
+def encode_cursor(timestamp, row_id):
+    """(timestamp, id) のキーを不透明なカーソル文字列に変換"""
+    payload = json.dumps({"t": timestamp.isoformat(), "i": row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """カーソル文字列を (timestamp, id) のキーに復元"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        timestamp = parser.isoparse(payload['t'])
+        row_id = payload['i']
+        if not isinstance(row_id, int):
+            raise ValueError("invalid id")
+        return timestamp, row_id
+    except (ValueError, TypeError, KeyError, UnicodeError):
+        raise ValidationError("cursorが不正です", "CURSOR_INVALID")
@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+import numpy as np
+from utils.geo import haversine_m
+
+# 滞在判定でアンカーからの距離を一度に計算する点数の初期値（移動中は1点目で範囲外になるため小さくする）
+CLUSTER_SCAN_INITIAL = 8
+CLUSTER_SCAN_MAX = 1024
+
+def empty_state():
+    """日ごとの集計の途中状態（前回の最後の点・滞在候補・確定した滞在）"""
+    return {
+        "point_count": 0,
+        "distance_m": 0.0,
+        "moving_seconds": 0.0,
+        "first_timestamp": None,
+        "last": None,
+        "cluster": None,
+        "closed_stays": []
+    }
+
+def _to_iso(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+def _stay(cluster):
+    return {
+        "start": _to_iso(cluster["start"]),
+        "end": _to_iso(cluster["end"]),
+        "latitude": cluster["lat_sum"] / cluster["count"],
+        "longitude": cluster["lon_sum"] / cluster["count"],
+        "duration_seconds": cluster["end"] - cluster["start"],
+        "point_count": cluster["count"]
+    }
+
+def _update_clusters(state, lat, lon, ts, radius_m, min_seconds):
+    """アンカー（滞在候補の最初の点）からradius_m以内に続く点を1つの滞在候補にまとめる
+
+    アンカーからの距離はまとめて計算し、範囲外になった最初の点で候補を閉じる。
+    """
+    cluster = state["cluster"]
+    n = len(ts)
+    i = 0
+    while i < n:
+        if cluster is None:
+            cluster = {
+                "anchor": [float(lat[i]), float(lon[i])],
+                "start": float(ts[i]), "end": float(ts[i]),
+                "lat_sum": float(lat[i]), "lon_sum": float(lon[i]), "count": 1
+            }
+            i += 1
+            continue
+
+        end = i
+        scan = CLUSTER_SCAN_INITIAL
+        while end < n:
+            stop = min(end + scan, n)
+            distances = haversine_m(cluster["anchor"][0], cluster["anchor"][1], lat[end:stop], lon[end:stop])
+            outside = np.flatnonzero(distances > radius_m)
+            if len(outside):
+                end += int(outside[0])
+                break
+            end = stop
+            scan = min(scan * 2, CLUSTER_SCAN_MAX)
+
+        if end > i:
+            cluster["end"] = float(ts[end - 1])
+            cluster["lat_sum"] += float(lat[i:end].sum())
+            cluster["lon_sum"] += float(lon[i:end].sum())
+            cluster["count"] += end - i
+        if end == n:
+            break
+
+        if cluster["end"] - cluster["start"] >= min_seconds:
+            state["closed_stays"].append(_stay(cluster))
+        cluster = None
+        i = end
+    state["cluster"] = cluster
+
+def apply_points(state, lat, lon, ts, params):
+    """時刻順に並んだ新しい点（すべて前回の最後の点より後）を集計に加える
+
+    ts はUNIX時刻(秒)。距離・移動時間は前回の最後の点からの区間をまとめて計算する。
+    params は stay_radius_m・stay_min_seconds・moving_speed_mps・max_speed_mps・max_gap_seconds。
+    """
+    if len(ts) == 0:
+        return state
+
+    seg_lat, seg_lon, seg_ts = lat, lon, ts
+    if state["last"] is not None:
+        seg_lat = np.concatenate(([state["last"][0]], lat))
+        seg_lon = np.concatenate(([state["last"][1]], lon))
+        seg_ts = np.concatenate(([state["last"][2]], ts))
+
+    distances = haversine_m(seg_lat[:-1], seg_lon[:-1], seg_lat[1:], seg_lon[1:])
+    durations = np.diff(seg_ts)
+    # 速度が上限を超える区間はGPSの飛びとみなして除外する
+    valid = (durations > 0) & (distances <= durations * params["max_speed_mps"])
+    moving = valid & (durations <= params["max_gap_seconds"]) & (distances >= durations * params["moving_speed_mps"])
+
+    state["distance_m"] += float(distances[valid].sum())
+    state["moving_seconds"] += float(durations[moving].sum())
+    state["point_count"] += len(ts)
+    if state["first_timestamp"] is None:
+        state["first_timestamp"] = float(ts[0])
+    state["last"] = [float(lat[-1]), float(lon[-1]), float(ts[-1])]
+
+    _update_clusters(state, lat, lon, ts, params["stay_radius_m"], params["stay_min_seconds"])
+    return state
+
+def summarize(state, min_seconds):
+    """集計の途中状態から保存する値を作成する（継続中の滞在候補も条件を満たせば滞在に含める）"""
+    stays = list(state["closed_stays"])
+    cluster = state["cluster"]
+    if cluster is not None and cluster["end"] - cluster["start"] >= min_seconds:
+        stays.append(_stay(cluster))
+    return {
+        "point_count": state["point_count"],
+        "distance_m": state["distance_m"],
+        "moving_seconds": state["moving_seconds"],
+        "stay_count": len(stays),
+        "stay_seconds": sum(stay["duration_seconds"] for stay in stays),
+        "stays": stays,
+        "first_timestamp": datetime.fromtimestamp(state["first_timestamp"], timezone.utc),
+        "last_timestamp": datetime.fromtimestamp(state["last"][2], timezone.utc)
+    }
@@ -0,0 +1,133 @@
+import heapq
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+def rows_to_arrays(rows):
+    """DBの行を緯度・経度・UNIX時刻(秒)の配列に変換"""
+    count = len(rows)
+    lat = np.fromiter((row['latitude'] for row in rows), dtype=np.float64, count=count)
+    lon = np.fromiter((row['longitude'] for row in rows), dtype=np.float64, count=count)
+    ts = np.fromiter((row['timestamp'].timestamp() for row in rows), dtype=np.float64, count=count)
+    return lat, lon, ts
+
+def project(lat, lon):
+    """緯度・経度を平均緯度基準の正距円筒図法でメートル座標に変換"""
+    lat_rad = np.radians(lat)
+    lon_rad = np.radians(lon)
+    x = lon_rad * np.cos(lat_rad.mean()) * EARTH_RADIUS_M
+    y = lat_rad * EARTH_RADIUS_M
+    return x, y
+
+def douglas_peucker(x, y, tolerance):
+    """Douglas-Peucker法で残すポイントのマスクを返す（tolerance: メートル）"""
+    n = len(x)
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        px = x[start + 1:end] - x[start]
+        py = y[start + 1:end] - y[start]
+        seg_len = np.hypot(dx, dy)
+        if seg_len == 0:
+            dist = np.hypot(px, py)
+        else:
+            dist = np.abs(dx * py - dy * px) / seg_len
+
+        index = int(np.argmax(dist))
+        if dist[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+def _triangle_areas(x, y, prev_idx, idx, next_idx):
+    return 0.5 * np.abs(
+        (x[prev_idx] - x[idx]) * (y[next_idx] - y[idx])
+        - (x[next_idx] - x[idx]) * (y[prev_idx] - y[idx])
+    )
+
+def visvalingam(x, y, target):
+    """Visvalingam-Whyatt法でtarget件になるまで面積の小さい頂点を除去し、マスクを返す"""
+    n = len(x)
+    keep = np.ones(n, dtype=bool)
+    if n <= max(target, 2):
+        return keep
+
+    prev_idx = np.arange(-1, n - 1)
+    next_idx = np.arange(1, n + 1)
+    areas = np.full(n, np.inf)
+    inner = np.arange(1, n - 1)
+    areas[1:-1] = _triangle_areas(x, y, inner - 1, inner, inner + 1)
+
+    heap = [(areas[i], i) for i in inner]
+    heapq.heapify(heap)
+    remaining = n
+    max_area = 0.0
+    while remaining > target and heap:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            continue  # 古いエントリ
+
+        keep[i] = False
+        remaining -= 1
+        # 除去済みの頂点より小さい面積にならないようにする（形状の単調性を保つ）
+        max_area = max(max_area, area)
+        p, q = prev_idx[i], next_idx[i]
+        next_idx[p] = q
+        prev_idx[q] = p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = max(
+                    float(_triangle_areas(x, y, prev_idx[j], j, next_idx[j])), max_area
+                )
+                heapq.heappush(heap, (areas[j], j))
+    return keep
+
+def time_bucket(ts, bucket_seconds):
+    """時間バケットごとに最初のポイントを残すマスクを返す（最後のポイントも保持）"""
+    n = len(ts)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    buckets = np.floor(ts / bucket_seconds)
+    _, first = np.unique(buckets, return_index=True)
+    keep[first] = True
+    keep[-1] = True
+    return keep
+
+def simplify_track(rows, mode, tolerance=None, max_points=None, bucket_seconds=None):
+    """時刻順の行を簡略化し、残す行のリストを返す
+
+    どのモードでも、結果がmax_pointsを超える場合はVisvalingam法でmax_points件に絞り込む。
+    """
+    if len(rows) <= 2:
+        return list(rows)
+
+    lat, lon, ts = rows_to_arrays(rows)
+    x, y = project(lat, lon)
+
+    if mode == "dp":
+        keep = douglas_peucker(x, y, tolerance)
+    elif mode == "bucket":
+        keep = time_bucket(ts, bucket_seconds)
+    else:
+        keep = np.ones(len(rows), dtype=bool)
+
+    indices = np.flatnonzero(keep)
+    if max_points and len(indices) > max_points:
+        sub_keep = visvalingam(x[indices], y[indices], max_points)
+        indices = indices[sub_keep]
+
+    return [rows[i] for i in indices]
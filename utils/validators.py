@@ -1,8 +1,17 @@
 import re
 import json
-from datetime import datetime
+import uuid
+import numpy as np
+from datetime import datetime, timedelta, timezone
 from dateutil import parser
 from typing import List, Dict, Any
+from utils.geo import bbox_for_radius
+
+# よく使われる固定形式のISO 8601（例: 2025-08-31T12:00:00.123Z / +09:00）
+# isoparseが受け付けない文字列を通さないよう、数字は\dではなくASCIIの[0-9]に限定し、fullmatchで照合する
+ISO8601_FAST_PATTERN = re.compile(
+    r'([0-9]{4})-([0-9]{2})-([0-9]{2})T([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.([0-9]{1,6}))?(Z|[+-][0-9]{2}:[0-9]{2})?'
+)
 
 class ValidationError(Exception):
     def __init__(self, message, error_code="VALIDATION_ERROR"):
@@ -92,6 +101,26 @@ def validate_register_token_request(data):
     
     return True
 
+def validate_register_tokens_request(data, max_items=500):
+    """トークン一括登録リクエストのバリデーション（各トークンの検証は呼び出し側で行う）"""
+    if not isinstance(data, dict):
+        raise ValidationError("リクエストデータはJSONオブジェクトである必要があります", "REQUEST_INVALID_TYPE")
+    
+    tokens = data.get('tokens')
+    if tokens is None:
+        raise ValidationError("tokensフィールドは必須です", "TOKENS_REQUIRED")
+    
+    if not isinstance(tokens, list):
+        raise ValidationError("tokensは配列である必要があります", "TOKENS_INVALID_TYPE")
+    
+    if len(tokens) == 0:
+        raise ValidationError("少なくとも1つのトークンが必要です", "TOKENS_EMPTY")
+    
+    if len(tokens) > max_items:
+        raise ValidationError(f"一度に登録できるトークンは最大{max_items}件です", "TOKENS_TOO_MANY")
+    
+    return True
+
 # 位置情報バリデーション関数
 
 def validate_latitude(latitude):
@@ -120,8 +149,14 @@ def validate_longitude(longitude):
     
     return True
 
+def assume_utc(value):
+    """タイムゾーンの指定がない日時はUTCとして扱う（サーバーのローカル時刻やDBのセッションのタイムゾーンに依存させない）"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
 def validate_timestamp(timestamp_str):
-    """タイムスタンプのバリデーション（ISO 8601形式）"""
+    """タイムスタンプのバリデーション（ISO 8601形式、タイムゾーンの指定がない場合はUTC）"""
     if not timestamp_str:
         raise ValidationError("タイムスタンプは必須です", "TIMESTAMP_REQUIRED")
     
@@ -130,11 +165,37 @@ def validate_timestamp(timestamp_str):
     
     try:
         # ISO 8601形式の日時文字列をパース
-        parsed_dt = parser.isoparse(timestamp_str)
-        return parsed_dt
+        parsed_dt = parse_iso8601(timestamp_str)
+        return assume_utc(parsed_dt)
     except ValueError as e:
         raise ValidationError("タイムスタンプはISO 8601形式である必要があります", "TIMESTAMP_INVALID_FORMAT")
 
+def parse_iso8601(timestamp_str):
+    """ISO 8601形式の日時文字列をパース（固定形式は高速パス、それ以外はisoparse）"""
+    match = ISO8601_FAST_PATTERN.fullmatch(timestamp_str)
+    if match:
+        year, month, day, hour, minute, second, fraction, tz = match.groups()
+        tzinfo = None
+        if tz == 'Z':
+            tzinfo = timezone.utc
+        elif tz:
+            offset_hours, offset_minutes = int(tz[1:3]), int(tz[4:6])
+            if offset_hours > 23 or offset_minutes > 59:
+                # isoparseと同じく範囲外のオフセットはエラーにする
+                raise ValueError("タイムゾーンのオフセットが範囲外です")
+            sign = -1 if tz[0] == '-' else 1
+            tzinfo = timezone(sign * timedelta(hours=offset_hours, minutes=offset_minutes))
+        try:
+            return datetime(
+                int(year), int(month), int(day), int(hour), int(minute), int(second),
+                int(fraction.ljust(6, '0')) if fraction else 0,
+                tzinfo=tzinfo
+            )
+        except ValueError:
+            # 24:00:00 などの特殊な表記はisoparseに任せる
+            pass
+    return parser.isoparse(timestamp_str)
+
 def validate_point(point_data):
     """単一の位置情報ポイントのバリデーション"""
     if not isinstance(point_data, dict):
@@ -181,16 +242,106 @@ def validate_points_upload_request(data):
     if len(points) > 1000:
         raise ValidationError("一度にアップロードできる位置情報は最大1000件です", "POINTS_TOO_MANY")
     
-    # 各ポイントをバリデーション
+    # 全ポイントを列単位でまとめてバリデーション
+    validate_points_batch(points)
+    
+    return True
+
+def _coordinate_column(points, key, limit):
+    """座標列を配列にまとめ、型・範囲が不正な要素のマスクを返す"""
+    # 数値以外の要素は範囲外の値（inf）に置き換え、範囲チェックでまとめて不正とする
+    def column():
+        return (point.get(key) for point in points)
+    try:
+        values = np.fromiter(
+            (value if isinstance(value, (int, float)) else np.inf for value in column()),
+            dtype=np.float64, count=len(points)
+        )
+    except OverflowError:
+        # floatで表せない大きな整数も範囲外
+        values = np.fromiter(
+            (value if isinstance(value, float) or (isinstance(value, int) and abs(value) <= limit) else np.inf
+             for value in column()),
+            dtype=np.float64, count=len(points)
+        )
+    # NaNは比較がFalseになるため、validate_latitude/validate_longitudeと同様に範囲外扱いしない
+    return (values < -limit) | (values > limit)
+
+def validate_points_batch(points):
+    """位置情報ポイントを一括でバリデーションし、parsed_timestampを設定する
+
+    緯度・経度の範囲チェックは配列でまとめて行い、タイムスタンプは高速パーサで処理する。
+    不正なポイントがあった場合は最初のポイントをvalidate_pointで検証し直し、
+    1件ずつ検証した場合と同じエラーメッセージ・エラーコードを返す。
+    """
+    for i, point in enumerate(points):
+        if not isinstance(point, dict):
+            # 辞書でない要素より前の不正なポイントを優先して報告する
+            _raise_first_invalid(points[:i])
+            raise ValidationError(
+                f"points[{i}]: 位置情報データはオブジェクトである必要があります", "POINT_INVALID_TYPE"
+            )
+    
+    invalid = _coordinate_column(points, 'latitude', 90)
+    invalid |= _coordinate_column(points, 'longitude', 180)
+    
+    for i, point in enumerate(points):
+        timestamp_str = point.get('timestamp')
+        if not timestamp_str or not isinstance(timestamp_str, str):
+            invalid[i] = True
+            continue
+        try:
+            point['parsed_timestamp'] = assume_utc(parse_iso8601(timestamp_str))
+        except ValueError:
+            invalid[i] = True
+    
+    if invalid.any():
+        _raise_first_invalid([points[int(np.argmax(invalid))]], offset=int(np.argmax(invalid)))
+    
+    return True
+
+def _raise_first_invalid(points, offset=0):
     for i, point in enumerate(points):
         try:
             validate_point(point)
         except ValidationError as e:
-            raise ValidationError(f"points[{i}]: {e.message}", e.error_code)
+            raise ValidationError(f"points[{offset + i}]: {e.message}", e.error_code)
+
+# datetimeで表現できるUNIX時刻（ミリ秒）の範囲
+MIN_TIMESTAMP_MS = -62135596800000
+MAX_TIMESTAMP_MS = 253402300799999
+
+def validate_point_arrays(latitudes, longitudes, timestamps_ms):
+    """バイナリ形式でアップロードされた位置情報の配列をまとめてバリデーション"""
+    count = len(latitudes)
+    if count == 0:
+        raise ValidationError("少なくとも1つの位置情報が必要です", "POINTS_EMPTY")
+    
+    if count > 1000:
+        raise ValidationError("一度にアップロードできる位置情報は最大1000件です", "POINTS_TOO_MANY")
+    
+    checks = [
+        (~np.isfinite(latitudes) | (latitudes < -90) | (latitudes > 90),
+         "latitude: 緯度は-90から90の範囲である必要があります", "LATITUDE_OUT_OF_RANGE"),
+        (~np.isfinite(longitudes) | (longitudes < -180) | (longitudes > 180),
+         "longitude: 経度は-180から180の範囲である必要があります", "LONGITUDE_OUT_OF_RANGE"),
+        ((timestamps_ms < MIN_TIMESTAMP_MS) | (timestamps_ms > MAX_TIMESTAMP_MS),
+         "timestamp: タイムスタンプが有効な範囲外です", "TIMESTAMP_INVALID_FORMAT")
+    ]
+    for invalid, message, error_code in checks:
+        if invalid.any():
+            raise ValidationError(f"points[{int(np.argmax(invalid))}]: {message}", error_code)
+    
+    return True
+
+def validate_idempotency_key(key):
+    """Idempotency-Keyヘッダーのバリデーション"""
+    if not key or len(key) > 255 or not key.isprintable():
+        raise ValidationError("Idempotency-Keyは1-255文字の表示可能な文字列である必要があります", "IDEMPOTENCY_KEY_INVALID")
     
     return True
 
-def validate_points_get_request(start_time_str, end_time_str):
+def validate_points_get_request(start_time_str, end_time_str, max_days=30):
     """位置情報取得リクエストのバリデーション"""
     errors = []
     
@@ -212,12 +363,143 @@ def validate_points_get_request(start_time_str, end_time_str):
         if start_time >= end_time:
             errors.append("start_timeはend_timeより前である必要があります")
         
-        # 期間チェック（最大30日）
+        # 期間チェック（通常は最大30日）
         time_diff = end_time - start_time
-        if time_diff.days > 30:
-            errors.append("取得期間は最大30日間です")
+        if time_diff.days > max_days:
+            errors.append(f"取得期間は最大{max_days}日間です")
     
     if errors:
         raise ValidationError("; ".join(errors))
     
-    return start_time, end_time
\ No newline at end of file
+    return start_time, end_time
+
+def validate_limit(limit_str, max_limit=1000):
+    """ページサイズ（limit）のバリデーション"""
+    try:
+        limit = int(limit_str)
+    except (TypeError, ValueError):
+        raise ValidationError("limitは整数である必要があります", "LIMIT_INVALID")
+    
+    if limit < 1 or limit > max_limit:
+        raise ValidationError(f"limitは1から{max_limit}の範囲である必要があります", "LIMIT_OUT_OF_RANGE")
+    
+    return limit
+
+def _parse_positive_number(value_str, name, error_code):
+    try:
+        value = float(value_str)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{name}は数値である必要があります", error_code)
+    
+    if not value > 0 or value == float('inf'):
+        raise ValidationError(f"{name}は正の数値である必要があります", error_code)
+    
+    return value
+
+def validate_simplify_request(mode, tolerance_str, max_points_str, bucket_str, default_max_points):
+    """位置情報の簡略化パラメータのバリデーション"""
+    valid_modes = ["dp", "vw", "bucket"]
+    if mode not in valid_modes:
+        raise ValidationError(f"simplifyは{valid_modes}のいずれかである必要があります", "SIMPLIFY_INVALID")
+    
+    tolerance = None
+    if mode == "dp":
+        tolerance = _parse_positive_number(tolerance_str or "10", "tolerance", "TOLERANCE_INVALID")
+    
+    bucket_seconds = None
+    if mode == "bucket":
+        bucket_seconds = _parse_positive_number(bucket_str or "60", "bucket", "BUCKET_INVALID")
+    
+    max_points = default_max_points
+    if max_points_str is not None:
+        max_points = validate_limit(max_points_str, max_limit=default_max_points)
+        if max_points < 2:
+            raise ValidationError("max_pointsは2以上である必要があります", "LIMIT_OUT_OF_RANGE")
+    
+    return {
+        "mode": mode,
+        "tolerance": tolerance,
+        "max_points": max_points,
+        "bucket_seconds": bucket_seconds
+    }
+
+def _parse_coordinate(value_str, name, validator):
+    try:
+        value = float(value_str)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{name}は数値である必要があります", "SPATIAL_PARAMETER_INVALID")
+    validator(value)
+    return value
+
+def validate_spatial_request(bbox_str, lat_str, lon_str, radius_str, max_radius_m):
+    """空間検索の範囲（bboxまたは中心と半径）のバリデーション
+
+    bboxは "最小経度,最小緯度,最大経度,最大緯度" の形式で指定する。
+    戻り値は {"bbox": (最小緯度, 最小経度, 最大緯度, 最大経度), "center": (緯度, 経度) またはNone, "radius_m": 半径またはNone}。
+    """
+    has_circle = lat_str is not None or lon_str is not None or radius_str is not None
+    if bbox_str is not None and has_circle:
+        raise ValidationError("bboxとlat・lon・radiusは同時に指定できません", "PARAMETER_CONFLICT")
+    
+    if bbox_str is not None:
+        values = bbox_str.split(',')
+        if len(values) != 4:
+            raise ValidationError("bboxは 最小経度,最小緯度,最大経度,最大緯度 の形式である必要があります", "BBOX_INVALID")
+        min_lon = _parse_coordinate(values[0], "bbox", validate_longitude)
+        min_lat = _parse_coordinate(values[1], "bbox", validate_latitude)
+        max_lon = _parse_coordinate(values[2], "bbox", validate_longitude)
+        max_lat = _parse_coordinate(values[3], "bbox", validate_latitude)
+        # 経度180度をまたぐ範囲は2回に分けて検索する
+        if min_lon > max_lon or min_lat > max_lat:
+            raise ValidationError("bboxの最小値は最大値以下である必要があります（経度180度をまたぐ範囲は分割してください）", "BBOX_INVALID")
+        return {"bbox": (min_lat, min_lon, max_lat, max_lon), "center": None, "radius_m": None}
+    
+    if lat_str is None or lon_str is None or radius_str is None:
+        raise ValidationError("bboxまたはlat・lon・radiusのいずれかの指定が必要です", "MISSING_PARAMETERS")
+    
+    lat = _parse_coordinate(lat_str, "lat", validate_latitude)
+    lon = _parse_coordinate(lon_str, "lon", validate_longitude)
+    radius_m = _parse_positive_number(radius_str, "radius", "RADIUS_INVALID")
+    if radius_m > max_radius_m:
+        raise ValidationError(f"radiusは最大{max_radius_m:g}メートルです", "RADIUS_INVALID")
+    
+    return {"bbox": bbox_for_radius(lat, lon, radius_m), "center": (lat, lon), "radius_m": radius_m}
+
+def validate_user_ids(user_ids_str, max_users):
+    """カンマ区切りのユーザーID（UUID）のバリデーション（重複は除き、正規化したIDのリストを返す）"""
+    values = [value.strip() for value in user_ids_str.split(',') if value.strip()]
+    if not values:
+        raise ValidationError("user_idsは1件以上指定する必要があります", "USER_IDS_EMPTY")
+    
+    user_ids = []
+    for value in values:
+        try:
+            user_ids.append(str(uuid.UUID(value)))
+        except ValueError:
+            raise ValidationError(f"user_idsにUUID形式でない値が含まれています: {value}", "USER_ID_INVALID")
+    
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(user_ids) > max_users:
+        raise ValidationError(f"user_idsは最大{max_users}件までです", "USER_IDS_TOO_MANY")
+    
+    return user_ids
+
+def validate_summary_request(start_date_str, end_date_str, max_days):
+    """日ごとの集計の取得期間（YYYY-MM-DD、両端の日を含む）のバリデーション"""
+    if not start_date_str or not end_date_str:
+        raise ValidationError("start_dateとend_dateは必須です", "MISSING_PARAMETERS")
+    
+    dates = []
+    for name, value in (("start_date", start_date_str), ("end_date", end_date_str)):
+        try:
+            dates.append(datetime.strptime(value, "%Y-%m-%d").date())
+        except ValueError:
+            raise ValidationError(f"{name}は YYYY-MM-DD の形式である必要があります", "DATE_INVALID")
+    
+    start_date, end_date = dates
+    if start_date > end_date:
+        raise ValidationError("start_dateはend_date以前である必要があります", "DATE_RANGE_INVALID")
+    if (end_date - start_date).days + 1 > max_days:
+        raise ValidationError(f"取得期間は最大{max_days}日間です", "DATE_RANGE_INVALID")
+    
+    return start_date, end_date
\ No newline at end of file